@@ -0,0 +1,235 @@
+###############
+#### Columnar (Parquet) copies of the phylome outputs: lookup, translated and annotated orthology tables
+#### Cells with several IDs are saved as lists instead of joined strings: "ENSG1|ENSG2,ENSG3" as a list of lists (outer split by ",", inner by "|")
+#### and "SYMB1,SYMB2" as a list. Reading them back joins the lists inside Arrow, so tables are loaded without parsing any text,
+#### or keeps them as lists, which utils.ensembl_index() and utils.explode_positions() intern without splitting any string.
+#### Every reader and writer picks the format from the extension of the file: ".parquet" or anything else for TSV.
+###############
+
+import numpy as np
+import pandas as pd
+
+
+FORMATS = ("tsv", "parquet")
+
+OUTER, INNER = ",", "|"
+
+# Columns with several IDs per cell in the translated and annotated orthology tables, and the separators they are split by
+LIST_COLUMNS = {
+    "##Seed_(co-)orthologs": [OUTER],
+    "orthologs": [OUTER, INNER],
+    "GeneName_target": [OUTER],
+    "ENSEMBL_ID": [OUTER, INNER],
+    "ENSEMBL_query-only": [OUTER, INNER],
+    "GeneName_target_query-only": [OUTER],
+}
+
+
+def extension(format):
+    """
+    File extension of format ("tsv" or "parquet"). Stops the pipeline for any other format
+    """
+    if format not in FORMATS:
+        exit("Unknown output format " + str(format) + ", use one of: " + ", ".join(FORMATS))
+    return "." + format
+
+
+def is_parquet(path):
+    return str(path).endswith(".parquet")
+
+
+def split_lists(values, separators=(OUTER, INNER)):
+    """
+    Column of IDs as an Arrow list of strings split by separators[0], or a list of lists if there is a second separator. Missing cells stay null
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    values = pa.array(np.asarray(values, dtype=object), pa.string(), from_pandas=True)
+    outer = pc.split_pattern(values, separators[0])
+    if len(separators) == 1:
+        return outer
+    inner = pc.split_pattern(outer.flatten(), separators[1])
+    return pa.ListArray.from_arrays(outer.offsets, inner, mask=outer.is_null())
+
+
+def join_lists(lists):
+    """
+    Opposite of split_lists(): every list (of lists) joined back into a string with "|" and ","
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if isinstance(lists, pa.ChunkedArray):
+        lists = lists.combine_chunks()
+    if pa.types.is_list(lists.type.value_type):
+        inner = pc.binary_join(lists.flatten(), INNER)
+        lists = pa.ListArray.from_arrays(lists.offsets, inner, mask=lists.is_null())
+    return pc.binary_join(lists, OUTER)
+
+
+def join_columns(table):
+    """
+    Dataframe with its list columns (as read by read_table(lists = True)) joined back into "," and "|" separated strings
+    """
+    import pyarrow as pa
+
+    table = table.copy()
+    for column in table.columns:
+        if isinstance(table[column].dtype, pd.ArrowDtype) and pa.types.is_list(table[column].dtype.pyarrow_dtype):
+            table[column] = pd.Series(join_lists(pa.array(table[column].array)).to_pandas().array, index=table.index)
+    return table
+
+
+def to_arrow(table, list_columns=None):
+    """
+    Arrow table of a dataframe, with list_columns (default, the ones of LIST_COLUMNS in table) as lists.
+    Text columns are always strings and categorical columns dictionaries with int32 codes, so chunks of the same table share one schema
+
+    Attributes
+    ----------
+    table: pandas dataframe
+        Lookup, translated or annotated orthology table
+    list_columns: list
+        Columns with IDs separated by "," (and "|" if they are in LIST_COLUMNS with both)
+    """
+    import pyarrow as pa
+
+    if list_columns is None:
+        list_columns = [column for column in LIST_COLUMNS if column in table.columns]
+
+    arrays = []
+    for column in table.columns:
+        values = table[column]
+        if column in list_columns:
+            arrays.append(split_lists(values, LIST_COLUMNS.get(column, [OUTER])))
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            arrays.append(pa.array(values.astype(object).to_numpy(), pa.string(), from_pandas=True).dictionary_encode().cast(pa.dictionary(pa.int32(), pa.string())))
+        elif pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype):
+            arrays.append(pa.array(values.to_numpy(), from_pandas=True))
+        else:
+            arrays.append(pa.array(values.to_numpy(dtype=object), pa.string(), from_pandas=True))
+
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in table.columns])
+
+
+def write_table(table, path, list_columns=None):
+    """
+    Saves a dataframe without its index, as Parquet if path ends with ".parquet" (see to_arrow()) or else as TSV
+
+    Attributes
+    ----------
+    table: pandas dataframe
+        Lookup, translated or annotated orthology table
+    path: string
+        File to write
+    list_columns: list
+        Columns saved as lists in Parquet. Default, the ones of LIST_COLUMNS in table
+    """
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        pq.write_table(to_arrow(table, list_columns), path)
+    else:
+        table.to_csv(path, index=False, sep="\t")
+
+
+def write_chunks(chunks, path, list_columns=None):
+    """
+    Same as write_table() for a table that comes in chunks (dataframes with the same columns), each written as soon as it arrives.
+    Parquet files get one row group per chunk, TSV files one header and the rows of every chunk appended
+
+    Attributes
+    ----------
+    chunks: iterable
+        Dataframes to write one after the other
+    path: string
+        File to write. Overwritten if it exists
+    list_columns: list
+        Columns saved as lists in Parquet. Default, the ones of LIST_COLUMNS in the chunks
+    """
+    if not is_parquet(path):
+        header = True
+        for chunk in chunks:
+            chunk.to_csv(path, index=False, sep="\t", mode="w" if header else "a", header=header)
+            header = False
+        return
+
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            chunk = to_arrow(chunk, list_columns)
+            if writer is None:
+                writer = pq.ParquetWriter(path, chunk.schema)
+            writer.write_table(chunk.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def read_table(path, columns=None, lists=False):
+    """
+    Reads a table saved by write_table() or write_chunks(). List columns of Parquet files are joined back into
+    "," and "|" separated strings, as in the TSV files, unless lists is True
+
+    Attributes
+    ----------
+    path: string
+        Parquet (".parquet") or TSV file
+    columns: list
+        Columns to read. Default, all of them
+    lists: Boolean
+        Keep the list columns as Arrow lists instead of strings (see join_columns())
+    """
+    if not is_parquet(path):
+        return pd.read_csv(path, sep="\t", usecols=columns)
+
+    import pyarrow.parquet as pq
+
+    return _to_pandas(pq.read_table(path, columns=columns), lists)
+
+
+def iter_table(path, chunksize, columns=None, lists=False):
+    """
+    Same as read_table() but yields the table in chunks of chunksize rows, so it is never whole in memory.
+    Each chunk keeps the index its rows have in the whole table
+
+    Attributes
+    ----------
+    path: string
+        Parquet (".parquet") or TSV file
+    chunksize: int
+        Number of rows read at a time
+    columns: list
+        Columns to read. Default, all of them
+    lists: Boolean
+        Keep the list columns as Arrow lists instead of strings (see join_columns())
+    """
+    if not is_parquet(path):
+        with pd.read_csv(path, sep="\t", usecols=columns, chunksize=chunksize) as reader:
+            yield from reader
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    start = 0
+    with pq.ParquetFile(path) as file:
+        for batch in file.iter_batches(batch_size=chunksize, columns=columns):
+            chunk = _to_pandas(pa.Table.from_batches([batch]), lists)
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+
+
+def _to_pandas(table, lists):
+    import pyarrow as pa
+
+    if not lists:
+        for i, field in enumerate(table.schema):
+            if pa.types.is_list(field.type):
+                table = table.set_column(i, field.name, join_lists(table.column(i)))
+    return table.to_pandas(types_mapper={field.type: pd.ArrowDtype(field.type) for field in table.schema if pa.types.is_list(field.type)}.get)
+
@@ -0,0 +1,242 @@
+###############
+#### Prebuilt on-disk index of eggNOG members files (taxID - protein - orthogroup - taxonomic level)
+#### Members files are parsed once into a Parquet dataset partitioned by taxID, so following runs
+#### only read the proteins of the species they need. A manifest with the checksums of the
+#### source files is saved next to it to detect when the index is out of date.
+###############
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+from eggfan import utils
+from eggfan import orthogroup
+
+
+INDEX_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+MEMBERS_DIR = "members"
+
+
+def file_checksum(path, blocksize=1 << 20):
+    """
+    sha256 of a file, read in blocks of blocksize bytes
+    """
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(blocksize), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def source_entry(path):
+    """
+    Description of a members file as saved in the manifest: absolute path, size, modification time and checksum
+    """
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": file_checksum(path),
+    }
+
+
+def member_batches(path, chunksize=100000):
+    """
+    Reads a members file (compressed or not) in chunks of orthogroups and yields them as arrow tables
+    with one protein per row and columns "taxID", "Protein stable ID", "Orthogroup" and "level" (the "X" column of the file)
+
+    Attributes
+    ----------
+    path: string
+        Path to eggnog members file
+    chunksize: int
+        Number of orthogroups parsed at a time
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    chunks = pd.read_csv(
+        path,
+        sep="\t",
+        names=orthogroup.EGGNOG_COLUMNS,
+        usecols=["X", "Orthogroup", "Protein stable ID"],
+        dtype={"Orthogroup": str, "Protein stable ID": str},
+        chunksize=chunksize,
+    )
+    for chunk in chunks:
+        # Split and flatten in arrow, each protein keeps the row (orthogroup) it came from
+        proteins = pc.split_pattern(pa.array(chunk["Protein stable ID"].to_numpy(dtype=object), pa.string()), ",")
+        row = pc.list_parent_indices(proteins)
+        proteins = pc.list_flatten(proteins)
+
+        yield pa.table({
+            "taxID": pc.list_element(pc.split_pattern(proteins, ".", max_splits=1), 0),
+            "Protein stable ID": proteins,
+            "Orthogroup": pc.take(pa.array(chunk["Orthogroup"].to_numpy(dtype=object), pa.string()), row),
+            "level": pc.take(pa.array(chunk["X"].to_numpy(dtype=np.int64)), row),
+        })
+
+
+def build_index(paths, index_dir, chunksize=100000):
+    """
+    Compiles one or several eggnog members files into an index inside index_dir. A previous index in index_dir is replaced.
+
+    Attributes
+    ----------
+    paths: list
+        Paths to eggnog members files as downloaded from eggnog (members.tsv.gz, compressed or not)
+    index_dir: string
+        Directory where the index is saved
+    chunksize: int
+        Number of orthogroups parsed at a time
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    members_dir = os.path.join(index_dir, MEMBERS_DIR)
+    if os.path.exists(members_dir):
+        shutil.rmtree(members_dir)
+    os.makedirs(index_dir, exist_ok=True)
+
+    schema = pa.schema([("taxID", pa.string()), ("Protein stable ID", pa.string()), ("Orthogroup", pa.string()), ("level", pa.int64())])
+    levels = {path: [] for path in paths}  # taxonomic levels of each file, in the order they appear
+
+    def batches():
+        for path in paths:
+            for table in member_batches(path, chunksize):
+                levels[path] += [level for level in pc.unique(table["level"]).to_pylist() if level not in levels[path]]
+                yield from table.to_batches()
+
+    ds.write_dataset(
+        batches(),
+        members_dir,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("taxID", pa.string())]), flavor="hive"),
+        max_partitions=1000000,  # one per species in the members files
+        min_rows_per_group=65536,
+    )
+
+    manifest = {"version": INDEX_VERSION, "sources": [dict(source_entry(path), levels=levels[path]) for path in paths]}
+    with open(os.path.join(index_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    return manifest
+
+
+def read_manifest(index_dir):
+    """
+    Manifest of the index in index_dir, None if there is no index
+    """
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def stale_sources(index_dir, paths=None):
+    """
+    Reasons why the index in index_dir is out of date, empty list if it can be used.
+    Source files whose size or modification time changed are checked again by checksum. Source files that are no longer there can't be checked, so they make the index stale too.
+
+    Attributes
+    ----------
+    index_dir: string
+        Directory with the index made by build_index()
+    paths: list
+        Members files the index should have been built from. If None, only the files in the manifest are checked
+    """
+    manifest = read_manifest(index_dir)
+    if manifest is None:
+        return ["no index found in " + index_dir]
+    if manifest.get("version") != INDEX_VERSION:
+        return ["index version %s, expected %s" % (manifest.get("version"), INDEX_VERSION)]
+
+    reasons = []
+    sources = {source["path"]: source for source in manifest["sources"]}
+    if paths is not None:
+        missing = [path for path in paths if os.path.abspath(path) not in sources]
+        reasons += [path + " is not in the index" for path in missing]
+
+    for path, source in sources.items():
+        if not os.path.exists(path):
+            reasons.append(path + " no longer exists, the index can't be checked against it")
+            continue
+        stat = os.stat(path)
+        if stat.st_size == source["size"] and stat.st_mtime == source["mtime"]:
+            continue
+        if file_checksum(path) != source["sha256"]:
+            reasons.append(path + " changed since the index was built")
+
+    return reasons
+
+
+def read_index(index_dir, taxID="9606"):
+    """
+    Loads from the index only the proteins of taxID and returns them in the same format as orthogroup.read_eggnog():
+    one dataframe per taxonomic level with columns "X", "Orthogroup" (categorical), "Protein stable ID" and "SpeciesID", a list if there is more than one level.
+    Levels come in the order of the files the index was built from, as read_eggnog() with those files. A level without proteins of taxID gives an empty dataframe.
+
+    Attributes
+    ----------
+    index_dir: string
+        Directory with the index made by build_index()
+    taxID: string or list
+        NCBI tax ID(s) of the species to load
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    taxIDs = [str(taxID)] if isinstance(taxID, str) else [str(ID) for ID in taxID]
+
+    partitioning = ds.partitioning(pa.schema([("taxID", pa.string())]), flavor="hive")
+    members = ds.dataset(os.path.join(index_dir, MEMBERS_DIR), format="parquet", partitioning=partitioning)
+    members = members.to_table(filter=ds.field("taxID").isin(taxIDs), columns=["Protein stable ID", "Orthogroup", "level", "taxID"]).to_pandas()
+    members = members.sort_values(["level", "Orthogroup", "taxID"], kind="stable")
+
+    # Back to one row per orthogroup, proteins and their species separated by ","
+    first = ~members.duplicated(subset=["level", "Orthogroup"]).to_numpy()
+    orthogroups = members[first]
+    number_of_proteins = np.diff(np.append(np.flatnonzero(first), len(members)))
+
+    species = members.drop_duplicates(subset=["level", "Orthogroup", "taxID"])
+    number_of_species = np.diff(np.append(np.flatnonzero(~species.duplicated(subset=["level", "Orthogroup"]).to_numpy()), len(species)))
+
+    eggnog = pd.DataFrame({
+        "X": orthogroups["level"].to_numpy(),
+        "Orthogroup": pd.Categorical(orthogroups["Orthogroup"].to_numpy()),
+        "Protein stable ID": utils.join_exploded(members["Protein stable ID"], number_of_proteins, ","),
+        "SpeciesID": utils.join_exploded(species["taxID"], number_of_species, ","),
+    })
+
+    levels = {X: level.reset_index(drop=True) for X, level in eggnog.groupby("X")}
+    eggnogs = [levels.get(X, empty_level()) for X in source_levels(read_manifest(index_dir))]
+    for level in eggnogs:
+        level["Orthogroup"] = level["Orthogroup"].cat.remove_unused_categories()
+
+    if len(eggnogs) > 1:
+        return eggnogs
+    else:
+        return eggnogs[0] if len(eggnogs) > 0 else empty_level()
+
+
+def source_levels(manifest):
+    """
+    Taxonomic levels of the index in the order of the files it was built from, each level once
+    """
+    levels = []
+    for source in manifest["sources"]:
+        levels += [level for level in source["levels"] if level not in levels]
+    return levels
+
+
+def empty_level():
+    eggnog = pd.DataFrame(columns=orthogroup.EGGNOG_USECOLS)
+    eggnog["Orthogroup"] = eggnog["Orthogroup"].astype("category")
+    return eggnog
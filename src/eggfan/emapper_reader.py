@@ -0,0 +1,125 @@
+###############
+#### Reader of emapper annotation files (*.emapper.annotations), shared by the orthogroup and GO:Term methods
+#### The header line is found after the "##" comment lines at the top of the file, only the needed columns are read
+#### and the "##" statistics lines emapper writes at the end are dropped. Compressed files (.gz) are read directly.
+###############
+
+import gzip
+import numpy as np
+import pandas as pd
+
+
+QUERY_COLUMN = "#query"
+
+
+def open_text(path):
+    """
+    Opens a text file for reading, decompressing it if it ends with .gz
+    """
+    if str(path).endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def emapper_header(path):
+    """
+    Number of comment lines ("##") before the header of an emapper annotations file and the column names in the header
+
+    Attributes
+    ----------
+    path: string
+        Path to emapper annotations file (compressed or not)
+    """
+    with open_text(path) as file:
+        for skiprows, line in enumerate(file):
+            if not line.startswith("##"):
+                return skiprows, line.rstrip("\r\n").split("\t")
+    exit(str(path) + " has no header line, is it an emapper annotations file?")
+
+
+def split_column(values):
+    """
+    Comma separated values as an arrow backed column of lists. Missing values ("-" in emapper) become nulls
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    values = pa.array(values.to_numpy(dtype = object), pa.string(), from_pandas = True)
+    values = pc.if_else(pc.equal(values, "-"), pa.scalar(None, pa.string()), values)
+    return pd.array(pc.split_pattern(values, ","), dtype = pd.ArrowDtype(pa.list_(pa.string())))
+
+
+def read_emapper(emapper, columns = None, split = None):
+    """
+    Reads an emapper annotations file keeping only columns (and always "#query"). Statistics lines at the end of the file are removed.
+    The columns in split are returned already split by "," as arrow backed lists (see explode_tokens())
+
+    Attributes
+    ----------
+    emapper: string
+        Path to emapper annotations file (compressed or not), or the emapper output already read by pandas
+    columns: list
+        Columns to read, for example ["GOs"] or ["eggNOG_OGs"]. Default, all of them
+    split: list
+        Columns with comma separated values ("GOs", "eggNOG_OGs"...) to return as lists
+    """
+    split = [] if split is None else list(split)
+
+    if isinstance(emapper, pd.DataFrame):
+        names = list(emapper.columns)
+    else:
+        skiprows, names = emapper_header(emapper)
+
+    if columns is None:
+        usecols = names
+    else:
+        usecols = list(dict.fromkeys([QUERY_COLUMN] + list(columns)))  # each column once, in the order given
+    wrong = [column for column in usecols + split if column not in names]
+    if len(wrong) > 0:
+        exit("Columns not found in emapper output: " + ", ".join(wrong))
+
+    if isinstance(emapper, pd.DataFrame):
+        annotations = emapper[usecols]
+    else:
+        annotations = pd.read_csv(emapper, sep = "\t", skiprows = skiprows, usecols = usecols, dtype = str)[usecols]
+
+    # Statistics lines ("## 123 queries scanned"...) end up as rows with only "#query"
+    query = annotations[QUERY_COLUMN]
+    annotations = annotations[query.notna().to_numpy() & ~query.astype(str).str.startswith("##").to_numpy()].reset_index(drop = True)
+
+    for column in split:
+        annotations[column] = split_column(annotations[column])
+
+    return annotations
+
+
+def explode_tokens(emapper, column):
+    """
+    Long table with one row per value of a comma separated column of emapper: "row" (position of the gene in emapper) and column,
+    categorical, so each distinct value (GO:Term, orthogroup...) is stored once. Missing values ("-") give no rows.
+
+    Attributes
+    ----------
+    emapper: pandas dataframe
+        emapper output, column can be a string column or already split by read_emapper(split = [column])
+    column: string
+        Column to explode, for example "GOs" or "eggNOG_OGs"
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    values = emapper[column]
+    if not (isinstance(values.dtype, pd.ArrowDtype) and pa.types.is_list(values.dtype.pyarrow_dtype)):
+        values = split_column(values)
+    lists = pa.array(values)
+
+    row = pc.list_parent_indices(lists).to_numpy()
+    tokens = pc.list_flatten(lists)
+    if isinstance(tokens, pa.ChunkedArray):
+        tokens = tokens.combine_chunks()
+    tokens = tokens.dictionary_encode()
+
+    return pd.DataFrame({
+        "row": row.astype(np.int64),
+        column: pd.Categorical.from_codes(tokens.indices.to_numpy(), categories = pd.Index(tokens.dictionary.to_numpy(zero_copy_only = False), dtype = object)),
+    })
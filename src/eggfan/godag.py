@@ -0,0 +1,196 @@
+###############
+#### Gene Ontology DAG from a local OBO file (http://geneontology.org/docs/download-ontology/)
+#### The descendants of every GO:Term are precomputed once as a CSR index (indptr, indices) and cached
+#### on disk next to the OBO file, so following runs load the closure instead of parsing the OBO again.
+###############
+
+import os
+import hashlib
+import numpy as np
+
+
+CLOSURE_VERSION = 1
+RELATIONS = ("is_a", "part_of")  # a gene annotated to a term is also annotated to its ancestors through these
+
+
+def parse_obo(path):
+    """
+    Reads the [Term] stanzas of an OBO file. Returns a list with the IDs of non obsolete terms, a dictionary ID -> list of parent IDs
+    (through is_a and part_of) and a dictionary alt_id -> ID
+
+    Attributes
+    ----------
+    path: string
+        Path to OBO file, for example go-basic.obo
+    """
+    terms, parents, alt_ids = [], {}, {}
+
+    def save(stanza):
+        if stanza is None or "id" not in stanza or stanza["obsolete"]:
+            return
+        terms.append(stanza["id"])
+        parents[stanza["id"]] = stanza["parents"]
+        for alt_id in stanza["alt_ids"]:
+            alt_ids[alt_id] = stanza["id"]
+
+    stanza = None
+    with open(path) as file:
+        for line in file:
+            line = line.split("!")[0].strip()
+            if line.startswith("["):
+                save(stanza)
+                stanza = {"parents": [], "alt_ids": [], "obsolete": False} if line == "[Term]" else None
+            elif stanza is None or ":" not in line:
+                continue
+            else:
+                tag, value = line.split(":", 1)
+                value = value.strip()
+                if tag == "id":
+                    stanza["id"] = value
+                elif tag == "alt_id":
+                    stanza["alt_ids"].append(value)
+                elif tag == "is_a":
+                    stanza["parents"].append(value.split()[0])
+                elif tag == "relationship" and value.split()[0] in RELATIONS:
+                    stanza["parents"].append(value.split()[1])
+                elif tag == "is_obsolete" and value == "true":
+                    stanza["obsolete"] = True
+    save(stanza)
+
+    return terms, parents, alt_ids
+
+
+def descendant_closure(terms, parents):
+    """
+    Descendants of every term (itself included) as a CSR index: the descendants of terms[i] are terms[indices[indptr[i]:indptr[i + 1]]]
+
+    Attributes
+    ----------
+    terms: list
+        Term IDs, as given by parse_obo()
+    parents: dictionary
+        Term ID -> list of parent IDs, as given by parse_obo()
+    """
+    position = {term: i for i, term in enumerate(terms)}
+    parent_positions = [[position[parent] for parent in parents[term] if parent in position] for term in terms]
+
+    # Ancestors of each term, every term visited once after all its parents
+    ancestors = [None] * len(terms)
+    for start in range(len(terms)):
+        stack = [start]
+        while stack:
+            term = stack[-1]
+            if ancestors[term] is not None:
+                stack.pop()
+                continue
+            missing = [parent for parent in parent_positions[term] if ancestors[parent] is None]
+            if missing:
+                stack.extend(missing)
+                continue
+            closure = {term}
+            for parent in parent_positions[term]:
+                closure |= ancestors[parent]
+            ancestors[term] = closure
+            stack.pop()
+
+    # Descendants are the transpose of ancestors
+    ancestor = np.concatenate([np.fromiter(closure, dtype=np.int32, count=len(closure)) for closure in ancestors]) if terms else np.zeros(0, dtype=np.int32)
+    descendant = np.repeat(np.arange(len(terms), dtype=np.int32), [len(closure) for closure in ancestors])
+    order = np.lexsort((descendant, ancestor))
+    indices = descendant[order]
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ancestor, minlength=len(terms)), out=indptr[1:])
+
+    return indptr, indices
+
+
+def file_signature(path):
+    """
+    Size, modification time and sha256 of a file
+    """
+    stat = os.stat(path)
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            checksum.update(block)
+    return stat.st_size, stat.st_mtime, checksum.hexdigest()
+
+
+def load_closure(obo, cache_dir=None):
+    """
+    GO DAG closure of an OBO file as a dictionary with "terms" (array of IDs), "indptr" and "indices" (CSR of descendants)
+    and "alt_ids" (dictionary alt_id -> ID). It is read from the cache if the OBO file did not change, otherwise it is computed and saved.
+
+    Attributes
+    ----------
+    obo: string
+        Path to OBO file, for example go-basic.obo
+    cache_dir: string
+        Directory where the closure is cached. Default, the directory of the OBO file
+    """
+    if cache_dir is None:
+        cache_dir = os.path.dirname(os.path.abspath(obo))
+    cache = os.path.join(cache_dir, os.path.basename(obo) + ".closure.npz")
+
+    stat = os.stat(obo)
+    if os.path.exists(cache):
+        with np.load(cache, allow_pickle=False) as cached:
+            same_file = int(cached["size"]) == stat.st_size and float(cached["mtime"]) == stat.st_mtime
+            if int(cached["version"]) == CLOSURE_VERSION and (same_file or str(cached["sha256"]) == file_signature(obo)[2]):
+                return {
+                    "terms": cached["terms"],
+                    "indptr": cached["indptr"],
+                    "indices": cached["indices"],
+                    "alt_ids": dict(zip(cached["alt_ids"].tolist(), cached["alt_primary"].tolist())),
+                }
+
+    terms, parents, alt_ids = parse_obo(obo)
+    indptr, indices = descendant_closure(terms, parents)
+    size, mtime, sha256 = file_signature(obo)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(
+        cache,
+        version=CLOSURE_VERSION,
+        size=size,
+        mtime=mtime,
+        sha256=sha256,
+        terms=np.array(terms, dtype=str),
+        indptr=indptr,
+        indices=indices,
+        alt_ids=np.array(list(alt_ids), dtype=str),
+        alt_primary=np.array(list(alt_ids.values()), dtype=str),
+    )
+    return {"terms": np.array(terms, dtype=str), "indptr": indptr, "indices": indices, "alt_ids": alt_ids}
+
+
+def expand_terms(GOterms, closure):
+    """
+    Subtree of each of GOterms: a list with, for every GO:Term, itself plus all its descendants and their alternative IDs.
+    GO:Terms not in the ontology are only matched to themselves
+
+    Attributes
+    ----------
+    GOterms: list
+        GO:Terms to expand
+    closure: dictionary
+        Output of load_closure()
+    """
+    terms = closure["terms"]
+    position = {term: i for i, term in enumerate(terms.tolist())}
+    alt_of = {}
+    for alt_id, primary in closure["alt_ids"].items():
+        alt_of.setdefault(primary, []).append(alt_id)
+
+    subtrees = []
+    for GOterm in GOterms:
+        primary = closure["alt_ids"].get(GOterm, GOterm)
+        if primary not in position:
+            subtrees.append([GOterm])
+            continue
+        i = position[primary]
+        descendants = terms[closure["indices"][closure["indptr"][i]:closure["indptr"][i + 1]]].tolist()
+        subtree = descendants + [alt_id for term in descendants for alt_id in alt_of.get(term, [])]
+        subtrees.append(subtree if GOterm in subtree else subtree + [GOterm])
+
+    return subtrees
@@ -7,32 +7,75 @@
 
 import pandas as pd
 import numpy as np
+from eggfan import godag
+from eggfan import emapper_reader
 pd.options.display.max_rows = 999
 pd.options.display.max_columns = 999
 
 
 
-def GOTerms_annotation(emapper, GOterm, extra_columns=False, keep_all_columns = False):
+def GOTerms_incidence(emapper, GOterms, subtrees=None):
+	'''
+	Tokenizes the "GOs" column of emapper once and finds which genes have each of GOterms. GO:Terms are matched whole, so "GO:0003700" does not match "GO:00037001".
+	Returns the incidence as two arrays of the same length (sparse, one entry per gene - GO:Term pair): the row of the gene in emapper and the position of the GO:Term in GOterms.
+	Pairs are ordered by GO:Term and then by gene.
+
+	Attributes
+	----------
+	emapper: pandas dataframe
+		emapper output with a "GOs" column, as a string or already split by emapper_reader.read_emapper(split = ["GOs"])
+	GOterms: list
+		GO:terms you want to search on the mapper output
+	subtrees: list
+		For each of GOterms, all GO:Terms that count as having it (as made by godag.expand_terms()). Default, only the GO:Term itself
+	'''
+	if subtrees is None:
+		subtrees = [[term] for term in GOterms]
+
+	# GO:Term found in emapper -> position of the query GO:Term(s) it belongs to
+	members = pd.DataFrame({
+		"token": [token for subtree in subtrees for token in subtree],
+		"term": np.repeat(np.arange(len(GOterms)), [len(subtree) for subtree in subtrees]),
+	})
+
+	# Each distinct GO:Term of emapper is compared once (categories), genes are then joined by its integer code
+	tokens = emapper_reader.explode_tokens(emapper, "GOs")
+	categories = pd.DataFrame({"token": tokens["GOs"].cat.categories, "code": np.arange(len(tokens["GOs"].cat.categories))})
+	members = categories.merge(members, on = "token")[["code", "term"]]
+	found = pd.DataFrame({"row": tokens["row"].to_numpy(), "code": tokens["GOs"].cat.codes.to_numpy()}).merge(members, on = "code")
+
+	rows = found["row"].to_numpy()
+	terms = found["term"].to_numpy()
+
+	order = np.lexsort((rows, terms))
+	incidence = pd.DataFrame({"row": rows[order], "term": terms[order]}).drop_duplicates()
+	return incidence["row"].to_numpy(), incidence["term"].to_numpy()
+
+
+def GOTerms_annotation(emapper, GOterm, extra_columns=False, keep_all_columns = False, obo = None, obo_cache = None):
 	'''
 	This function takes in emapper results and annotates genes as TFs if they have a specified GO:Term (for TFs is GO:0003700)
+	Several GO:Terms can be searched at once giving a list, the emapper file is then read and tokenized only once. The output then has an extra "GOterm" column first, with the GO:Term each gene was found with
 	
 	Attributes
 	----------
 	emapper: string
-		Path to emapper output file. emapper file should not be modified
-	GOterm: string
-		GO:term you want to search on the mapper output
+		Path to emapper output file, compressed or not (or the emapper output already read by pandas). emapper file should not be modified
+	GOterm: string or list
+		GO:term(s) you want to search on the mapper output. They are matched whole
+	obo: string
+		Path to a Gene Ontology OBO file (go-basic.obo). If given, genes with any descendant of a GO:term also have it
+	obo_cache: string
+		Directory where the GO DAG closure made from obo is cached. Default, the directory of the OBO file
 	'''
 
-	emapper = pd.read_csv(emapper, skiprows=4, sep="\t")
-
 	# What columns should we keep in final output?
 	columns = ["#query"]
 	if isinstance(extra_columns, list) and keep_all_columns == False:
 		columns.extend(extra_columns)
 
 	elif keep_all_columns:
-		columns = emapper.columns.values
+		columns = None
 
 	elif extra_columns is False:
 		pass
@@ -40,24 +83,60 @@ def GOTerms_annotation(emapper, GOterm, extra_columns=False, keep_all_columns =
 
 	else: exit("extra_column is not a list, please input a list")
 
+	# Only the output columns and "GOs" are read (wrong column names stop the pipeline there)
+	emapper = emapper_reader.read_emapper(emapper, None if columns is None else columns + ["GOs"])
+	if columns is None:
+		columns = emapper.columns
 
+	GOterms = [GOterm] if isinstance(GOterm, str) else list(GOterm)
+	rows, terms = GOTerms_incidence(emapper, GOterms, GOTerms_subtrees(GOterms, obo, obo_cache))
 
-	# Contains extra_columns any wrong name?
-	if len(emapper.columns.intersection(columns)) != len(columns):
-		exit("You inserted a wrong column name in extra_columns")
-
-	annotation = emapper["GOs"].str.contains(GOterm)
-	annotation.fillna(False, inplace = True) ## Last 3 rows of emapper are statistics
-	annotation = emapper[emapper.columns.intersection(columns)][annotation]
-	
 	# Re-format dataframe
-	annotation = pd.DataFrame(data = annotation)
-	annotation.reset_index(inplace = True)
-	annotation.drop(columns = ["index"], inplace = True)
+	annotation = emapper[emapper.columns.intersection(columns, sort = False)].iloc[rows].reset_index(drop = True)
+	if not isinstance(GOterm, str):
+		annotation.insert(0, "GOterm", np.array(GOterms, dtype = object)[terms])
 	
 	return pd.DataFrame(data = annotation)
 
 
+def GOTerms_subtrees(GOterms, obo = None, obo_cache = None):
+	'''
+	Each of GOterms expanded to all its descendants in the OBO file, None without OBO file (only exact GO:Terms)
+	'''
+	if obo is None:
+		return None
+	return godag.expand_terms(GOterms, godag.load_closure(obo, obo_cache))
+
+
+def GOTerms_matrix(emapper, GOterms, obo = None, obo_cache = None):
+	'''
+	Membership matrix of the genes in emapper (rows, named by "#query") in each of GOterms (columns). Values are sparse: True if the gene has the GO:Term, False otherwise
+	Only genes with at least one of the GO:Terms are kept
+
+	Attributes
+	----------
+	emapper: string
+		Path to emapper output file (or the emapper output already read by pandas)
+	GOterms: list
+		GO:terms you want to search on the mapper output. They are matched whole
+	obo: string
+		Path to a Gene Ontology OBO file. If given, genes with any descendant of a GO:term also have it
+	obo_cache: string
+		Directory where the GO DAG closure made from obo is cached. Default, the directory of the OBO file
+	'''
+	emapper = emapper_reader.read_emapper(emapper, ["GOs"], split = ["GOs"])
+	rows, terms = GOTerms_incidence(emapper, GOterms, GOTerms_subtrees(GOterms, obo, obo_cache))
+
+	genes, gene_position = np.unique(rows, return_inverse = True)
+	matrix = {}
+	for i, term in enumerate(GOterms):
+		member = np.zeros(len(genes), dtype = bool)
+		member[gene_position[terms == i]] = True
+		matrix[term] = pd.arrays.SparseArray(member, fill_value = False)
+
+	return pd.DataFrame(matrix, index = pd.Index(emapper["#query"].to_numpy()[genes], name = "#query"))
+
+
 
 
 ##### Scriptexample usage
@@ -4,19 +4,35 @@ import pandas as pd
 import numpy as np
 
 
-def main(emapper, extra_columns, goterm, flags):
+def main(emapper, extra_columns, goterm, flags, goterms_file=None, obo=None, obo_cache=None):
     
     if extra_columns is None:
         extra = False
     else:
         extra = extra_columns
 
-    result = goterms.GOTerms_annotation(
-        emapper=emapper,
-        extra_columns=extra,
-        GOterm=goterm,
-        keep_all_columns=flags["keep_all_columns"],
-    ).to_csv(sep="\t", index=False)
+    # One -g keeps the single GO:Term output, several (or a file) search all of them in one pass
+    goterm_list = list(goterm) if goterm is not None else []
+    if goterms_file is not None:
+        with open(goterms_file) as f:
+            goterm_list += [line.strip() for line in f if line.strip() != ""]
+    if len(goterm_list) == 0:
+        exit("Give at least one GO:Term with -g or --goterms_file")
+    if len(goterm_list) == 1 and goterms_file is None:
+        goterm_list = goterm_list[0]
+
+    if flags["matrix"]:
+        matrix = goterms.GOTerms_matrix(emapper, list(np.atleast_1d(goterm_list)), obo=obo, obo_cache=obo_cache)
+        result = matrix.sparse.to_dense().astype(int).to_csv(sep="\t")
+    else:
+        result = goterms.GOTerms_annotation(
+            emapper=emapper,
+            extra_columns=extra,
+            GOterm=goterm_list,
+            keep_all_columns=flags["keep_all_columns"],
+            obo=obo,
+            obo_cache=obo_cache,
+        ).to_csv(sep="\t", index=False)
     
     print(result)
 
@@ -36,10 +52,17 @@ parser.add_argument(
 parser.add_argument(
     "-g",
     "--goterm",
+    action="append",
     type=str,
     metavar="",
-    required=True,
-    help="GO:Term you want to search in emapper. For example 'GO:0003700' for transcription factors",
+    help="GO:Term you want to search in emapper. For example 'GO:0003700' for transcription factors. Add a -g flag per GO:Term to search several at once",
+)
+parser.add_argument(
+    "-f",
+    "--goterms_file",
+    type=str,
+    metavar="",
+    help="Path to file with one GO:Term per line, all of them are searched at once",
 )
 parser.add_argument(
     "-x",
@@ -55,9 +78,28 @@ parser.add_argument(
     help="Default behaviour: keep only the '#query' column plus the columns specified in --extra_columns flag",
 )
 
+parser.add_argument(
+    "--obo",
+    type=str,
+    metavar="",
+    help="Path to a Gene Ontology OBO file (go-basic.obo). If given, genes annotated with any descendant of a GO:Term also count as having it",
+)
+parser.add_argument(
+    "--obo_cache",
+    type=str,
+    metavar="",
+    help="Directory where the GO DAG made from --obo is cached for following runs. Default, the directory of the OBO file",
+)
+parser.add_argument(
+    "--matrix",
+    action="store_true",
+    help="Output a membership matrix (genes x GO:Terms, 1 if the gene has the GO:Term) instead of a table",
+)
+
 args = parser.parse_args()
 flags = {}
 flags["keep_all_columns"] = args.keep_all_columns
+flags["matrix"] = args.matrix
 
 if __name__ == "__main__":
-    main(args.emapper, args.extra_columns, args.goterm, flags)
\ No newline at end of file
+    main(args.emapper, args.extra_columns, args.goterm, flags, args.goterms_file, args.obo, args.obo_cache)
\ No newline at end of file
@@ -0,0 +1,211 @@
+###############
+#### Offline ID-mapping backend for the phylome lookup (UniProtKB - ENSEMBL_ID - HGNC)
+#### UniProt's idmapping_selected.tab.gz and HGNC's hgnc_complete_set.txt are loaded once into an indexed SQLite file.
+#### Lookups are then answered from that file (memory-mapped) without any network, see phylome.make_lookup(resolver = ...).
+#### The HTTP path (phylome.resolve_lookup) is the other backend, both take a set of Uniprot IDs and return the same lookup.
+###############
+
+import os
+import csv
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+from eggfan import lookup_cache
+
+
+STORE_VERSION = 1
+MMAP_SIZE = 1 << 30  # bytes of the store read through mmap instead of read() calls
+
+# Columns of idmapping_selected.tab (https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/idmapping/README)
+IDMAPPING_COLUMNS = [
+    "UniProtKB-AC", "UniProtKB-ID", "GeneID", "RefSeq", "GI", "PDB", "GO", "UniRef100", "UniRef90", "UniRef50", "UniParc",
+    "PIR", "NCBI-taxon", "MIM", "UniGene", "PubMed", "EMBL", "EMBL-CDS", "Ensembl", "Ensembl_TRS", "Ensembl_PRO", "Additional PubMed",
+]
+
+
+def read_idmapping(path, taxID="9606", chunksize=500000):
+    """
+    Reads UniProt's idmapping_selected.tab(.gz) in chunks, yielding only the entries of taxID with columns
+    "UniProtKB-AC" (accession), "UniProtKB-ID" (entry name, for example P53_HUMAN) and "Ensembl" (genIDs separated by "; ")
+
+    Attributes
+    ----------
+    path: string
+        Path to idmapping_selected.tab.gz (compressed or not)
+    taxID: string
+        NCBI tax ID of the species to keep
+    chunksize: int
+        Number of lines parsed at a time
+    """
+    chunks = pd.read_csv(
+        path,
+        sep="\t",
+        header=None,
+        names=IDMAPPING_COLUMNS,
+        usecols=["UniProtKB-AC", "UniProtKB-ID", "NCBI-taxon", "Ensembl"],
+        dtype=str,
+        quoting=csv.QUOTE_NONE,
+        chunksize=chunksize,
+    )
+    for chunk in chunks:
+        yield chunk[chunk["NCBI-taxon"].to_numpy() == str(taxID)][["UniProtKB-AC", "UniProtKB-ID", "Ensembl"]]
+
+
+def read_hgnc(path):
+    """
+    Reads HGNC's hgnc_complete_set.txt keeping the approved symbols with their ENSEMBL genID and Uniprot accessions ("|" separated)
+
+    Attributes
+    ----------
+    path: string
+        Path to hgnc_complete_set.txt (compressed or not)
+    """
+    hgnc = pd.read_csv(path, sep="\t", usecols=["symbol", "ensembl_gene_id", "uniprot_ids"], dtype=str)
+    hgnc["uniprot_ids"] = hgnc["uniprot_ids"].str.strip('"')
+    return hgnc
+
+
+def translations(idmapping, hgnc):
+    """
+    Lookup rows (accession, entry name, ENSEMBL_ID, HGNC) of a chunk of read_idmapping(). HGNC symbols are found by accession in HGNC's uniprot_ids,
+    or else by ENSEMBL genID. Accessions without ENSEMBL genID in UniProt get the one of their HGNC symbol, as phylome.translate_from_HGNC() does online.
+    Entries without any translation are left out
+
+    Attributes
+    ----------
+    idmapping: pandas dataframe
+        Chunk yielded by read_idmapping()
+    hgnc: pandas dataframe
+        Output of read_hgnc()
+    """
+    by_accession = hgnc.dropna(subset=["uniprot_ids"]).assign(accession=lambda table: table["uniprot_ids"].str.split("|")).explode("accession")
+    by_accession = by_accession.rename(columns={"symbol": "HGNC", "ensembl_gene_id": "HGNC_ENSEMBL_ID"})[["accession", "HGNC", "HGNC_ENSEMBL_ID"]]
+    by_genID = hgnc.dropna(subset=["ensembl_gene_id"]).drop_duplicates(subset=["ensembl_gene_id"]).set_index("ensembl_gene_id")["symbol"]
+
+    genIDs = idmapping["Ensembl"].str.split("; ")
+    rows = pd.DataFrame({
+        "accession": np.repeat(idmapping["UniProtKB-AC"].to_numpy(dtype=object), genIDs.str.len().fillna(1).astype(int)),
+        "entry_name": np.repeat(idmapping["UniProtKB-ID"].to_numpy(dtype=object), genIDs.str.len().fillna(1).astype(int)),
+        "ENSEMBL_ID": genIDs.explode().str.replace(r"\.\d+$", "", regex=True).to_numpy(dtype=object),  # no version
+    })
+
+    rows = rows.merge(by_accession, on="accession", how="left")
+    rows["ENSEMBL_ID"] = rows["ENSEMBL_ID"].where(rows["ENSEMBL_ID"].notna(), rows["HGNC_ENSEMBL_ID"])
+    rows["HGNC"] = rows["HGNC"].where(rows["HGNC"].notna(), rows["ENSEMBL_ID"].map(by_genID))
+
+    rows = rows[rows["ENSEMBL_ID"].notna() | rows["HGNC"].notna()]
+    return rows[["accession", "entry_name", "ENSEMBL_ID", "HGNC"]].drop_duplicates()
+
+
+def build_store(idmapping, hgnc, store, taxID="9606", chunksize=500000):
+    """
+    Loads the UniProt and HGNC dumps into an indexed SQLite file at store, replacing it if it exists. Every translation is saved
+    under the Uniprot accession and under the entry name, so orthology tables with either of them can be translated
+
+    Attributes
+    ----------
+    idmapping: string
+        Path to UniProt's idmapping_selected.tab.gz
+    hgnc: string
+        Path to HGNC's hgnc_complete_set.txt
+    store: string
+        Path of the SQLite file to make
+    taxID: string
+        NCBI tax ID of the species to keep. Default human
+    chunksize: int
+        Number of idmapping lines parsed at a time
+    """
+    hgnc_table = read_hgnc(hgnc)
+
+    building = store + ".building"
+    if os.path.exists(building):
+        os.remove(building)
+    connection = sqlite3.connect(building)
+    try:
+        connection.execute("CREATE TABLE mapping (UniProtKB TEXT NOT NULL, ENSEMBL_ID TEXT, HGNC TEXT)")
+        connection.execute("CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)")
+        entries = 0
+        with connection:
+            for chunk in read_idmapping(idmapping, taxID, chunksize):
+                rows = translations(chunk, hgnc_table).astype(object)
+                rows = rows.where(rows.notna(), None)
+                for key in ["accession", "entry_name"]:
+                    connection.executemany("INSERT INTO mapping VALUES (?, ?, ?)", rows[[key, "ENSEMBL_ID", "HGNC"]].itertuples(index=False, name=None))
+                entries += len(chunk)
+
+        # The index is made once after loading, faster than keeping it updated row by row
+        with connection:
+            connection.execute("CREATE INDEX mapping_uniprot ON mapping (UniProtKB)")
+            metadata = {
+                "version": STORE_VERSION,
+                "taxID": str(taxID),
+                "entries": entries,
+                "sources": [{"path": os.path.abspath(path), "size": os.stat(path).st_size, "mtime": os.stat(path).st_mtime} for path in (idmapping, hgnc)],
+            }
+            connection.executemany("INSERT INTO metadata VALUES (?, ?)", [(key, json.dumps(value)) for key, value in metadata.items()])
+    finally:
+        connection.close()
+
+    os.replace(building, store)
+    return metadata
+
+
+def open_store(store):
+    """
+    Opens a store made by build_store() read-only, memory-mapped. Stops the pipeline if there is no store or it was made by another version
+    """
+    if not os.path.exists(store):
+        exit("No ID-mapping store found in " + store + ". Build it with: phylome_argparse.py idmapping")
+    connection = sqlite3.connect("file:" + store + "?mode=ro", uri=True)
+    connection.execute("PRAGMA mmap_size = %d" % MMAP_SIZE)
+    version = connection.execute("SELECT value FROM metadata WHERE key = 'version'").fetchone()
+    if version is None or json.loads(version[0]) != STORE_VERSION:
+        connection.close()
+        exit("ID-mapping store " + store + " was made by another version of eggfan. Build it again with: phylome_argparse.py idmapping")
+    return connection
+
+
+def resolve(store, genes):
+    """
+    Lookup with columns UniProtKB, ENSEMBL_ID and HGNC for genes, read from the store. Uniprot IDs without translation are left out,
+    same as in a lookup made online by phylome.resolve_lookup()
+
+    Attributes
+    ----------
+    store: string
+        Path to the SQLite file made by build_store()
+    genes: set
+        Uniprot IDs (accessions or entry names) to translate, as made by utils.human_genes() (a string with them separated by " " also works)
+    """
+    genes = set(genes.split(" ")) if isinstance(genes, str) else set(genes)
+    genes.discard("")
+
+    connection = open_store(store)
+    try:
+        connection.execute("CREATE TEMP TABLE query (UniProtKB TEXT PRIMARY KEY)")
+        connection.executemany("INSERT INTO query VALUES (?)", ((gene,) for gene in genes))
+        lookup = pd.read_sql_query(
+            "SELECT mapping.UniProtKB, mapping.ENSEMBL_ID, mapping.HGNC FROM query JOIN mapping ON mapping.UniProtKB = query.UniProtKB",
+            connection,
+        )
+    finally:
+        connection.close()
+
+    lookup.columns = lookup_cache.LOOKUP_COLUMNS
+    return lookup.sort_values("UniProtKB", kind="stable").reset_index(drop=True)
+
+
+def store_resolver(store):
+    """
+    Resolver for phylome.make_lookup() and the lookup cache that answers from the store instead of Uniprot's and HGNC's APIs
+
+    Attributes
+    ----------
+    store: string
+        Path to the SQLite file made by build_store()
+    """
+    def idmapping_store(genes):
+        return resolve(store, genes)
+
+    return idmapping_store
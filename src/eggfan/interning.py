@@ -0,0 +1,231 @@
+###############
+#### Interning of gene/protein IDs (UniProt, ENSEMBL genes and proteins, HGNC symbols, orthogroups)
+#### Every distinct ID gets an int32 code from one dictionary shared by all pipelines, so joins compare integers instead of strings.
+#### Cells with several IDs ("ENSG1|ENSG2,ENSG3") are kept as CSR arrays: the codes of all IDs one after the other and the
+#### offsets where each cell starts. Delimited strings are only rendered back at output time.
+#### Codes are only valid inside the process that made them: each worker of utils.map_tables() has its own dictionary,
+#### so codes should never be saved or sent to another process, render them with ids() first.
+#### The dictionary only lives for one pipeline run: reset() empties it at the start of every table annotated by phylome and of every
+#### orthogroup translation or annotation, so it never holds more than the IDs of one run and codes never outlive it.
+###############
+
+import re
+import numpy as np
+import pandas as pd
+
+
+_codes = {}  # ID -> code
+_ids = []  # code -> ID
+_id_array = [np.empty(0, dtype=object)]  # _ids as an array, rebuilt when new IDs are added
+
+
+def reset():
+    """
+    Empties the dictionary. Codes made before are no longer valid
+    """
+    _codes.clear()
+    del _ids[:]
+    _id_array[0] = np.empty(0, dtype=object)
+
+
+def size():
+    """
+    Number of IDs in the dictionary
+    """
+    return len(_ids)
+
+
+def intern(values):
+    """
+    int32 code of each of values. IDs not seen before are added to the dictionary. Missing values (NaN, None) get -1
+
+    Attributes
+    ----------
+    values: array-like
+        IDs
+    """
+    factorized, uniques = pd.factorize(np.asarray(values, dtype=object))
+
+    # Only distinct IDs go through the dictionary
+    unique_codes = np.empty(len(uniques) + 1, dtype=np.int32)
+    for i, ID in enumerate(uniques.tolist()):
+        code = _codes.get(ID)
+        if code is None:
+            code = len(_ids)
+            _codes[ID] = code
+            _ids.append(ID)
+        unique_codes[i] = code
+    unique_codes[-1] = -1  # factorize gives -1 to missing values
+
+    return unique_codes[factorized]
+
+
+def codes_of(values):
+    """
+    Same as intern() but IDs not in the dictionary get -1 instead of being added
+
+    Attributes
+    ----------
+    values: array-like
+        IDs
+    """
+    factorized, uniques = pd.factorize(np.asarray(values, dtype=object))
+    unique_codes = np.array([_codes.get(ID, -1) for ID in uniques.tolist()] + [-1], dtype=np.int32)
+    return unique_codes[factorized]
+
+
+def ids(codes, missing=np.nan):
+    """
+    IDs of codes as an object array, missing for -1
+
+    Attributes
+    ----------
+    codes: array-like
+        int32 codes made by intern()
+    missing: object
+        Value given to code -1
+    """
+    if len(_id_array[0]) != len(_ids) + 1:  # one slot more, for code -1
+        _id_array[0] = np.array(_ids + [None], dtype=object)
+
+    codes = np.asarray(codes)
+    if len(codes) == 0:
+        return np.empty(0, dtype=object)
+    IDs = _id_array[0][np.where(codes < 0, len(_ids), codes)]  # a copy, the cached array is never written
+    IDs[codes < 0] = missing
+    return IDs
+
+
+def arrow_lists(cells, depth=1):
+    """
+    Cells as a pyarrow ListArray if they are a column of lists (depth 1) or lists of lists (depth 2), as read by columnar.read_table(lists = True).
+    Missing cells become [""] ([[""]]), as a missing string cell splits into one empty ID. None for any other column
+    """
+    dtype = getattr(cells, "dtype", None)
+    if not isinstance(dtype, pd.ArrowDtype):
+        return None
+    import pyarrow as pa
+
+    kind = dtype.pyarrow_dtype
+    for _ in range(depth):
+        if not pa.types.is_list(kind):
+            return None
+        kind = kind.value_type
+    if pa.types.is_list(kind):
+        return None
+
+    lists = pa.array(cells.array)
+    if isinstance(lists, pa.ChunkedArray):
+        lists = lists.combine_chunks()
+    if lists.null_count > 0:
+        empty = [""]
+        for _ in range(depth - 1):
+            empty = [empty]
+        lists = lists.fill_null(pa.scalar(empty, lists.type))
+    return lists
+
+
+def split_cells(cells, sep=","):
+    """
+    Interns a column with several IDs per cell separated by sep. Returns the codes of all IDs, one cell after the other, and the offsets
+    (CSR): the IDs of cell i are codes[offsets[i]:offsets[i + 1]]. An empty or missing cell has one empty ID "", as str.split() gives.
+    A column of lists (see columnar) is interned as it is, without splitting anything
+
+    Attributes
+    ----------
+    cells: pandas series or array-like
+        Cells with IDs separated by sep, or lists of IDs
+    sep: string
+        Separator between IDs of the same cell
+    """
+    lists = arrow_lists(cells)
+    if lists is not None:
+        offsets = lists.offsets.to_numpy().astype(np.int64)
+        return intern(lists.flatten().to_numpy(zero_copy_only=False)), offsets - offsets[0]
+
+    cells = pd.Series(np.asarray(cells, dtype=object)).fillna("")
+    offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+    if len(cells) == 0:
+        return np.empty(0, dtype=np.int32), offsets
+
+    # One join and one split of the whole column, the number of IDs per cell comes from counting separators
+    np.cumsum(cells.str.count(re.escape(sep)).to_numpy() + 1, out=offsets[1:])
+    return intern(sep.join(cells.tolist()).split(sep)), offsets
+
+
+def split_nested(cells, outer=",", inner="|"):
+    """
+    split_cells() for cells with two levels of separators, for example "ENSG1|ENSG2,ENSG3" where outer separates the orthologs
+    and inner the IDs of each ortholog. Only the IDs are interned. Returns the codes of all IDs, the offsets of each ortholog in the codes
+    and the offsets of each cell in the orthologs
+
+    Attributes
+    ----------
+    cells: pandas series or array-like
+        Cells with IDs separated by outer and inner, or lists of lists of IDs (see columnar)
+    outer, inner: string
+        Separators
+    """
+    lists = arrow_lists(cells, depth=2)
+    if lists is not None:
+        codes, item_offsets = split_cells(pd.Series(pd.arrays.ArrowExtensionArray(lists.flatten())))
+        cell_offsets = lists.offsets.to_numpy().astype(np.int64)
+        return codes, item_offsets, cell_offsets - cell_offsets[0]
+
+    cells = pd.Series(np.asarray(cells, dtype=object)).fillna("")
+    cell_offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+    if len(cells) == 0:
+        return np.empty(0, dtype=np.int32), np.zeros(1, dtype=np.int64), cell_offsets
+
+    np.cumsum(cells.str.count(re.escape(outer)).to_numpy() + 1, out=cell_offsets[1:])
+    codes, item_offsets = split_cells(outer.join(cells.tolist()).split(outer), inner)
+    return codes, item_offsets, cell_offsets
+
+
+def join_cells(codes, offsets, sep=",", missing=""):
+    """
+    Opposite of split_cells(): renders the IDs of every cell back into one string per cell
+
+    Attributes
+    ----------
+    codes: array-like
+        Codes of all IDs, one cell after the other
+    offsets: array-like
+        Where each cell starts in codes, plus the total length at the end
+    sep: string
+        Separator placed between the IDs of a cell
+    missing: string
+        Written for code -1
+    """
+    from eggfan import utils
+
+    return utils.join_exploded(ids(codes, missing), np.diff(offsets), sep)
+
+
+def merge(left, right, left_on, right_on=None, how="inner", **kwargs):
+    """
+    DataFrame.merge() on one ID column of each table, comparing their int32 codes instead of the strings. Both ID columns are kept
+    as DataFrame.merge() does (only once if they have the same name). Inner, left and right merges keep the row order of DataFrame.merge(),
+    outer merges are ordered by code instead of alphabetically
+
+    Attributes
+    ----------
+    left, right: pandas dataframes
+        Tables to merge
+    left_on, right_on: string
+        ID column of each table. right_on defaults to left_on
+    how: string
+        As in DataFrame.merge()
+    """
+    right_on = left_on if right_on is None else right_on
+    key = "__code__"
+
+    left = left.assign(**{key: intern(left[left_on])})
+    right = right.assign(**{key: intern(right[right_on])})
+    if right_on == left_on:
+        right = right.drop(columns=[right_on])
+
+    merged = left.merge(right, on=key, how=how, **kwargs)
+    if right_on == left_on and how in ("right", "outer"):
+        merged[left_on] = ids(merged[key].to_numpy())  # rows only in right
+    return merged.drop(columns=[key])
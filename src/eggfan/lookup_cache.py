@@ -0,0 +1,158 @@
+###############
+#### Persistent on-disk store for the phylome lookup (UniProtKB - ENSEMBL_ID - HGNC)
+#### Every Uniprot ID is resolved once and saved in a SQLite file inside a cache directory,
+#### so following runs only resolve the Uniprot IDs they have never seen before.
+###############
+
+import os
+import time
+import sqlite3
+import pandas as pd
+
+
+CACHE_FILE = "lookup_cache.sqlite"
+LOOKUP_COLUMNS = ["UniProtKB", "ENSEMBL_ID", "HGNC"]
+
+
+def open_cache(cache_dir):
+    """
+    Opens (and creates if needed) the lookup cache inside cache_dir. Each row is one translation of a Uniprot ID,
+    together with the resolver that found it ("source") and the time it was resolved ("resolved_at", seconds since epoch).
+    Uniprot IDs that were resolved but got no translation are stored with empty ENSEMBL_ID and HGNC so they are not asked again.
+
+    Attributes
+    ----------
+    cache_dir: string
+        Path to directory where the cache is kept
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(cache_dir, CACHE_FILE))
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS lookup "
+        "(UniProtKB TEXT NOT NULL, ENSEMBL_ID TEXT, HGNC TEXT, source TEXT, resolved_at REAL)"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS lookup_uniprot ON lookup (UniProtKB)")
+    return connection
+
+
+def evict(connection, ttl=None, now=None):
+    """
+    Removes from the cache all entries resolved more than ttl seconds ago, so they will be resolved again. Returns the number of removed rows
+
+    Attributes
+    ----------
+    connection: sqlite3 connection
+        Output of open_cache()
+    ttl: number
+        Time to live of an entry in seconds. If None, entries never expire
+    now: number
+        Current time in seconds since epoch. Default time.time()
+    """
+    if ttl is None:
+        return 0
+    if now is None:
+        now = time.time()
+
+    with connection:
+        removed = connection.execute("DELETE FROM lookup WHERE resolved_at < ?", (now - ttl,)).rowcount
+    return removed
+
+
+def cached_uniprots(connection):
+    """
+    Set with all Uniprot IDs present in the cache, translated or not
+    """
+    return {row[0] for row in connection.execute("SELECT DISTINCT UniProtKB FROM lookup")}
+
+
+def read_cache(connection, uniprots=None, metadata=False):
+    """
+    Reads the cache as a lookup table with columns UniProtKB, ENSEMBL_ID and HGNC.
+    Uniprot IDs without any translation are left out, same as in a lookup made by phylome.make_lookup()
+
+    Attributes
+    ----------
+    connection: sqlite3 connection
+        Output of open_cache()
+    uniprots: iterable
+        Uniprot IDs to read. Default, all of them
+    metadata: boolean
+        If True also return the "source" and "resolved_at" columns
+    """
+    columns = LOOKUP_COLUMNS + ["source", "resolved_at"] if metadata else LOOKUP_COLUMNS
+    lookup = pd.read_sql_query(
+        "SELECT " + ", ".join(columns) + " FROM lookup WHERE ENSEMBL_ID IS NOT NULL OR HGNC IS NOT NULL",
+        connection,
+    )
+
+    if uniprots is not None:
+        lookup = lookup[lookup["UniProtKB"].isin(set(uniprots))]
+
+    return lookup.reset_index(drop=True)
+
+
+def write_cache(connection, lookup, uniprots, source, now=None):
+    """
+    Merges a freshly resolved lookup into the cache. Previous entries of those Uniprot IDs are replaced.
+
+    Attributes
+    ----------
+    connection: sqlite3 connection
+        Output of open_cache()
+    lookup: pandas dataframe
+        Lookup with columns UniProtKB, ENSEMBL_ID and HGNC as made by the resolver
+    uniprots: iterable
+        All Uniprot IDs that were sent to the resolver. The ones missing in lookup are saved as not translated
+    source: string
+        Name of the resolver that made lookup
+    now: number
+        Resolution time in seconds since epoch. Default time.time()
+    """
+    if now is None:
+        now = time.time()
+
+    uniprots = set(uniprots)
+    lookup = lookup[LOOKUP_COLUMNS].astype(object).where(lookup[LOOKUP_COLUMNS].notna(), None)
+    not_translated = uniprots.difference(lookup["UniProtKB"])
+
+    rows = [tuple(row) + (source, now) for row in lookup.itertuples(index=False)]
+    rows += [(uniprot, None, None, source, now) for uniprot in not_translated]
+
+    with connection:
+        connection.executemany("DELETE FROM lookup WHERE UniProtKB = ?", [(uniprot,) for uniprot in uniprots])
+        connection.executemany("INSERT INTO lookup VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def cached_lookup(genes, resolver, cache_dir, ttl=None):
+    """
+    Lookup for all genes, resolving only the ones that are not in the cache yet (or expired) and saving them in the cache afterwards.
+
+    Attributes
+    ----------
+    genes: set
+        All human Uniprot IDs to translate, as made by utils.human_genes() (a string with them separated by " " also works)
+    resolver: function
+        Takes a set of Uniprot IDs and returns a lookup with columns UniProtKB, ENSEMBL_ID and HGNC. For example phylome.resolve_lookup()
+    cache_dir: string
+        Path to directory where the cache is kept
+    ttl: number
+        Time to live of the cache entries in seconds. If None, entries never expire
+    """
+    genes = set(genes.split(" ")) if isinstance(genes, str) else set(genes)
+    genes.discard("")
+
+    connection = open_cache(cache_dir)
+    try:
+        evict(connection, ttl)
+        delta = genes.difference(cached_uniprots(connection))
+
+        if len(delta) > 0:
+            print("* Resolving %d Uniprot IDs not found in the lookup cache" % len(delta))
+            lookup = resolver(delta)
+            write_cache(connection, lookup, delta, source=getattr(resolver, "__name__", str(resolver)))
+
+        lookup = read_cache(connection, genes)
+    finally:
+        connection.close()
+
+    return lookup
@@ -1,25 +1,74 @@
 import pandas as pd
 import numpy as np
+from eggfan import utils
+from eggfan import emapper_reader
+from eggfan import interning
 pd.options.mode.chained_assignment = None  # default='warn', otherwie it gives anoying warnings of not using .loc in pandas
 
 
 
-def read_eggnog(paths):
+EGGNOG_COLUMNS = ["X", "Orthogroup", "N_Prots", "N_Spec", "Protein stable ID", "SpeciesID"]
+EGGNOG_USECOLS = ["X", "Orthogroup", "Protein stable ID", "SpeciesID"] # the only ones used by egg_translate()
+
+
+def species_mask(species, taxIDs):
+    """
+    Boolean array, True for the rows of an eggnog "SpeciesID" column (tax IDs separated by ",") that contain any of taxIDs.
+    Tax IDs are matched whole, so "9606" does not match "19606"
+
+    Attributes
+    ----------
+    species: pandas series
+        "SpeciesID" column of an eggnog dataset
+    taxIDs: list
+        NCBI tax IDs to look for
+    """
+    species = "," + species.fillna("").astype(str) + ","
+    mask = np.zeros(len(species), dtype = bool)
+    for taxID in taxIDs:
+        mask |= species.str.contains("," + str(taxID) + ",", regex = False).to_numpy()
+    return mask
+
+
+def read_eggnog(paths, taxID = "9606", chunksize = 100000):
     """
     Read and format one or many eggnog datasets for posterior uses by further functions. Formatting consists of adding column names
     ...
+    Files are read in chunks (compressed or not) and only orthogroups with proteins of taxID are kept, so the whole file is never in memory.
+    Only the columns used later are kept: "X", "Orthogroup" (categorical), "Protein stable ID" and "SpeciesID".
 
     Attributes
     ----------
     *paths: string(s)
-        Absolute or relative path(s) to eggnog datasets as downloaded from eggnog (Go to http://eggnog5.embl.de/#/app/downloads, click on the taxonimic level you are interested in, and download the file with suffix "members.tsv.gz")
+        Absolute or relative path(s) to eggnog datasets as downloaded from eggnog (Go to http://eggnog5.embl.de/#/app/downloads, click on the taxonimic level you are interested in, and download the file with suffix "members.tsv.gz"). It can be kept compressed
+    taxID: string or list
+        NCBI tax ID(s) of the species whose orthogroups are kept, the same given to egg_translate(). If None, all orthogroups are kept
+    chunksize: int
+        Number of orthogroups parsed at a time
     """
+    taxIDs = [taxID] if isinstance(taxID, str) else taxID
+
     eggnogs = []
     for path in paths:
-        eggnog = pd.read_csv(path,
-                         sep='\t', 
-                         names=["X", "Orthogroup", "N_Prots", "N_Spec", "Protein stable ID", "SpeciesID"]
+        chunks = pd.read_csv(path,
+                         sep='\t',
+                         names=EGGNOG_COLUMNS,
+                         usecols=EGGNOG_USECOLS,
+                         dtype={"Protein stable ID": str, "SpeciesID": str},
+                         chunksize=chunksize
                          )
+
+        kept = []
+        for chunk in chunks:
+            if taxIDs is not None:
+                chunk = chunk[species_mask(chunk["SpeciesID"], taxIDs)] # same filter as egg_translate()
+            kept.append(chunk)
+
+        if len(kept) > 0:
+            eggnog = pd.concat(kept, ignore_index=True)
+        else:
+            eggnog = pd.DataFrame(columns=EGGNOG_USECOLS)
+        eggnog["Orthogroup"] = eggnog["Orthogroup"].astype("category")
         eggnogs.append(eggnog)
 
 
@@ -62,50 +111,50 @@ def eggnog_prots_extract(eggnog, taxID):
 
     return all_proteins
 
-def query_table(dataset, match_column, taxID, data_origin):
+def eggnog_orthoprot_tables(eggnog, taxIDs, explode = True, remove_taxid = True):
     """
-    Takes in a table with two columns, one of them with unique identifiers and the other with multiple identifiers separated y commas as:
-    | protein | Orthogroup                        |
-    | ENSP01  | GHFC@metaz, GBHF@metaz, GFCB@Opis |
-    | ENSP02  | FVHG@Bilate, HJHG@Opis, HGNJ@Phot |
-
-    And an id that identifies some of the multiple identifiers (Orthogroup columns in this example). It reduces the table size by picking only row that contain the id
-    and removes all identifiers that do not contain the id. thus for the id = metaz we would get:
-
-    | protein | Orthogroup            |
-    | ENSP01  | GHFC@metaz, GBHF@metaz|
+    eggnog_orthoprot_table() for several species at once. The proteins of the eggnog dataset are split only once and each one is given to its species.
+    Returns a dictionary with one table per tax ID
 
     Attributes
     ----------
-    dataset: pandas dataframe
-        table with two columns as explained in the documentation above. It is relevant that one of the columns contains unique identifiers and the other multiple.
-    match_column: string
-        name of the column with the multiple identifiers where we want to match the taxID
-    taxID: string
-        substring, present in the match_column column. All identifiers without the TaxID will be eliminated
-    data_origin: string
-        can take values "emapper" or "eggnog", depending on whether we want to do this on a dataset downloaded from eggnog or the output of emapper. emapper input is usually two columns, one
-        with protein IDs from the target species ("#query") column and one with all orthorgoups from that protein separated by ",". eggnog is simmilar, one column with one orthorgoup per row and another one
-        with several proteins, separated one from another by ",".
+    eggnog : pandas dataframe
+        eggnog dataset as downloaded from eggnog and formatted by read_eggnog()
+    taxIDs: list
+        NCBI tax IDs of the species you want to retrieve proteinIDs from
+    explode: boolean
+        If true it will make a single row per protein ID. Otherwise all proteins that were in the same row, will remain in the same row separated by ","
+    remove_taxid: boolean
+        If true it will remove taxID from the prot IDs. Otherwise it will leave them with their protID
     """
-    draged_column = [colname for colname in dataset.columns.values if colname != match_column][0]
-    if isinstance(dataset.loc[0, match_column], str): # This is a patch. when using this function in a loop like emaper_annotation() the original emapper object gets modified by this line the first time. If you do it again you get NAs. I don't know why this happens
-        dataset.loc[:, match_column] = dataset.loc[:, match_column].str.split(',')
-    out = pd.DataFrame()
 
-    for i in dataset.index.values:
-        if data_origin == "emapper": # not very efficient evaluating for every row
-            matched_element = [element for element in dataset.loc[i, match_column] if taxID in element]
-        elif data_origin == "eggnog":
-            matched_element = [element for element in dataset.loc[i, match_column] if element.startswith(taxID)]
+    prot_column = "Protein stable ID"
+    taxIDs = [str(taxID) for taxID in taxIDs]
+
+    # One protein per row, with the species before the first "." of its ID ("9606.ENSP0001")
+    proteins = eggnog[prot_column].reset_index(drop = True).str.split(",").explode().dropna()
+    species = proteins.str.split(".", n = 1).str[0]
+    kept = species.isin(taxIDs).to_numpy()
+
+    members = pd.DataFrame({
+        "Orthogroup": eggnog["Orthogroup"].to_numpy()[proteins.index[kept]],
+        prot_column: proteins[kept].to_numpy(),
+        "taxID": species[kept].to_numpy(),
+    }).drop_duplicates()
+
+    tables = {}
+    for taxID in taxIDs:
+        prot_ortho = members.loc[members["taxID"] == taxID, ["Orthogroup", prot_column]].reset_index(drop = True)
+
+        if remove_taxid:
+            prot_ortho[prot_column] = prot_ortho[prot_column].str.slice(len(taxID) + 1)
 
-        if len(matched_element) > 0:
-            matched_element = ",".join(matched_element)
-            matched_element = pd.DataFrame(data = {draged_column:[dataset.loc[i, draged_column]], match_column : [matched_element]})
-            out = out.append(matched_element, ignore_index = True)
+        if not explode:
+            prot_ortho = prot_ortho.groupby("Orthogroup", sort = False)[prot_column].agg(",".join).reset_index()
 
-    return(out)
+        tables[taxID] = prot_ortho
 
+    return tables
 
 
 def eggnog_orthoprot_table(eggnog, taxID, explode = True, remove_taxid = True):
@@ -124,72 +173,75 @@ def eggnog_orthoprot_table(eggnog, taxID, explode = True, remove_taxid = True):
     remove_taxid: boolean
         If true it will remove taxID from the prot IDs. Otherwise it will leave them with their protID
     """
-
-    prot_column = "Protein stable ID"
-
-    prot_ortho = query_table(eggnog, match_column = prot_column, taxID = "9606", data_origin = "eggnog")
-    prot_ortho.drop_duplicates(inplace = True)
-
-    # Return
-    if remove_taxid:
-        prot_ortho.loc[:, prot_column] = prot_ortho.loc[:, prot_column].str.replace(taxID + ".", "", regex=False)
-
-    if explode:
-        prot_ortho.loc[:, prot_column] = prot_ortho.loc[:, prot_column].str.split(",")
-        prot_ortho = prot_ortho.explode(prot_column)
-
-    return prot_ortho
+    taxID = str(taxID)
+    return eggnog_orthoprot_tables(eggnog, [taxID], explode = explode, remove_taxid = remove_taxid)[taxID]
 
 
 def egg_translate(eggnog, lookup, taxID = "9606"):
     """
     Takes in one or several Eggnog database raw datasets , finds each of the proteins in each eggnog dataset and creates a table specifying for each protein their respective Ensembl gene ID, HGNC symbol (HGNC and Ensembl gen ID may not be "translated", Na for empty values) and orthogroup.
     ...
+    Several reference species can be translated at once by giving a list of tax IDs, each eggnog dataset is then gone through only once for all of them.
 
     Attributes
     ----------
     eggnog : list or pandas dataframe
         list containing one or more eggnog datasets in pandas dataframe format or a single pandas dataframe. Supposed to be direct output from read_eggnog.
-    lookup : pandas.dataframe
+    lookup : pandas.dataframe or dictionary
         DataFrame containing three columns: "HGNC symbol", "Gene stable ID", "Protein stable ID". Each column contain strings with ID conversions from HGNC to Ensembl GenID to Ensembl protein ID
+        With several tax IDs, a dictionary with one lookup per tax ID (or a single lookup used for all of them)
+    taxID : string or list
+        NCBI tax ID of the reference species, or a list of them. default = human
     
     Output
     ------
     - If input is a single eggnog dataset the output is a single table 
     - If input is a list with multiple eggnog datasets then the output is a single table with an extra column per dataset specifying orthogroups from the differnt datasets inputed
+    - If taxID is a list, a dictionary with one of those tables per tax ID
     """
 
     prot_column = "Protein stable ID"
+    interning.reset() # codes only live during this translation
+
+    taxIDs = [str(taxID)] if isinstance(taxID, str) else [str(ID) for ID in taxID]
+    if not isinstance(lookup, dict):
+        lookup = {ID: lookup for ID in taxIDs}
 
     # Data preparation
     if not isinstance(eggnog, list):
         eggnog = [eggnog]
 
     tax_levels = []
-    for df in list(range(len(eggnog))):
-        tax = "@" + str(eggnog[df].iat[0,0])
+    prot_tables = [] # for each eggnog dataset, the proteins of every reference species
+    for egg in eggnog:
+        tax = "@" + str(egg.iat[0,0])
         tax_levels.append(tax) # For later use in naming orthogroup columns
 
-        eggnog[df] = eggnog[df][eggnog[df].SpeciesID.str.contains(taxID)] # only rows with human prots stay.
-        eggnog[df] = eggnog[df].loc[:, [prot_column, "Orthogroup"]]
-
-    lookup.dropna(subset=[prot_column, "Gene stable ID"], inplace=True)
+        egg = egg[species_mask(egg["SpeciesID"], taxIDs)] # only rows with proteins of the reference species stay.
+        prot_tables.append(eggnog_orthoprot_tables(egg.loc[:, [prot_column, "Orthogroup"]], taxIDs))
 
     ## Make translated table(s)
-    dfs = []
-    for egg in eggnog:
-        egg_prots = eggnog_orthoprot_table(eggnog = egg, taxID = taxID)
-        egg_prots = egg_prots.merge(lookup, how = "left", on = prot_column)
-        dfs.append(egg_prots)
-
-    # Save
-    out = dfs[0]
-    if len(dfs) > 1:
-        for df in dfs[1:]:
-            df = df.drop(columns = ["HGNC symbol", "Gene stable ID"])
-            out = out.merge(df, on = prot_column, suffixes = tax_levels)
-    else:  out.columns = [i+tax_levels[0] if i.startswith("Orthogroup") else i for i in out.columns.values]
-    return out
+    translated = {}
+    for ID in taxIDs:
+        reference_lookup = lookup[ID].dropna(subset=[prot_column, "Gene stable ID"])
+
+        dfs = []
+        for tables in prot_tables:
+            egg_prots = interning.merge(tables[ID], reference_lookup, prot_column, how = "left")
+            dfs.append(egg_prots)
+
+        # Save
+        out = dfs[0]
+        if len(dfs) > 1:
+            for df in dfs[1:]:
+                df = df.drop(columns = ["HGNC symbol", "Gene stable ID"])
+                out = interning.merge(out, df, prot_column, suffixes = tax_levels)
+        else:  out.columns = [i+tax_levels[0] if i.startswith("Orthogroup") else i for i in out.columns.values]
+        translated[ID] = out
+
+    if isinstance(taxID, str):
+        return translated[taxID]
+    return translated
 
 
 
@@ -268,23 +320,13 @@ def format_quer_orth(query_orthogroups, ortho_cols):
         Names of columns that contain the orthogroups 
     """
     non_ortho_cols = [element for element in query_orthogroups.columns.values if element not in ortho_cols ]
-    out = pd.DataFrame()
-
-    for col in ortho_cols:
-        # Make dataframe with only one Ortho column but all gene names and conversions
-        non_ortho_cols = [element for element in query_orthogroups.columns.values if element not in ortho_cols ]
-        subset = non_ortho_cols
-        subset.append(col)
-        new_query_orth = query_orthogroups.loc[:, subset]
 
-        # Add @ taxID to orthogroups
-        orthoname = col.replace("Orthogroup", "")
-        new_query_orth.loc[:, col] = new_query_orth.loc[:, col] + orthoname
+    # Wide to long: one row per gene and orthogroup column, all columns at once
+    out = query_orthogroups.melt(id_vars = non_ortho_cols, value_vars = list(ortho_cols), var_name = "level", value_name = "Orthogroup")
 
-        new_query_orth.columns = ["Orthogroup" if element==col else element for element in subset] # we rename Orthogroup column to just "Orthogroup" for future append
-        out = out.append(new_query_orth)
-    
-    out = out.reset_index()
+    # Add @ taxID to orthogroups
+    out["Orthogroup"] = out["Orthogroup"] + out["level"].str.replace("Orthogroup", "", regex = False)
+    out = out.drop(columns = ["level"])
     
     return out
 
@@ -309,25 +351,66 @@ def format_query_targets(query_targets):
     Capte80 | CDFCD@Metaz,UUIJO@Bilat | ENSG00009,ENSG00007                               | ZEP1,ASACA               | ENSP00009,ENSP00007
     
     All information is kept. GeneIDs, HGNCs, and ProteiIDs belonging to a unique Orthogroup are separated by "|", if belonging to differnt Orthogroups, separated by ",".
+    Columns come out as "#query", "Orthogroup" and then the ID columns in the order they have in query_targets. Missing IDs (NaN) are written as "-".
     """
     group_by_col = "#query"
-    non_query_cols = [colname for colname in query_targets.columns.values if not colname == group_by_col]
+    id_cols = [colname for colname in query_targets.columns.values if colname not in (group_by_col, "Orthogroup")]
+    columns = [group_by_col, "Orthogroup"] + id_cols
+
+    table = query_targets.loc[:, columns].astype(object)
+    table = table.where(table.notna(), "-")
+    table = table.sort_values([group_by_col, "Orthogroup"], kind = "stable")
 
-    tab_separated = query_targets.groupby(["#query", "Orthogroup"])[["Gene stable ID", "HGNC symbol", "Protein stable ID"][0]].apply("|".join).reset_index()
-    for col in ["Gene stable ID", "HGNC symbol", "Protein stable ID"][1:]:
-        subset = query_targets.groupby(["#query", "Orthogroup"])[col].apply("|".join).reset_index()
-        tab_separated[col] = subset.loc[:, col]
+    # First level: IDs of the same query and orthogroup, separated by "|"
+    first = ~table.duplicated(subset = [group_by_col, "Orthogroup"]).to_numpy()
+    number_of_rows = np.diff(np.append(np.flatnonzero(first), len(table)))
+    by_orthogroup = {col: utils.join_exploded(table[col], number_of_rows, "|") for col in id_cols}
+    keys = table.loc[first, [group_by_col, "Orthogroup"]]
 
-    out = tab_separated.groupby([group_by_col])[non_query_cols[0]].apply(",".join).reset_index()
-    for col in non_query_cols[1:]:
-        subset = tab_separated.groupby([group_by_col])[col].apply(",".join).reset_index()
-        out = subset.merge(out, how = "outer", on = group_by_col)
+    # Second level: orthogroups of the same query, separated by ","
+    first = ~keys.duplicated(subset = [group_by_col]).to_numpy()
+    number_of_orthogroups = np.diff(np.append(np.flatnonzero(first), len(keys)))
+    out = {group_by_col: keys[group_by_col].to_numpy()[first], "Orthogroup": utils.join_exploded(keys["Orthogroup"], number_of_orthogroups, ",")}
+    for col in id_cols:
+        out[col] = utils.join_exploded(by_orthogroup[col], number_of_orthogroups, ",")
 
-    return out 
+    return pd.DataFrame(out, columns = columns)
 
 
 
 
+def emapper_orthogroups(emapper, tax_levels):
+    """
+    Parses the "eggNOG_OGs" column of emapper once into a long table with one row per target protein and orthogroup, with columns "#query" and "eggNOG_OGs".
+    "GFBCH@33208|Metazoa" becomes "GFBCH@33208". Only orthogroups of tax_levels are kept, ordered by level in the order given and then as in emapper.
+
+    Attributes
+    ----------
+    emapper: pandas dataframe
+        emapper's output with columns "#query" and "eggNOG_OGs" (as a string or already split by emapper_reader.read_emapper(split = ["eggNOG_OGs"]))
+    tax_levels: list
+        Levels to keep, as in the orthogroup column names ("@33208")
+    """
+    match_column = "eggNOG_OGs"
+
+    # Orthogroup names and levels are parsed once per distinct orthogroup (the categories), not once per protein
+    tokens = emapper_reader.explode_tokens(emapper, match_column)
+    categories = tokens[match_column].cat.categories.to_series()
+    orthogroups = categories.str.split("|", n = 1).str[0].to_numpy(dtype = object)
+    level = "@" + categories.str.split("|", n = 1).str[0].str.rsplit("@", n = 1).str[-1]
+    level_order = level.map({tax_level: i for i, tax_level in enumerate(tax_levels)}).to_numpy(dtype = float)
+
+    codes = tokens[match_column].cat.codes.to_numpy()
+    kept = ~np.isnan(level_order[codes])
+    long = pd.DataFrame({
+        "#query": emapper["#query"].to_numpy()[tokens["row"].to_numpy()[kept]],
+        match_column: orthogroups[codes[kept]],
+        "level": level_order[codes[kept]],
+    })
+    long = long.sort_values("level", kind = "stable").drop(columns = ["level"]).reset_index(drop = True)
+    return long
+
+
 def emapper_annotation(emapper, query_orthogroups, keep_all_targets = True):
     '''
     This function takes in emapper results and a pre-created dataframe with the original querys and their respective orthogroups
@@ -336,35 +419,37 @@ def emapper_annotation(emapper, query_orthogroups, keep_all_targets = True):
     Attributes
     ----------
     emapper: pandas dataframe
-        emapper's output read by pandas, after removing the first 4 rows (metadata) with read_csv(skiprows = 4)
+        emapper's output as read by emapper_reader.read_emapper(), or its path
     query_orthogroups: pandas dataframe
         dataframe with all of your curated genes, their conversions to other IDs and their orthogroups. One orthogroup per row, so genes are duplicated (one gene can belong to multiple orthogroups)
     keep_all_targets: Boolean
         Whether to keep all target genes (from emapper) wether they share orthorgoup with your query (curated list) or not.
     '''
 
+    interning.reset() # codes only live during this annotation
+
     match_column = "eggNOG_OGs"
     ortho_cols = [colname for colname in query_orthogroups.columns.values if colname.startswith("Orthogroup")]
-    targets_with_orthogroups = pd.DataFrame()
     
-    emapper = emapper[["#query", "eggNOG_OGs"]]
-    emapper.dropna(inplace = True) # remove last three lines with emapper run data. The rest have "-" instead of NAs so we are not loosing anything
+    emapper = emapper_reader.read_emapper(emapper, ["#query", match_column]) # also removes the last three lines with emapper run data
 
     # Find othogroups matches between query_orthogroups and all of the genes of our target species
-    for col in ortho_cols:
-        tax_level = col.replace("Orthogroup", "")
-        subsetted_emapper = query_table(emapper, match_column = match_column, taxID = tax_level, data_origin = "emapper")
-        targets_with_orthogroups = targets_with_orthogroups.append(subsetted_emapper)
-    
-    targets_with_orthogroups[match_column] = targets_with_orthogroups[match_column].str.replace("\|.*$", "", regex = True)
+    targets_with_orthogroups = emapper_orthogroups(emapper, [col.replace("Orthogroup", "") for col in ortho_cols])
     
     # We have query_orthogroups with all orthorgoups of our curated list, and targets_with... with all target genes that have an rthorgoup in the same level at least
     # We merge them
     query_orthogroups = format_quer_orth(query_orthogroups, ortho_cols)
-    query_targets= query_orthogroups.merge(targets_with_orthogroups, how = "right", left_on="Orthogroup", right_on=match_column)
-    query_targets = query_targets.drop(columns = [match_column, "index"])
-    if not keep_all_targets:
-        query_targets = query_targets.dropna()
+
+    # Orthogroups are compared as int32 codes (see interning)
+    query_targets = interning.merge(query_orthogroups, targets_with_orthogroups, "Orthogroup", match_column, how = "right")
+    query_targets = query_targets.drop(columns = [match_column])
+    # Targets without any query orthogroup are kept once, as "-", only with keep_all_targets. Missing translations of matched genes are kept in both cases
+    matched = query_targets["Orthogroup"].notna()
+    if keep_all_targets:
+        unmatched = query_targets[~matched & ~query_targets["#query"].isin(query_targets.loc[matched, "#query"])]
+        query_targets = pd.concat([query_targets[matched], unmatched.drop_duplicates(subset = ["#query"])])
+    else:
+        query_targets = query_targets[matched]
 
     out = format_query_targets(query_targets)
 
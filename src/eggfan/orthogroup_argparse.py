@@ -1,19 +1,36 @@
 import orthogroup
+import eggnog_index
+import emapper_reader
 import argparse
+import sys
 import pandas as pd
 import numpy as np
 
 
-def main(argseggnog, argslookup, argsquery, argsemapper, argsmerge_on, flags):
+def main(argseggnog, argslookup, argsquery, argsemapper, argsmerge_on, flags, argsindex=None, argstaxid=None):
+
+    ## Reference species, each with its own lookup (or one lookup for all of them)
+    taxids = argstaxid if argstaxid else ["9606"]
+    if len(argslookup) not in (1, len(taxids)):
+        exit("Give one lookup table (-l) for all reference species or one per --taxid, in the same order")
+    lookups = [pd.read_csv(path, sep="\t") for path in argslookup]
+    lookup = {taxid: lookups[i if len(lookups) > 1 else 0] for i, taxid in enumerate(taxids)}
 
     ## Load datasets
-    eggnog = orthogroup.read_eggnog(argseggnog)
-    lookup = pd.read_csv(argslookup, sep="\t")
+    if argsindex is not None:
+        stale = eggnog_index.stale_sources(argsindex, argseggnog)
+        if len(stale) > 0:
+            exit("Eggnog index is out of date (" + "; ".join(stale) + "). Rebuild it with: orthogroup_argparse.py index")
+        eggnog = eggnog_index.read_index(argsindex, taxids)
+    else:
+        eggnog = orthogroup.read_eggnog(argseggnog, taxids)
     query = pd.read_csv(argsquery, header=None, sep="\t")
-    emapper = pd.read_csv(argsemapper, skiprows=4, sep="\t")
+    emapper = emapper_reader.read_emapper(argsemapper, ["#query", "eggNOG_OGs"], split=["eggNOG_OGs"])
     
     # translate eggnog Protein ENSEMBL IDs to whatever you want (default and recommended, ENSEMBL gene IDs)
-    translated_eggnog = orthogroup.egg_translate(eggnog, lookup)
+    # All reference species are translated in one pass and then put together, the query can have genes of any of them
+    translated_eggnog = orthogroup.egg_translate(eggnog, lookup, taxids)
+    translated_eggnog = pd.concat([translated_eggnog[taxid] for taxid in taxids], ignore_index=True)
     # print("* Eggnog files read")
 
     # QC
@@ -52,6 +69,49 @@ def main(argseggnog, argslookup, argsquery, argsemapper, argsmerge_on, flags):
 
 
 
+def index_main(argv):
+    """
+    orthogroup_argparse.py index -g members.tsv.gz [-g ...] -o index_dir
+    """
+    index_parser = argparse.ArgumentParser(
+        prog="orthogroup_argparse.py index",
+        description="Compiles eggnog members files into an index that annotation runs can load with --index",
+    )
+    index_parser.add_argument(
+        "-g",
+        "--eggnog",
+        action="append",
+        type=str,
+        metavar="",
+        required=True,
+        help="one or several paths to eggnog members files (members.tsv.gz, compressed or not). For each path add an -g flag",
+    )
+    index_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        metavar="",
+        required=True,
+        help="Directory where the index is saved. A previous index there is replaced",
+    )
+    index_parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=100000,
+        metavar="",
+        help="Number of orthogroups parsed at a time. Lower it if building the index runs out of memory",
+    )
+    index_args = index_parser.parse_args(argv)
+
+    manifest = eggnog_index.build_index(index_args.eggnog, index_args.output, index_args.chunksize)
+    print("* Index of %d eggnog files saved in %s" % (len(manifest["sources"]), index_args.output))
+
+
+if __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1] == "index":
+    index_main(sys.argv[2:])
+    exit()
+
+
 ##### Arguments parser #####
 
 parser = argparse.ArgumentParser(
@@ -63,17 +123,17 @@ parser.add_argument(
     action="append",
     type=str,
     metavar="",
-    required=True,
-    help="one or several paths to eggnog members files (de-compressed). For each path add an -eg flag",
+    help="one or several paths to eggnog members files (members.tsv.gz, compressed or not). For each path add an -eg flag. Not needed with --index",
 )
 # use like: function --eggnog "path" --eggnog "path" -eg "path"
 parser.add_argument(
     "-l",
     "--lookup",
+    action="append",
     type=str,
     metavar="",
     required=True,
-    help="Path to lookup table for eggnog translation",
+    help="Path to lookup table for eggnog translation. With several --taxid, add one -l per reference species in the same order, or a single one for all",
 )
 parser.add_argument(
     "-q",
@@ -99,6 +159,21 @@ parser.add_argument(
     required=True,
     help="Name of column from lookup file that will be ued to make the matching. This is, the name of the column with the final translation of the genes",
 )
+parser.add_argument(
+    "-i",
+    "--index",
+    type=str,
+    metavar="",
+    help="Directory with an index made by 'orthogroup_argparse.py index', used instead of parsing the eggnog files. If -g is also given, the index must have been built from those files",
+)
+parser.add_argument(
+    "-t",
+    "--taxid",
+    action="append",
+    type=str,
+    metavar="",
+    help="NCBI tax ID of the reference species of the query and lookup (default 9606, human). Add one -t per reference species to annotate against several of them at once",
+)
 parser.add_argument(
     "--QC",
     action="store_true",
@@ -115,6 +190,8 @@ parser.add_argument(
     help="Remove all gene ID conversions from the final output, keep only the IDs used in matched_column",
 )
 args = parser.parse_args()
+if args.eggnog is None and args.index is None:
+    parser.error("one of -g/--eggnog or -i/--index is required")
 
 flags = {}
 flags["keep_all_targets"] = args.keep_all_targets
@@ -122,4 +199,4 @@ flags["QC"] = args.QC
 flags["rm_conversions"] = args.rm_conversions
 
 if __name__ == '__main__':
-    main(args.eggnog, args.lookup, args.query, args.emapper, args.merge_on, flags)
+    main(args.eggnog, args.lookup, args.query, args.emapper, args.merge_on, flags, args.index, args.taxid)
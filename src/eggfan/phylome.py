@@ -9,13 +9,16 @@ import pandas as pd
 import numpy as np
 import os
 from tqdm import tqdm
-from geneannotator import utils
+from eggfan import utils
+from eggfan import interning
+from eggfan import columnar
+from eggfan import lookup_cache
 
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', 500)
 
-def initial_lookup(path):
+def initial_lookup(path, resolver = None):
 	"""
 	Based on all the genes from the inputted orthology table(s), make a lookup that translates all of them from UNIrpot ID to ENSEMBL ID and HGNC
 
@@ -23,18 +26,36 @@ def initial_lookup(path):
 	----------
 	path: string.
 		Path to phylome orthology table(s)
+	resolver: function (optional)
+		takes a set of Uniprot IDs and returns a lookup with UniProtKB, ENSEMBL_ID and HGNC columns. Default query_lookup(), Uniprot's API.
+		For offline runs use idmapping_store.store_resolver(store)
 	"""
-	genes = utils.human_genes_string(path)
+	if resolver is None:
+		resolver = query_lookup
 
-	uni_ens_lookup = utils.uniprot_request(genes, 'ID', "ENSEMBL_ID")
-	ens_HGNC = utils.uniprot_request(genes, 'ID', 'GENECARDS_ID')
+	genes = utils.human_genes(path)
+	lookup = resolver(genes)
+
+	return lookup, genes
 
-	uni_ens_lookup = utils.format_uniprot_output(uni_ens_lookup, ["UniProtKB", "ENSEMBL_ID"])
-	ens_HGNC = utils.format_uniprot_output(ens_HGNC, ["UniProtKB", "HGNC"])
+
+def query_lookup(genes, batch_size = 5000):
+	"""
+	Make a lookup that translates the given genes from UNIrpot ID to ENSEMBL ID and HGNC using Uniprot's API
+
+	Attributes
+	----------
+	genes: set
+		Human Uniprot IDs to translate, as made by utils.human_genes() (a string with them separated by " " also works)
+	batch_size: int
+		Maximum number of Uniprot IDs per request. Each batch is retried on its own if it fails
+	"""
+	uni_ens_lookup = utils.uniprot_requests(genes, 'ID', "ENSEMBL_ID", ["UniProtKB", "ENSEMBL_ID"], batch_size = batch_size)
+	ens_HGNC = utils.uniprot_requests(genes, 'ID', 'GENECARDS_ID', ["UniProtKB", "HGNC"], batch_size = batch_size)
 
 	lookup = uni_ens_lookup.merge(ens_HGNC, how="outer", left_on="UniProtKB", right_on="UniProtKB")
 
-	return lookup, genes
+	return lookup
 
 
 
@@ -42,34 +63,69 @@ def initial_lookup(path):
 def check_lost_genes(genes, lookup):
 	"""
 	Make a table with all Human uniprotIDs that were translated either to ENSEMBL_ID or HGNC or nothing, but not to the both of them (so, the ones where some translation is missing)
+	Columns are "UniProtKB" and "Translation", the translation they got ("" if none). Computed with sets and one pass over the lookup
 	
 	Attributes
 	----------
-	genes: string
-		All human Unirpot IDs to be translated, this is the IDs in th orthology tables
+	genes: string or set
+		All human Unirpot IDs to be translated, this is the IDs in th orthology tables. A string with the IDs separated by " " or any collection of IDs
 	lookup: pandas dataframe
 		lookup table with UnirpotKBs, ENSEMBL_ID and HGNC as columns with some missing translations to be completed
 	"""
+	human_genes = set(genes.split(" ")) if isinstance(genes, str) else set(genes)
+	human_genes.discard("")
 
-	human_genes = genes.split(" ")
-	
-	translated = list(lookup["UniProtKB"])
-	lost_genes = pd.DataFrame(human_genes)[~np.isin(human_genes, translated)]
-	lost_genes.columns= ["UniProtKB"] # genes that wewre not tranlated to anything
+	# genes that were not translated to anything
+	untranslated = sorted(human_genes.difference(lookup["UniProtKB"]))
 
-	no_genID = lookup[lookup["ENSEMBL_ID"].isna()]
-	no_HGNC = lookup[lookup["HGNC"].isna()]
+	# genes with only one of the translations, and the one they got
+	ENSEMBL_IDs = lookup["ENSEMBL_ID"].fillna("").to_numpy(dtype = object)
+	HGNCs = lookup["HGNC"].fillna("").to_numpy(dtype = object)
+	partial = (ENSEMBL_IDs == "") | (HGNCs == "")
 
-	lost_genes = lost_genes.merge(no_genID, how="outer", left_on="UniProtKB", right_on="UniProtKB")
-	lost_genes = lost_genes.merge(no_HGNC, how="outer", left_on="UniProtKB", right_on="UniProtKB")
-	
-	lost_genes.fillna("", inplace=True)
-	lost_genes["Translation"] = lost_genes.iloc[:, 1] + lost_genes.iloc[:, 3] + lost_genes.iloc[:, 2]
-	lost_genes.drop(columns=["ENSEMBL_ID_x", "HGNC_x", "ENSEMBL_ID_y", "HGNC_y"], inplace = True)
+	lost_genes = pd.DataFrame({
+		"UniProtKB": np.concatenate([np.array(untranslated, dtype = object), lookup["UniProtKB"].to_numpy(dtype = object)[partial]]),
+		"Translation": np.concatenate([np.full(len(untranslated), "", dtype = object), np.where(ENSEMBL_IDs != "", ENSEMBL_IDs, HGNCs)[partial]]),
+	})
+	lost_genes = lost_genes.drop_duplicates().sort_values("UniProtKB", kind = "stable").reset_index(drop = True)
 
 	return lost_genes
 
 
+def translation_coverage(path, lookup, chunksize = None):
+	"""
+	Per species coverage of the lookup. For each orthology table: number of distinct human Uniprot IDs in it and how many of them are translated
+	to ENSEMBL_ID and HGNC, only to one of them or not at all. The status of every Uniprot ID is computed once from the lookup and shared by all tables
+	
+	Attributes
+	----------
+	path: string
+		Path to phylome orthology table or to a folder with them
+	lookup: pandas dataframe
+		lookup table with UniProtKB, ENSEMBL_ID and HGNC as columns, as made by make_lookup()
+	chunksize: int (optional)
+		read the orthology tables in chunks of this many rows, see translate_orthologies()
+	"""
+	status = utils.translation_status(lookup)
+	statuses = ["translated", "ENSEMBL_ID only", "HGNC only", "untranslated"]
+
+	report = []
+	for fullpath in utils.directory_or_file(path):
+		if chunksize is None:
+			uniprots = pd.unique(utils.human_uniprots(utils.read_orthology_table(fullpath)["orthologs"]))
+		else:
+			uniprots = set()
+			for orthoTable in utils.iter_orthology_table(fullpath, chunksize):
+				uniprots.update(utils.human_uniprots(orthoTable["orthologs"]))
+			uniprots = list(uniprots)
+		counts = pd.Series(uniprots, dtype = object).map(status).fillna("untranslated").value_counts()
+		report.append([get_species_id(fullpath), len(uniprots)] + [int(counts.get(state, 0)) for state in statuses])
+
+	report = pd.DataFrame(report, columns = ["species", "human_uniprots"] + statuses)
+	report["coverage"] = (report["translated"] / report["human_uniprots"]).fillna(0).round(4)
+	return report
+
+
 def correct_uniprot_translation(up):
 	"""
 	Sometimes, you ask Uniprot to give you HGNC and it gives you ENSEMBL, so, find where that happens in the original lookup and put those errors inplace (also, when Uniprot does this, it doesnt find the ENsemble translation)
@@ -84,7 +140,7 @@ def correct_uniprot_translation(up):
 	return lookup
 
 
-def translate_from_HGNC(lost_genes, lookup):
+def translate_from_HGNC(lost_genes, lookup, max_workers = 8, rate = 10):
 	"""
 	For those human uniprots that only got HGNC translation, take that HGNC,  translate it to ENSEMBL_ID and update the lookup with that information
 	
@@ -94,23 +150,21 @@ def translate_from_HGNC(lost_genes, lookup):
 		product of check_lost_genes(). A dataframe with all Human UnirptoIDs from the orthology tables taht were not fully translated to ENSID or HGNC and the respective translation they were given
 	lookup: pandas dataframe
 		lookup table with UniprotKBs, ENSEMBL_ID and HGNC as columns with some missing translations to be completed
+	max_workers: int
+		number of requests to HGNC running at the same time
+	rate: number
+		maximum requests per second to HGNC
 	"""
 
 	# For those human uniprots that only got HGNC translation, take that HGNC and translate it to ENSEMBL_IDs
 	lost_genes = lost_genes.replace(r'^\s*$', np.nan, regex=True) # replace empty strings with NAs, for later dropna()
 	lost_genes = lost_genes.dropna()
-	table = []
-	for i in tqdm(lost_genes.index.values): # with progress bar
+	lost_genes = lost_genes[~lost_genes["Translation"].str.startswith("ENSG0000")]
 
-		HGNC = lost_genes.loc[i, "Translation"]
-		Uniprot = lost_genes.loc[i, "UniProtKB"]
+	# Symbols are sent deduplicated and several at once, progress bar is shown by HGNC_requests()
+	ENSGs = utils.HGNC_requests(lost_genes["Translation"], max_workers = max_workers, rate = rate)
 
-		if not HGNC.startswith("ENSG0000"):
-			
-			ENSG = utils.HGNC_request(gene = HGNC)
-			table.append([Uniprot, ENSG, HGNC])
-
-	table = pd.DataFrame.from_dict(table, orient = 'index').dropna()
+	table = pd.DataFrame({"UniProtKB": lost_genes["UniProtKB"], "ENSEMBL_ID": lost_genes["Translation"].map(ENSGs), "HGNC": lost_genes["Translation"]}).dropna()
 	table.columns = lookup.columns
 	Updated = lookup.merge(table, how = "left", left_on = "UniProtKB", right_on="UniProtKB")	
 
@@ -141,7 +195,7 @@ def translate_from_HGNC(lost_genes, lookup):
 
 ###########################
 #### Make Lookup table ####
-def make_lookup(path):
+def make_lookup(path, cache_dir = None, ttl = None, resolver = None, chunksize = None):
 	"""
 	Gets all uniprot IDs from the specified orthology tables and makes a lookup table that translates them to whatever you desire. Default Ensembl IDs.
 
@@ -149,29 +203,94 @@ def make_lookup(path):
 	----------
 	path: string.
 		Path to phylome orthology table. Path can be a file path or a path to a folder. In the latter case it will run the pipeline for the whole folder
-	out: string
-		path to file where you want to save the lookup. Default, not saving anything
+	cache_dir: string (optional)
+		path to directory with a persistent lookup cache. Only Uniprot IDs that are not in the cache yet are resolved, and they are added to it afterwards. Default, no cache
+	ttl: number (optional)
+		time to live of the cache entries in seconds. Older entries are resolved again. Default, entries never expire
+	resolver: function (optional)
+		takes a set of Uniprot IDs and returns a lookup with UniProtKB, ENSEMBL_ID and HGNC columns. Default resolve_lookup(), which uses Uniprot's and HGNC's APIs.
+		idmapping_store.store_resolver(store) answers from local UniProt and HGNC dumps instead, without network
+	chunksize: int (optional)
+		read the orthology tables in chunks of this many rows to collect their Uniprot IDs, see translate_orthologies()
 	"""
-	# make lookup table and a list with all Unirpot IDs to be translated
-	initial, uniprots = initial_lookup(path)
+	if resolver is None:
+		resolver = resolve_lookup
+
+	# set with all Unirpot IDs to be translated
+	genes = utils.human_genes(path, chunksize)
+
+	if cache_dir is None:
+		lookup = resolver(genes)
+	else:
+		lookup = lookup_cache.cached_lookup(genes, resolver, cache_dir, ttl)
+
+	return lookup
+
+
+def resolve_lookup(genes):
+	"""
+	Makes a lookup table that translates the given Uniprot IDs to ENSEMBL_ID and HGNC. Those that Uniprot only translates to HGNC are translated to ENSEMBL_ID with HGNC's API
+
+	Attributes
+	----------
+	genes: set
+		Human Uniprot IDs to translate, as made by utils.human_genes()
+	"""
+	# make lookup table
+	initial = query_lookup(genes)
 
 	# make list with all genes not fully translated (either ENSEMBL_ID or HGNC were not retrieved)
-	lost_genes = check_lost_genes(uniprots, initial)
+	lost_genes = check_lost_genes(genes, initial)
 
 	## Update table by translating HGNCs to ENSEMBLIDs when possible
-	if len(lost_genes) == 1 and lost_genes.iat[0,0] == "": # If there are no lost genes
+	if len(lost_genes) == 0: # If there are no lost genes
 		lookup = initial
 	else:
-		lookup = translate_from_HGNC(lost_genes, initial) # this is very slow beacuase genecards only allows one gene at a time to translate
+		lookup = translate_from_HGNC(lost_genes, initial) # genecards only allows one gene per request, so requests are sent concurrently
 
 
 	return lookup
 
 
 
+def write_lookup(lookup, path):
+	"""
+	Saves a lookup made by make_lookup() as TSV or Parquet (".parquet"), without its index. read_lookup() gives it back the same in both formats
+
+	Attributes
+	----------
+	lookup: pandas dataframe
+		output from make_lookup()
+	path: string
+		path to the output file
+	"""
+	if columnar.is_parquet(path):
+		columnar.write_table(lookup.reset_index(drop = True), path, list_columns = [])
+	else:
+		lookup.to_csv(path, sep = "\t", index = False)
+
+
+def read_lookup(path):
+	"""
+	Reads a lookup saved by write_lookup(), TSV or Parquet (".parquet"). Missing translations are NaN in both formats, as in the lookup made by make_lookup()
+
+	Attributes
+	----------
+	path: string
+		path to the lookup file
+	"""
+	if columnar.is_parquet(path):
+		return columnar.read_table(path)
+
+	# Only empty fields are missing, symbols like "NA" are kept
+	lookup = pd.read_csv(path, sep = "\t", keep_default_na = False, na_values = [""])
+	return lookup.drop(columns = ["Unnamed: 0"], errors = "ignore") # index saved by older versions
+
+
+
 
 # Make translated orthology tables
-def translate_orthologies(path, lookup, out = False):
+def translate_orthologies(path, lookup, out = False, chunksize = None, suffix = None, jobs = 1, format = "tsv"):
 	"""
 	Takes in one or several phylome orthology tables and translates their human UniprotIDs to ENSEMBL and HGNC, adding an extra column on each of the orthology tables inputed. Output is a list with a dataframe per orthology table
 	path: string.
@@ -180,43 +299,118 @@ def translate_orthologies(path, lookup, out = False):
 		output from make_lookup(). A lookup table with three columns. ENSEMBL_ID, HGNC and UniProtKB, with the translations of human genes in each of those ID types.
 	out: string (optional)
 		path to DIRECTORY where you want the file(s) to be saved in case you are using various files, in shih¡ch case they should have the default name taxID_orthogroup.tsv . They will be given a slightly different name than the original by default, adding the suffix "_human_". If you just have one file you can specify the output name in the path
+	chunksize: int (optional)
+		streaming mode. Read each orthology table in chunks of this many rows, translate them and append them to the output file straight away, so memory stays bounded no matter the size of the tables. Needs out. Output is the list of files written instead of the list of dataframes
+	suffix: string (optional)
+		if out is a directory, name the files <taxID><suffix>.tsv instead of adding "_human_"
+	jobs: int (optional)
+		number of processes translating tables at the same time. A table that fails is reported and left out, the rest are kept
+	format: string (optional)
+		"tsv" or "parquet". Format of the files saved in out if it is a directory. In Parquet the columns with several IDs are saved as lists (see columnar)
 	"""
 	orthology_tables = utils.directory_or_file(path)
-	lookup = lookup.dropna()
-	
-	tables = []
-	for fullpath in orthology_tables:
-		#species_id = get_species_id(fullpath)
-		# Import
-		orthoTable = pd.read_csv(fullpath, index_col=False, skiprows=[i for i in range(1,13)], sep = "\t")
-		
-		# Format orthotables and lookup
-		orthoTable = orthoTable[orthoTable["target_species"] == "Homo sapiens"]
-		orthoTable["ENSEMBL_ID"] = ""
+	lookup = utils.uniprot_index(lookup.dropna()) # built once and shared by all tables
 
-		# Translate
-		orthoTable = orthoTable.fillna("")
-		translated_orthoTable = utils.translate_uniprots(orthoTable, lookup)
+	if chunksize is not None and not isinstance(out, str):
+		exit("Streaming translation (chunksize) needs an output path (out)")
 
-		# Format
-		translated_orthoTable["ENSEMBL_ID"] = translated_orthoTable["ENSEMBL_ID"].replace("^,", "", regex=True) # the pipeline added an extra comma in the beginning by default
-		translated_orthoTable["ENSEMBL_ID"] = translated_orthoTable["ENSEMBL_ID"].replace(",,", ",-,", regex = True).replace(",,", ",-,", regex = True).replace("^,", "-,", regex = True).replace(",$", ",-", regex = True) # add dashes where missing genes (a relpace is repeated on purpose)
-		
-		tables.append(translated_orthoTable)
+	# The lookup goes to each process once, not once per table
+	state = {"lookup": lookup, "out": out, "chunksize": chunksize, "suffix": suffix, "format": format}
+	tables = utils.map_tables(translate_table, orthology_tables, jobs, set_worker_state, (state,))
+
+	if chunksize is not None: # already saved
+		return [file for file in tables if file is not None]
+
+	tables = [(fullpath, table) for fullpath, table in zip(orthology_tables, tables) if table is not None]
 	
 	# Save
-	if os.path.isdir(out):
-		for i in range(len(orthology_tables)):
-			filename = os.path.basename(orthology_tables[i])
-			file = out + filename.replace("_orthologs.tsv", "_human_orthologs.tsv")
-			tables[i].to_csv(file, index = False, sep = "\t")
+	if isinstance(out, str):
+		for fullpath, table in tables:
+			columnar.write_table(table, translated_path(fullpath, out, suffix, format))
+	
+
+	return [table for fullpath, table in tables]
+
+
+def set_worker_state(state):
+	"""
+	Keeps data shared by all tables (lookup, query...) in this process, so utils.map_tables() sends it to each worker only once
+	"""
+	_worker_state.clear()
+	_worker_state.update(state)
+
+
+_worker_state = {}
+
 
-	elif isinstance(out, str):
-		tables[0].to_csv(out, index = False, sep = "\t")
+def translate_table(fullpath):
+	"""
+	translate_orthologies() for a single orthology table, with the lookup and options set by set_worker_state()
+	"""
+	lookup = _worker_state["lookup"]
+
+	if _worker_state["chunksize"] is not None:
+		file = translated_path(fullpath, _worker_state["out"], _worker_state["suffix"], _worker_state["format"])
+		translate_orthology_chunks(fullpath, lookup, file, _worker_state["chunksize"])
+		return file
+
+	# Import, only human orthologs. Already parsed if the lookup was made in this run
+	orthoTable = utils.read_orthology_table(fullpath)
 	
+	# Format orthotables (makes a copy, the parsed table is shared)
+	orthoTable = orthoTable.fillna({"orthologs": "", "GeneName_target": ""})
+
+	# Translate. Missing genes get a "-" so positions match the orthologs column
+	translated_orthoTable = utils.translate_uniprots(orthoTable, lookup)
+
+	return translated_orthoTable
+
+
+def translate_orthology_chunks(fullpath, lookup, file, chunksize):
+	"""
+	Streaming version of translate_orthologies() for a single orthology table. Reads the table in chunks, translates them and appends them to file
+
+	Attributes
+	----------
+	fullpath: string
+		path to phylome orthology table
+	lookup: pandas series
+		lookup index made by utils.uniprot_index()
+	file: string
+		path to the output file, TSV or Parquet (".parquet"). Overwritten if it exists
+	chunksize: int
+		number of rows read at a time
+	"""
+	chunks = (
+		utils.translate_uniprots(orthoTable.fillna({"orthologs": "", "GeneName_target": ""}), lookup)
+		for orthoTable in utils.iter_orthology_table(fullpath, chunksize)
+		)
+	columnar.write_chunks(chunks, file)
+
+
+def translated_path(fullpath, out, suffix = None, format = "tsv"):
+	"""
+	Where translate_orthologies() saves the translation of the orthology table in fullpath. See translate_orthologies() docs
+	"""
+	if os.path.isdir(out):
+		filename = os.path.basename(fullpath)
+		if suffix is None:
+			return out + filename.replace("_orthologs.tsv", "_human_orthologs" + columnar.extension(format))
+		return out + table_taxID(fullpath) + suffix + columnar.extension(format)
+
+	return out
+
 
-	return tables
 
+def table_taxID(table):
+	"""
+	taxID of the seed species of an orthology table (dataframe or path to it). Names the files saved for the table, so translate_orthologies() and save_annotated() name them the same.
+	Taken from its first seed protein (<taxID>.<protein>), or from the file name (<taxID>_orthologs.tsv) if the table has no rows
+	"""
+	if isinstance(table, str):
+		taxID = utils.seed_taxID(table)
+		return get_species_id(table) if taxID is None else taxID
+	return table.iat[0, 0].split(".")[0]
 
 
 def get_species_id(ortho_tables):
@@ -229,15 +423,16 @@ def read_translated_tables(translated_orthologies):
 	Make allist with one dataframe if you have a file
 	Make a list of pandas dataframes if the input is a directory
 	Keep as is if input is a list of dataframes
+	Files can be TSV or Parquet (".parquet"), see columnar.read_table()
 	"""
 
 	if isinstance(translated_orthologies, str):
 		if os.path.isfile(translated_orthologies):
-			orthology_tables = [pd.read_csv(translated_orthologies, sep = "\t")]
+			orthology_tables = [columnar.read_table(translated_orthologies)]
 		else:
 			orthology_tables = []
 			for file in os.listdir(translated_orthologies):
-				table = pd.read_csv(translated_orthologies + file, sep = "\t")
+				table = columnar.read_table(translated_orthologies + file)
 				orthology_tables.append(table)
 
 	elif isinstance(translated_orthologies, list):
@@ -252,6 +447,22 @@ def read_translated_tables(translated_orthologies):
 
 
 
+def translated_table_paths(translated_orthologies):
+	"""
+	Same as read_translated_tables() but leaves the paths to the files unread, so they can be read one by one later
+	"""
+	if isinstance(translated_orthologies, str):
+		if os.path.isfile(translated_orthologies):
+			return [translated_orthologies]
+		return [translated_orthologies + file for file in os.listdir(translated_orthologies)]
+
+	elif isinstance(translated_orthologies, list):
+		return translated_orthologies
+
+	else: exit("translated_orthologies input is not a list nor a directory path")
+
+
+
 def subset_query_orthologs_and_position(orthoTable, human_query):
 	"""
 	Ths function takes the orthology tables (translated) and subsets them to include only the genes that have as orthologs ghuman genes in our query.
@@ -284,29 +495,34 @@ def subset_query_orthologs_and_position(orthoTable, human_query):
 		Containing a single column with all ENSEMBL gene IDs. They represent a module/family in humans that you want to identify in your target species. 
 	"""
 	
-	finalorthotable = pd.DataFrame(columns = {"##Seed_(co-)orthologs":[], "type":[], "ENSEMBL_ID":[], "orthologs": [], "GeneName_target":[], "ENSEMBL_query-only":[], "GeneName_target_query-only":[]})
-	query_position = pd.DataFrame({"GenID":[], "HGNC":[], "position_from_0":[], "number_of_IDs":[]})
-
-	# Create two dataframes: One with all phylome rows that contain TFs and one with position information on each one of the TFs found in the orthotable
-	for gene in human_query.iloc[:, 0].unique():
-
-		# Get all orthology tables rows that contain |a gene in the query| as ortholog
-		condition = orthoTable["ENSEMBL_ID"].str.contains(gene)
-		condition.fillna(value=False, inplace = True) # !!!Can be elimnated now that we have "-"??. those are one to one orthologs that were not translated
-		rows_perGene = orthoTable[["##Seed_(co-)orthologs", "type", "orthologs", "GeneName_target", "ENSEMBL_ID"]][condition]
-
-		# Make tables
-		if len(rows_perGene) > 0:
-			# add final subset per human ortholog
-			finalorthotable = finalorthotable.append(rows_perGene)
-
-			# Create table with which gene was found in which position in which row (in a row with various orthologs separated by commas, which one is the one that matches the query)
-			position = utils.find_position(rows_perGene, gene, column = "ENSEMBL_ID")
-			table = utils.query_position_table(rows_perGene, position, gene)
-			query_position = query_position.append(table)
+	columns = ["##Seed_(co-)orthologs", "type", "ENSEMBL_ID", "orthologs", "GeneName_target", "ENSEMBL_query-only", "GeneName_target_query-only"]
+	genes = human_query.iloc[:, 0].unique()
+
+	# Inverted index of the table (genID -> row, position), joined once with the query
+	index = utils.ensembl_index(orthoTable)
+	matches, rows = query_matches(index, "GenID", genes)
+
+	# Rows of the table with at least one gene in the query
+	finalorthotable = orthoTable.iloc[rows].reindex(columns = columns)
+
+	# Create table with which gene was found in which position in which row (in a row with various orthologs separated by commas, which one is the one that matches the query)
+	# genIDs of the same Uniprot ID that are not in the query are substituted by "-"
+	matched_positions = pd.MultiIndex.from_frame(index[["row", "position_from_0"]]).isin(pd.MultiIndex.from_frame(matches[["row", "position_from_0"]]))
+	positions = index[matched_positions]
+	positions = positions.assign(GenID = np.where(positions.index.isin(matches.index), interning.ids(positions["GenID"].to_numpy()), "-"))
+
+	first = positions[["row", "position_from_0"]].ne(positions[["row", "position_from_0"]].shift()).any(axis = 1).to_numpy()
+	query_position = positions.loc[first, ["row", "position_from_0"]].reset_index(drop = True)
+	query_position["GenID"] = utils.join_exploded(positions["GenID"], np.diff(np.append(np.flatnonzero(first), len(positions))), "|")
+	HGNC_symbols, number_of_IDs = utils.explode_positions(orthoTable["GeneName_target"])
+	HGNC_symbols = HGNC_symbols.rename(columns = {"ID": "HGNC"})
+	query_position = query_position.merge(HGNC_symbols, how = "left", on = ["row", "position_from_0"])
+	query_position["HGNC"] = interning.ids(query_position["HGNC"].to_numpy())
+	query_position["number_of_IDs"] = number_of_IDs.to_numpy()[query_position["row"].to_numpy()] # total number of symbols translated or not
 
 	# Final formatting
-	finalorthotable = finalorthotable[~finalorthotable.index.duplicated(keep='first')]
+	query_position.index = orthoTable.index[query_position["row"].to_numpy()]
+	query_position = query_position[["GenID", "HGNC", "position_from_0", "number_of_IDs"]]
 	query_position = query_position.rename_axis('idx').sort_values(by = ['idx', 'position_from_0'])
 
 	return finalorthotable, query_position
@@ -327,31 +543,58 @@ def HGNC_subset_query_orthologs_and_position(orthoTable, human_query):
 	human_query: pandas dataframe
 		Containing a single column with all HGNC (Genecards) gene IDs. They represent a module/family in humans that you want to identify in your target species. 
 	"""
-	symbol_col_name = "GeneName_target"
-	finalorthotable = pd.DataFrame(columns = {"##Seed_(co-)orthologs":[], "type":[], "GeneName_target":[], "GeneName_target_query-only":[]})
-	query_position = pd.DataFrame({"HGNC":[], "position_from_0":[], "number_of_IDs":[]})
-	
-	for gene in human_query.iloc[:, 0].unique():
-		condition = orthoTable[symbol_col_name].str.contains("(?:^" + gene +"$|^" + gene + ",|," + gene +",|," + gene + "$)", regex = True)
-		condition.fillna(value=False, inplace = True) # fill in one to one orthologs that were not trnalated
-		rows_perGene = orthoTable[["##Seed_(co-)orthologs", "type",  "GeneName_target"]][condition]
-
-		if len(rows_perGene) > 0:
-			# add final subset per human ortholog
-			finalorthotable = finalorthotable.append(rows_perGene)
-
-			# Create table with which gene was found in which position in which row
-			position = utils.find_position(rows_perGene, gene, column = symbol_col_name, HGNC = True)
-			table = utils.query_position_table(rows_perGene, position, gene, HGNC = True)
-			query_position = query_position.append(table)
-	
-	finalorthotable = finalorthotable[~finalorthotable.index.duplicated(keep='first')]
+	columns = ["##Seed_(co-)orthologs", "type", "GeneName_target", "GeneName_target_query-only"]
+	genes = human_query.iloc[:, 0].unique()
+
+	# Tokenized symbols of the table (symbol -> row, position), joined once with the query. Exact matches, no regex
+	symbols, number_of_IDs = utils.explode_positions(orthoTable["GeneName_target"])
+	matches, rows = query_matches(symbols, "ID", genes)
+
+	# Rows of the table with at least one gene in the query
+	finalorthotable = orthoTable.iloc[rows].reindex(columns = columns)
+
+	# Create table with which gene was found in which position in which row
+	query_position = pd.DataFrame({
+		"HGNC": interning.ids(matches["ID"].to_numpy()),
+		"position_from_0": matches["position_from_0"].to_numpy(),
+		"number_of_IDs": number_of_IDs.to_numpy()[matches["row"].to_numpy()], # total number of symbols
+		}, index = orthoTable.index[matches["row"].to_numpy()])
 	query_position = query_position.rename_axis('idx').sort_values(by = ['idx', 'position_from_0'])
 
 	return finalorthotable, query_position
 
 
 
+def query_matches(index, column, genes):
+	"""
+	Joins an exploded orthology table (from utils.ensembl_index() or utils.explode_positions()) with the query genes. Only the first position of a gene in a row counts.
+	Returns the matching rows of index, and the positions of the orthology table rows with at least one match. These are sorted by the first query gene they contain
+	and then by their order in the table, the same order as when the table was searched for one query gene after another.
+
+	Attributes
+	----------
+	index: pandas dataframe
+		one ID per row, with the "row" of the orthology table it comes from
+	column: string
+		column of index with the IDs, as int32 codes (see interning)
+	genes: array
+		unique query genes, in the order of the query
+	"""
+	# Position in the query of every code, -1 if it is not a query gene. The extra last slot is for code -1 (missing IDs)
+	gene_codes = interning.codes_of(genes)
+	known = gene_codes >= 0
+	order = np.full(interning.size() + 1, -1, dtype = np.int64)
+	order[gene_codes[known]] = np.flatnonzero(known)
+
+	query_order = pd.Series(order[index[column].to_numpy()], index = index.index)
+	matches = index[query_order.to_numpy() >= 0].drop_duplicates(subset = ["row", column])
+
+	rows = query_order[matches.index].groupby(matches["row"]).min().sort_values(kind = "stable")
+
+	return matches, rows.index.to_numpy()
+
+
+
 def add_queryonly_columns(finalorthotable, query_position, HGNC = False):
 	"""
 	Add to the final tables columns specifying which of the genes in the orothologs column appears in the human query
@@ -366,19 +609,20 @@ def add_queryonly_columns(finalorthotable, query_position, HGNC = False):
 		Whether you want the version for the norml pipelien of the HGNC version
 	"""
 
-	index = finalorthotable.index.values
-	for i in index:
-		rows = query_position[query_position.index == i] # make a dataframe with all the TFs found in one row (i) in finalorthotable
-
-		rows.set_index("position_from_0", inplace=True)
-		new_index = list(range(int(rows.number_of_IDs.iloc[0])))
+	# One slot per gene of each row, all filled with "-". Query genes are scattered into their slots and every row is joined back at once
+	number_of_IDs = query_position.groupby(level = 0)["number_of_IDs"].first()
+	number_of_IDs = number_of_IDs.reindex(finalorthotable.index).fillna(0).to_numpy(dtype = int)
+	starts = np.cumsum(number_of_IDs) - number_of_IDs
 
-		rows = rows.reindex(new_index, fill_value="-") # If a gene was not a Tf substitue it with "-"
-		rows.index= list(range(len(rows.index.values)))
+	row = finalorthotable.index.get_indexer(query_position.index)
+	slot = starts[row] + query_position["position_from_0"].to_numpy(dtype = int)
 
-		if not HGNC:
-			finalorthotable["ENSEMBL_query-only"][finalorthotable.index == i] = ','.join(list(rows["GenID"]))
-		finalorthotable["GeneName_target_query-only"][finalorthotable.index == i] = ','.join(list(rows["HGNC"]))
+	columns = {"GeneName_target_query-only": "HGNC"} if HGNC else {"ENSEMBL_query-only": "GenID", "GeneName_target_query-only": "HGNC"}
+	finalorthotable = finalorthotable.copy()
+	for column, source in columns.items():
+		values = np.full(number_of_IDs.sum(), "-", dtype = object)
+		values[slot] = query_position[source].to_numpy(dtype = object)
+		finalorthotable[column] = utils.join_exploded(values, number_of_IDs, ",")
 
 	# remove this after adding drop_duplicates in the very bginning.:
 	finalorthotable = finalorthotable.drop_duplicates() # It would be better to put this drop duplicates in the beginning, for each translated table, to make things a bit faster.
@@ -388,7 +632,7 @@ def add_queryonly_columns(finalorthotable, query_position, HGNC = False):
 
 
 
-def find_query_orthologs(query_path, translated_orthologies):
+def find_query_orthologs(query_path, translated_orthologies, jobs = 1, chunksize = None):
 	"""
 	Find in phylome (all genes/proteins of a target species) which genes/proteins have as orthologs any gene/protein in your human query. Make a table out of it.
 
@@ -398,28 +642,59 @@ def find_query_orthologs(query_path, translated_orthologies):
 		Path to list of human ENSEMBL IDs that represent the gene module/family you want to search in phylome species.
 	translated_orthologies: list or path
 		Phylome orthology tables with human orthologs Unitrots translated to ENsemblIDs. This is, the product of translate_orthologies(). You can input a path to a folder containing all of those tranlslate orthologies or a lists object full of pandas dataframes.
+	jobs: int (optional)
+		number of processes annotating tables at the same time. A table that fails is reported and left out, the rest are kept
+	chunksize: int (optional)
+		read the translated tables (paths) in chunks of this many rows keeping only the rows with query genes, so no table is ever whole in memory
 
 	"""
 
 	## Import data
 	human_query = pd.read_csv(query_path)
-	orthology_tables = read_translated_tables(translated_orthologies)
+	orthology_tables = translated_table_paths(translated_orthologies) # with paths, each process reads its own tables
 
 	# Subset and add columns
-	tables = []
-	for orthoTable in orthology_tables:
+	tables = utils.map_tables(annotate_table, orthology_tables, jobs, set_worker_state, ({"human_query": human_query, "chunksize": chunksize},))
 
-		finalorthotable, query_position = subset_query_orthologs_and_position(orthoTable, human_query)
-		
-		finalorthotable = add_queryonly_columns(finalorthotable, query_position)
+	return [table for table in tables if table is not None]
 
-		tables.append(finalorthotable)
 
+def read_query_rows(path, human_query, chunksize):
+	"""
+	Reads a translated orthology table in chunks of chunksize rows and keeps only the rows with genes of human_query (ID lists as in read_table(lists = True)).
+	Rows keep their index and order, so annotating them gives the same table as annotating the whole table
+	"""
+	rows = []
+	for chunk in columnar.iter_table(path, chunksize, lists = True):
+		finalorthotable, _ = subset_query_orthologs_and_position(chunk, human_query)
+		rows.append(chunk[chunk.index.isin(finalorthotable.index)])
 
-	return tables
+	if len(rows) == 0: # no rows at all
+		return columnar.read_table(path, lists = True)
+	return pd.concat(rows)
 
 
-def save_annotated(annotated_tables, directory, suffix = "_annotated_orthology"):
+def annotate_table(orthoTable):
+	"""
+	find_query_orthologs() for a single translated orthology table (dataframe or path), with the query set by set_worker_state()
+	"""
+	interning.reset() # codes only live while this table is annotated
+
+	# Parquet tables keep their ID lists, only the rows that match the query are joined back into strings
+	if isinstance(orthoTable, str) and _worker_state.get("chunksize") is not None:
+		orthoTable = read_query_rows(orthoTable, _worker_state["human_query"], _worker_state["chunksize"])
+	elif isinstance(orthoTable, str):
+		orthoTable = columnar.read_table(orthoTable, lists = True)
+
+	finalorthotable, query_position = subset_query_orthologs_and_position(orthoTable, _worker_state["human_query"])
+	finalorthotable = columnar.join_columns(finalorthotable)
+	
+	finalorthotable = add_queryonly_columns(finalorthotable, query_position)
+
+	return finalorthotable
+
+
+def save_annotated(annotated_tables, directory, suffix = "_annotated_orthology", format = "tsv"):
 	"""
 	Saves a list of dataframes into separate dataframes with specific names
 
@@ -431,6 +706,8 @@ def save_annotated(annotated_tables, directory, suffix = "_annotated_orthology")
 		path to directory where you want to save the files
 	suffix: string
 		name of output file will be <taxID><suffix>.tsv . Default "_annotated_orthology"
+	format: string
+		"tsv" or "parquet" (<taxID><suffix>.parquet, columns with several IDs saved as lists, see columnar)
 	"""
 	annotated_tables = eliminate_empty_dataframes(annotated_tables)
 	
@@ -446,10 +723,9 @@ def save_annotated(annotated_tables, directory, suffix = "_annotated_orthology")
 
 	# Save
 	for table in annotated_tables:
-		taxID = table.iat[0, 0].split(".")[0]
-		file = directory + taxID + suffix + ".tsv"
+		file = directory + table_taxID(table) + suffix + columnar.extension(format)
 
-		table.to_csv(file, index = False, sep = "\t")
+		columnar.write_table(table, file)
 
 
 def eliminate_empty_dataframes(annotated_tables):
@@ -467,37 +743,37 @@ def eliminate_empty_dataframes(annotated_tables):
 ###### HGNC method #########
 
 # Make final tables with GeneID(s) species | orthology type | all human Ensembl orthologs | All HGNCs | TF EnsemblIDs | TF HGNCs
-def annotate_orthology_HGNC_method(query_path, orthology_tables_path):
+def annotate_orthology_HGNC_method(query_path, orthology_tables_path, jobs = 1):
 	"""
 	orthology_tables_path: string
 		path to folder containing orthology tables you want to annotate. Alternatively you can input a path to a single file
+	jobs: int (optional)
+		number of processes annotating tables at the same time. A table that fails is reported and left out, the rest are kept
 	"""
 	## Import data
 	human_query = pd.read_csv(query_path, header=None)
 	orthology_tables_path = utils.directory_or_file(orthology_tables_path)
 
-	tables = []
-	for file in orthology_tables_path:
-		# Import
-		orthoTable = pd.read_csv(file, index_col=False, skiprows=[i for i in range(1,13)], sep = "\t")
+	tables = utils.map_tables(annotate_table_HGNC, orthology_tables_path, jobs, set_worker_state, ({"human_query": human_query},))
+
+	return [table for table in tables if table is not None]
 
-		# Format
-		orthoTable = orthoTable[orthoTable["target_species"] == "Homo sapiens"] ## Added for the HGNC pipeline
 
-		# Subset dataframes and locate query genes
-		finalorthotable, query_position = HGNC_subset_query_orthologs_and_position(orthoTable, human_query)
-		#### HGNC exclusive part ####
-		# Remove duplicates, because thep ipeline somehow duplicates the genes found in position 0. But account for the index, in case sma ortholog found in same position but itn different line
-		query_position['index'] = query_position.index
-		query_position.drop_duplicates(inplace=True)
-		del query_position['index']
-		##############################
+def annotate_table_HGNC(file):
+	"""
+	annotate_orthology_HGNC_method() for a single orthology table, with the query set by set_worker_state()
+	"""
+	interning.reset() # codes only live while this table is annotated
 
-		finalorthotable = add_queryonly_columns(finalorthotable, query_position, HGNC = True)
+	# Import, only human orthologs
+	orthoTable = utils.read_orthology_table(file)
 
-		tables.append(finalorthotable)
+	# Subset dataframes and locate query genes. Positions are exact, so no duplicates to remove
+	finalorthotable, query_position = HGNC_subset_query_orthologs_and_position(orthoTable, _worker_state["human_query"])
 
-	return tables
+	finalorthotable = add_queryonly_columns(finalorthotable, query_position, HGNC = True)
+
+	return finalorthotable
 
 
 
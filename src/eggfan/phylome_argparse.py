@@ -1,10 +1,13 @@
 from typing import Annotated
 import phylome
 import utils
+import idmapping_store
+import columnar
 import pandas as pd
 import os
 import argparse
 import shutil
+import sys
 
 
 # 1. which method?
@@ -30,27 +33,34 @@ import shutil
 # flags = [HGNC]
 
 
-def main(query, ortho_tables, output, input_lookup, suffix, flags):
+def main(query, ortho_tables, output, input_lookup, suffix, flags, cache_dir=None, cache_ttl=None, chunksize=None, jobs=1, idmapping=None, output_format="tsv"):
 
     if suffix == None:
         suffix = "_annotated_orthology"
 
     if flags["HGNC"]:
-        annotated_tables = phylome.annotate_orthology_HGNC_method(query, ortho_tables)
+        annotated_tables = phylome.annotate_orthology_HGNC_method(query, ortho_tables, jobs=jobs)
     else:
-        lookup = get_lookup(ortho_tables, input_lookup)
+        # Already translated tables are only read, no lookup is needed
+        lookup = None if flags["input_translated"] else get_lookup(ortho_tables, input_lookup, cache_dir=cache_dir, cache_ttl=cache_ttl, idmapping=idmapping, chunksize=chunksize)
+        if flags.get("coverage") and not flags["input_translated"]:
+            phylome.translation_coverage(ortho_tables, lookup, chunksize).to_csv(output + "lookup_coverage.tsv", sep="\t", index=False)
         translated_orthologies = get_translated_orthologies(
-            ortho_tables, lookup, flags["input_translated"]
+            ortho_tables, lookup, flags["input_translated"], output, chunksize, jobs, output_format
         )
-        annotated_tables = phylome.find_query_orthologs(query, translated_orthologies)
+        annotated_tables = phylome.find_query_orthologs(query, translated_orthologies, jobs=jobs, chunksize=chunksize)
     
         # These two lines below save as long as you didn't input the lookup and/or the translated tables
-        save_lookup(lookup, output, flags["input_translated"], input_lookup)
-        save_translated(translated_orthologies, output, flags["input_translated"])
+        save_lookup(lookup, output, flags["input_translated"], input_lookup, output_format)
+        if chunksize is None: # streamed tables are already saved
+            save_translated(translated_orthologies, output, flags["input_translated"], output_format)
     
-    phylome.save_annotated(annotated_tables, output, suffix)
+    phylome.save_annotated(annotated_tables, output, suffix, output_format)
     print("done")
 
+    rss = utils.peak_rss()
+    if rss is not None:
+        print("* Peak memory: %.0f MB" % rss)
 
 
 
@@ -58,27 +68,43 @@ def main(query, ortho_tables, output, input_lookup, suffix, flags):
 
 
 
-def get_translated_orthologies(ortho_tables, lookup, input_translated):
+
+def get_translated_orthologies(ortho_tables, lookup, input_translated, output=None, chunksize=None, jobs=1, output_format="tsv"):
     """
-    either read the orthology table(s) or make them
+    either read the orthology table(s) (TSV or Parquet) or make them. With chunksize they are streamed straight into the translated tables folder
+    and the paths of the files written are returned instead of the tables
     """
     if input_translated:
 
-        translated_orthologies = phylome.read_translated_tables(ortho_tables)
+        translated_orthologies = phylome.translated_table_paths(ortho_tables) # each table is read when it is annotated
+
+    elif chunksize is not None:
+
+        save_dir = make_translated_dir(output)
+        translated_orthologies = phylome.translate_orthologies(
+                ortho_tables, lookup, out=save_dir + "/", chunksize=chunksize, suffix="_translated", jobs=jobs, format=output_format
+            )
 
     else:
         
         translated_orthologies = phylome.translate_orthologies(
-                ortho_tables, lookup
+                ortho_tables, lookup, jobs=jobs
             )
     return translated_orthologies
 
 
-def get_lookup(ortho_tables, lookup, overwrite=False):
+def get_lookup(ortho_tables, lookup, overwrite=False, cache_dir=None, cache_ttl=None, idmapping=None, chunksize=None):
+    """
+    either read the lookup (TSV or Parquet) or make it, using the lookup cache if given. cache_ttl is in days. With idmapping (path to a store made with
+    "phylome_argparse.py idmapping") the lookup is made offline from it instead of Uniprot's and HGNC's APIs. With chunksize the orthology tables are
+    read in chunks to collect their Uniprot IDs
+    """
     if lookup is not None:
-        lookup = pd.read_csv(lookup, sep="\t", keep_default_na=False)
+        lookup = phylome.read_lookup(lookup)
     else:
-        lookup = phylome.make_lookup(ortho_tables)
+        ttl = None if cache_ttl is None else cache_ttl * 24 * 60 * 60
+        resolver = None if idmapping is None else idmapping_store.store_resolver(idmapping)
+        lookup = phylome.make_lookup(ortho_tables, cache_dir=cache_dir, ttl=ttl, resolver=resolver, chunksize=chunksize)
     return lookup
 
 
@@ -87,28 +113,86 @@ def read_translated_ontologies(path_to_translated_orth):
     return translated_orthologies
 
 
-def save_lookup(lookup, output, input_translated, input_lookup):
+def save_lookup(lookup, output, input_translated, input_lookup, output_format="tsv"):
     """
     Save lookup or not depending on context
     """
     no_save = [not input_translated, not isinstance(input_lookup, str)]
     if all(no_save): # Only if there is no input_trans and no input_lookup then save
-        lookup.to_csv(output + "lookup.tsv", sep="\t")
+        phylome.write_lookup(lookup, output + "lookup" + columnar.extension(output_format))
 
 
-def save_translated(annotated_tables, output, input_translated):
+def save_translated(annotated_tables, output, input_translated, output_format="tsv"):
     """
     Save translated orthotables or not depending on context
     """
     if not input_translated:
-        save_dir = output + "/translated_orthology_tables"
-        if os.path.exists(save_dir):
-            shutil.rmtree(save_dir)
-        os.mkdir(save_dir)
-        phylome.save_annotated(annotated_tables, save_dir, suffix = "_translated")
+        save_dir = make_translated_dir(output)
+        phylome.save_annotated(annotated_tables, save_dir, suffix = "_translated", format = output_format)
+
+
+def make_translated_dir(output):
+    """
+    Make an empty folder for the translated orthotables inside output
+    """
+    save_dir = output + "/translated_orthology_tables"
+    if os.path.exists(save_dir):
+        shutil.rmtree(save_dir)
+    os.mkdir(save_dir)
+    return save_dir
+
 
 
 
+def idmapping_main(argv):
+    """
+    phylome_argparse.py idmapping -u idmapping_selected.tab.gz -n hgnc_complete_set.txt -o store.sqlite
+    """
+    idmapping_parser = argparse.ArgumentParser(
+        prog="phylome_argparse.py idmapping",
+        description="Loads UniProt's and HGNC's ID mapping dumps into a local store that lookups can be made from with --idmapping_store, without internet",
+    )
+    idmapping_parser.add_argument(
+        "-u",
+        "--uniprot",
+        type=str,
+        metavar="FILE",
+        required=True,
+        help="Path to UniProt's idmapping_selected.tab.gz (https://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/idmapping/)",
+    )
+    idmapping_parser.add_argument(
+        "-n",
+        "--hgnc",
+        type=str,
+        metavar="FILE",
+        required=True,
+        help="Path to HGNC's hgnc_complete_set.txt (https://www.genenames.org/download/archive/)",
+    )
+    idmapping_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        metavar="FILE",
+        required=True,
+        help="Path of the store to make. A previous store there is replaced",
+    )
+    idmapping_parser.add_argument(
+        "--taxid",
+        type=str,
+        default="9606",
+        metavar="",
+        help="NCBI tax ID of the species kept from idmapping_selected. Default human (9606)",
+    )
+    idmapping_args = idmapping_parser.parse_args(argv)
+
+    metadata = idmapping_store.build_store(idmapping_args.uniprot, idmapping_args.hgnc, idmapping_args.output, idmapping_args.taxid)
+    print("* ID-mapping store with %d Uniprot entries saved in %s" % (metadata["entries"], idmapping_args.output))
+
+
+if __name__ == '__main__' and len(sys.argv) > 1 and sys.argv[1] == "idmapping":
+    idmapping_main(sys.argv[2:])
+    exit()
+
 
 if True:
     ##### Arguments parser #####
@@ -158,11 +242,63 @@ if True:
         help="Optional. Path to lookup table that will be used to make translated orthology tables"
     )
 
+    parser.add_argument(
+        "--lookup_cache",
+        type=str,
+        metavar="DIR",
+        required=False,
+        help="Optional. Directory with a persistent lookup cache. Only Uniprot IDs never seen in previous runs are resolved online, and then added to the cache"
+    )
+    parser.add_argument(
+        "--cache_ttl",
+        type=float,
+        metavar="DAYS",
+        required=False,
+        help="Optional. Days after which an entry in --lookup_cache is resolved again. Default, entries never expire"
+    )
+
+    parser.add_argument(
+        "--idmapping_store",
+        type=str,
+        metavar="FILE",
+        required=False,
+        help="Optional. Make the lookup offline from a store built with 'phylome_argparse.py idmapping' instead of Uniprot's and HGNC's APIs. Can be combined with --lookup_cache",
+    )
+
     parser.add_argument(
         "--input_translated",
         action="store_true",
         help="If true a new translation of the orthology tables will not be made. The pipeline will be run with the orthology tables in --ortho_tables ",
     )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        metavar="ROWS",
+        required=False,
+        help="Optional. Stream the pipeline: read the orthology tables in chunks of ROWS rows, both to build the lookup and to append them straight to the translated tables, and annotate the translated tables chunk by chunk, so memory stays bounded for tables larger than RAM",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        metavar="N",
+        default=1,
+        help="Optional. Number of processes translating and annotating orthology tables at the same time. Default 1",
+    )
+    parser.add_argument(
+        "--coverage",
+        action="store_true",
+        help="Optional. Save lookup_coverage.tsv in --output: for each species, how many of its human Uniprot IDs the lookup translates to ENSEMBL_ID and HGNC, to only one of them or to nothing",
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        choices=columnar.FORMATS,
+        default="tsv",
+        dest="output_format",
+        metavar="",
+        help="Optional. Format of the lookup, translated and annotated tables saved in --output: tsv (default) or parquet. In parquet the columns with several IDs are lists, and the tables are read back by --input_translated and --lookup without parsing text",
+    )
     # HGNC method
     parser.add_argument(
         "--HGNC",
@@ -175,6 +311,7 @@ if True:
     flags = {}
     flags["input_translated"] = args.input_translated
     flags["HGNC"] = args.hgnc
+    flags["coverage"] = args.coverage
 
     if __name__ == '__main__':
-       main(args.query, args.ortho_tables, args.output, args.lookup, args.suffix, flags)
+       main(args.query, args.ortho_tables, args.output, args.lookup, args.suffix, flags, args.lookup_cache, args.cache_ttl, args.chunksize, args.jobs, args.idmapping_store, args.output_format)
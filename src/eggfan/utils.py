@@ -7,43 +7,139 @@ import re
 import httplib2 as http
 import json
 import time
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from tqdm import tqdm
+from eggfan import interning
+
+
+def uniprot_index(lookup):
+    """
+    Builds a hash index from the lookup that maps every human Uniprot ID to all its ENSEMBL genIDs, already separated by "|".
+    It is built once per lookup and can be reused to translate as many orthology tables as needed.
+
+    Attributes
+    ----------
+    lookup: pandas dataframe.
+                    Lookup table with at least the columns "UniProtKB" and "ENSEMBL_ID"
+    """
+    lookup = lookup[["UniProtKB", "ENSEMBL_ID"]].drop_duplicates()  # eliminate duplicates
+
+    # put all genIDs of a Uniprot ID next to each other, keeping the order of the lookup
+    codes, uniprots = pd.factorize(lookup["UniProtKB"])
+    order = np.argsort(codes, kind="stable")
+    genIDs = join_exploded(lookup["ENSEMBL_ID"].to_numpy()[order], np.bincount(codes), "|")
+
+    index = pd.Series(genIDs, index=uniprots, name="ENSEMBL_ID")
+
+    return index
+
+
+def join_exploded(values, number_of_values, sep):
+    """
+    Opposite of exploding a column. Joins back consecutive values into one string per row, without grouping.
+
+    Attributes
+    ----------
+    values: array-like.
+                    Exploded strings, all values of a row next to each other
+    number_of_values: array-like.
+                    How many consecutive values belong to each row
+    sep: string.
+                    Separator placed between the values of a row
+    """
+    values = np.asarray(values, dtype=object).tolist()
+    ends = np.cumsum(number_of_values)
+    starts = ends - number_of_values
+
+    return [sep.join(values[start:end]) for start, end in zip(starts, ends)]
 
 
 def translate_uniprots(orthotable, lookup):
     """
-    Takes all orthology tables and translates each of the human Uniprot Orthologs into ENSEMBL IDs.
-    Then it makes a new orhology table with the translations in extra columns.
+    Takes an orthology table and translates each of the human Uniprot Orthologs into ENSEMBL IDs in a new "ENSEMBL_ID" column.
     A single uniprot ID can have more than one ENSEMBL genID, so the pipeline separates ENSEMBL within a single Unirpot ID
-    by "|" and ENS IDs from different Uniprots by ","
+    by "|" and ENS IDs from different Uniprots by ",". Uniprot IDs without translation are substituted by "-" so the position
+    of each ENSEMBL genID matches the position of its Uniprot ID in the "orthologs" column.
+
+    The whole table is translated at once: orthologs are exploded to one Uniprot ID per row, mapped through the index and joined back.
 
     Attributes
     ----------
-    orthotable: String.
-                    Path to folder with orthology tables
-    lookup: pandas dataframe.
-                    Two columns: "Gene stable ID", "UniProtKB Gene Name ID"
+    orthotable: pandas dataframe.
+                    Orthology table with an "orthologs" column
+    lookup: pandas dataframe or pandas series.
+                    Lookup table with columns "UniProtKB" and "ENSEMBL_ID" or its index as made by uniprot_index()
     """
-    ENS_col = orthotable.columns.get_loc("ENSEMBL_ID")
-    ortho_col = orthotable.columns.get_loc("orthologs")
+    if isinstance(lookup, pd.DataFrame):
+        lookup = uniprot_index(lookup)
 
-    for row in list(range(len(orthotable.index))):
-        query = orthotable.iat[row, ortho_col]  # orthologs
-        query = query.replace("|", ",")
-        query = query.split(",")
+    query = orthotable["orthologs"].fillna("").str.replace("|", ",", regex=False)
+    query = query.str.split(",").reset_index(drop=True)
+    number_of_IDs = query.str.len()
 
-        for uniprotID in query:
-            uniprotID = uniprotID.replace("9606.", "")
-            genIDs = lookup["ENSEMBL_ID"][
-                lookup["UniProtKB"] == uniprotID
-            ]  # there are several GenIDs per UniprotID. We will take all of them
+    query = query.explode()
+    query = query.str.replace("9606.", "", regex=False)
+    genIDs = query.map(lookup).fillna("")
 
-            genIDs = "|".join(list(set(genIDs)))  # eliminate duplicates
-            orthotable.iat[row, ENS_col] = orthotable.iat[row, ENS_col] + "," + genIDs
+    # add dashes where missing genes, unless the row has a single ortholog
+    missing = (genIDs.to_numpy() == "") & (number_of_IDs[genIDs.index].to_numpy() > 1)
+    genIDs = genIDs.where(~missing, "-")
+
+    orthotable["ENSEMBL_ID"] = join_exploded(genIDs, number_of_IDs, ",")
 
     return orthotable
 
 
+def map_tables(function, tables, jobs=1, initializer=None, initargs=()):
+    """
+    Applies function to each orthology table (or path to it) and returns the results in the same order.
+    With jobs > 1 tables are processed in a pool of jobs processes. initializer(*initargs) runs once in each process before its first table,
+    so data shared by all tables (lookup, query...) is sent to each process only once.
+    If a table fails the error is reported, its result is None and the rest of the tables go on.
+
+    Attributes
+    ----------
+    function: function
+            Module level function taking a single table or path
+    tables: list
+            Orthology tables or paths to them
+    jobs: int
+            Number of processes. 1 runs everything in this process
+    initializer: function
+            Module level function run once per process with initargs
+    initargs: tuple
+            Arguments of initializer
+    """
+    results = [None] * len(tables)
+
+    if jobs is None or jobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for i, table in enumerate(tables):
+            try:
+                results[i] = function(table)
+            except Exception as error:
+                _report_table_error(table, i, error)
+        return results
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, initargs=initargs) as pool:
+        futures = [pool.submit(function, table) for table in tables]
+        for i, future in enumerate(futures):
+            try:
+                results[i] = future.result()
+            except Exception as error:
+                _report_table_error(tables[i], i, error)
+
+    return results
+
+
+def _report_table_error(table, i, error):
+    name = table if isinstance(table, str) else "table %d" % i
+    print("* Error in %s, skipped: %s: %s" % (name, type(error).__name__, error))
+
+
 def directory_or_file(path):
     """
     If given a directory makes full paths of each child file. If given a file just puts it in an array
@@ -59,47 +155,157 @@ def directory_or_file(path):
     return orthology_tables
 
 
-def human_genes_string(path):
+ORTHOLOGY_COLUMNS = ["##Seed_(co-)orthologs", "type", "orthologs", "GeneName_target", "target_species"]
+MEMOIZED_ORTHOLOGY_TABLES = 1  # parsed tables kept by read_orthology_table(), least recently used ones are dropped first
+_orthology_tables = {}
+
+
+def read_orthology_table(path):
     """
-    This script outputs a string with all human genes in the orthology tables we might want to translate
-    It takes all orthology tables, individualizes all Uniprot Human orthologs, puts them in a string,
-    and finally it removes duplicates. This string is used later to make a lookup table using uniprot's API
+    Reads a phylome orthology table keeping only the columns used by the pipelines and the rows with human orthologs.
+    "type" and "target_species" are stored as categorical. Tables are memoized by path and modification time, so the coverage report and the
+    translation of a single table share the same parse. Only the last MEMOIZED_ORTHOLOGY_TABLES tables read are kept, so going through a
+    directory does not keep every table in memory. The returned table should not be modified in place.
 
     Attributes
     ----------
     path: String
-            Absolut path to orthology tables
-    ortho_directory: Boolean
-            True if you want to run the pipeline in all phylome files in a folder (in which case the folder should contain ONLY phylome orthology files). False if path is to a single othology file.
+            Path to a phylome orthology table
+    """
+    path = os.path.abspath(path)
+    key = (path, os.path.getmtime(path))
+
+    if key in _orthology_tables:
+        _orthology_tables[key] = _orthology_tables.pop(key)  # most recently used last
+        return _orthology_tables[key]
+
+    for old_key in [k for k in _orthology_tables if k[0] == path]:  # file was modified
+        del _orthology_tables[old_key]
 
+    orthoTable = human_orthologs(_read_orthology_csv(path))
+    _orthology_tables[key] = orthoTable
+    while len(_orthology_tables) > MEMOIZED_ORTHOLOGY_TABLES:
+        del _orthology_tables[next(iter(_orthology_tables))]
+
+    return orthoTable
+
+
+def iter_orthology_table(path, chunksize, columns=None):
+    """
+    Same as read_orthology_table() but reads the table in chunks of chunksize rows, yielding them one by one. Nothing is memoized
+
+    Attributes
+    ----------
+    path: String
+            Path to a phylome orthology table
+    chunksize: int
+            Number of rows of the file read at a time. None reads the whole table as a single chunk
+    columns: list
+            Columns to read, "target_species" among them. Default, ORTHOLOGY_COLUMNS
+    """
+    if chunksize is None:
+        yield human_orthologs(_read_orthology_csv(path, columns))
+        return
+
+    with _read_orthology_csv(path, columns, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield human_orthologs(chunk)
+
+
+def _read_orthology_csv(path, columns=None, **kwargs):
+    columns = ORTHOLOGY_COLUMNS if columns is None else columns
+    return pd.read_csv(
+        path,
+        index_col=False,
+        skiprows=[i for i in range(1, 13)],
+        sep="\t",
+        usecols=columns,
+        dtype={column: "category" for column in ["type", "target_species"] if column in columns},
+        **kwargs
+    )
+
+
+def seed_taxID(path):
+    """
+    taxID of the seed species of a phylome orthology table, taken from its first seed protein (<taxID>.<protein>). None if the table has no rows
+
+    Attributes
+    ----------
+    path: String
+            Path to a phylome orthology table
+    """
+    first = _read_orthology_csv(path, ["##Seed_(co-)orthologs"], nrows=1)
+    if len(first) == 0:
+        return None
+    return first.iat[0, 0].split(".")[0]
+
+
+def human_orthologs(orthoTable):
+    """
+    Keeps only the rows of an orthology table with human orthologs
+    """
+    orthoTable = orthoTable[orthoTable["target_species"] == "Homo sapiens"].copy()
+    orthoTable["target_species"] = orthoTable["target_species"].cat.remove_unused_categories()
+
+    return orthoTable
+
+
+def clear_orthology_tables():
+    """
+    Forgets all orthology tables memoized by read_orthology_table()
+    """
+    _orthology_tables.clear()
+
+
+def peak_rss():
+    """
+    Peak resident memory of the current process in MB. None where the resource module is not available (Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux reports KB
+
+
+def human_genes(path, chunksize=None):
+    """
+    Set with all human Uniprot IDs in the orthology tables we might want to translate, without duplicates. It is built
+    table by table reading only the "orthologs" and "target_species" columns, and nothing is memoized, so memory only grows
+    with the number of different human genes and not with the number of species or the size of the tables.
+    This set is used later to make a lookup table using uniprot's API
+
+    Attributes
+    ----------
+    path: String
+            Absolut path to an orthology table or to a folder with them (in which case the folder should contain ONLY phylome orthology files)
+    chunksize: int
+            Read the tables in chunks of chunksize rows (see iter_orthology_table()) instead of whole
     """
     # Is input path a file or a directory?
     orthology_tables = directory_or_file(path)
 
-    genes = ""
+    genes = set()
     for fullpath in orthology_tables:
-        orthoTable = pd.read_csv(
-            fullpath, index_col=False, skiprows=[i for i in range(1, 13)], sep="\t"
-        )
-        orthoTable = orthoTable[orthoTable["target_species"] == "Homo sapiens"]
-        orthoTable = orthoTable["orthologs"]
-
-        orthoTable = orthoTable.str.replace("9606.", " ", regex=False)
-        orthoTable = orthoTable.str.replace("|", " ", regex=False)
-        orthoTable = orthoTable.str.replace(",", " ", regex=False)
-
-        # Make string out of them
-        query = orthoTable.str.cat(sep=" ")
-        genes = genes + query
-
-    # Make string with them, no duplicated genes.
-    genes = genes.split(" ")
-    genes = set(genes)
-    genes = " ".join(genes)
+        for orthoTable in iter_orthology_table(fullpath, chunksize, columns=["orthologs", "target_species"]):
+            genes.update(human_uniprots(orthoTable["orthologs"]))
+
     return genes
 
 
-def uniprot_request(genes, from_id, to_id):
+def human_genes_string(path):
+    """
+    Same as human_genes() but as a string with the IDs separated by " ", for scripts that still expect it
+
+    Attributes
+    ----------
+    path: String
+            Absolut path to orthology tables
+    """
+    return " ".join(sorted(human_genes(path)))
+
+
+def uniprot_request(genes, from_id, to_id, url="https://www.uniprot.org/uploadlists/", retries=3, backoff=0.5):
     """
     Uses Uniprot's api to make a lookup table having UniprotKB ID - EnsemblID - HGNC symbol
 
@@ -107,26 +313,76 @@ def uniprot_request(genes, from_id, to_id):
 
     Attributes
     ----------
-    genes : str
-        a formatted string with all Uniprot ids to translate, separated by "\t"
+    genes : str or iterable
+        Uniprot ids to translate, a collection or a string with them separated by " "
     from_format : str
         Uniprot ID abreviation as in https://www.uniprot.org/help/api_idmapping of the inputted genes to translate
     to_format : str
         Gene code abbreviation as in https://www.uniprot.org/help/api_idmapping to translate Unirot IDs to
+    url : str
+        Address of Uniprot's ID mapping service
+    retries : int
+        How many times to repeat the request if it fails
+    backoff : number
+        Seconds to wait before the first retry, doubled in each following retry
     """
-    url = "https://www.uniprot.org/uploadlists/"
+    if not isinstance(genes, str):
+        genes = " ".join(genes)
 
     params = {"from": from_id, "to": to_id, "format": "tab", "query": genes}
 
     data = urllib.parse.urlencode(params)
     data = data.encode("utf-8")
-    req = urllib.request.Request(url, data)
-    with urllib.request.urlopen(req) as f:
-        response = f.read()
+    for attempt in range(retries + 1):
+        req = urllib.request.Request(url, data)
+        try:
+            with urllib.request.urlopen(req) as f:
+                response = f.read()
+            break
+        except OSError:  # connection errors and HTTP errors (urllib.error.URLError)
+            if attempt == retries:
+                raise
+        time.sleep(backoff * 2**attempt)
 
     return response.decode("utf-8")
 
 
+def uniprot_requests(genes, from_id, to_id, columns, batch_size=5000, url="https://www.uniprot.org/uploadlists/", retries=3, backoff=0.5):
+    """
+    Translates many Uniprot IDs with uniprot_request() sending them in batches of at most batch_size IDs, so the size of each request stays
+    the same however many species there are. A batch that fails is retried on its own. Returns the translations of all batches as one
+    dataframe with the given column names
+
+    Attributes
+    ----------
+    genes : iterable
+        Uniprot ids to translate (duplicates are sent once)
+    from_id : str
+        Uniprot ID abreviation of the inputted genes, see uniprot_request()
+    to_id : str
+        Gene code abbreviation to translate Unirot IDs to, see uniprot_request()
+    columns : list
+        Names of the two columns of the output, for example ["UniProtKB", "ENSEMBL_ID"]
+    batch_size : int
+        Maximum number of IDs per request
+    url, retries, backoff:
+        See uniprot_request()
+    """
+    if isinstance(genes, str):
+        genes = genes.split(" ")
+    genes = sorted(set(genes) - {""})
+
+    batches = [genes[start:start + batch_size] for start in range(0, len(genes), batch_size)]
+    tables = [
+        format_uniprot_output(uniprot_request(batch, from_id, to_id, url=url, retries=retries, backoff=backoff), columns)
+        for batch in tqdm(batches, disable=len(batches) < 2)
+    ]
+    if len(tables) == 0:
+        return pd.DataFrame(columns=columns)
+
+    return pd.concat(tables, ignore_index=True)
+
+
 def format_uniprot_output(uniprot, columns):
     uniprot = pd.DataFrame(
         [x.split("\t") for x in uniprot.split("\n")]
@@ -138,6 +394,45 @@ def format_uniprot_output(uniprot, columns):
     return uniprot
 
 
+def human_uniprots(orthologs):
+    """
+    Human Uniprot IDs of an "orthologs" column, one per ortholog: IDs separated by "," or "|" are split and "9606." is removed. Empty IDs are left out
+
+    Attributes
+    ----------
+    orthologs: pandas series
+            "orthologs" column of an orthology table
+    """
+    # One string per table, split once in C
+    uniprots = ",".join(orthologs.dropna().tolist()).replace("|", ",").replace("9606.", "").split(",")
+    uniprots = np.array(uniprots, dtype=object)
+    return uniprots[uniprots != ""]
+
+
+def translation_status(lookup):
+    """
+    How each Uniprot ID of the lookup was translated, in one pass over the lookup. Series indexed by UniProtKB with values
+    "translated" (ENSEMBL_ID and HGNC), "ENSEMBL_ID only", "HGNC only" or "untranslated" (in the lookup but without any of them).
+    A Uniprot ID with several rows counts as having a translation if any of its rows has it. Empty strings count as missing
+
+    Attributes
+    ----------
+    lookup: pandas dataframe
+            Lookup table with columns "UniProtKB", "ENSEMBL_ID" and "HGNC"
+    """
+    has = pd.DataFrame({
+        "ENSEMBL_ID": lookup["ENSEMBL_ID"].fillna("").to_numpy(dtype=object) != "",
+        "HGNC": lookup["HGNC"].fillna("").to_numpy(dtype=object) != "",
+    })
+    has = has.groupby(lookup["UniProtKB"].to_numpy(dtype=object), sort=False).any()
+
+    ensembl = has["ENSEMBL_ID"].to_numpy()
+    hgnc = has["HGNC"].to_numpy()
+    status = np.select([ensembl & hgnc, ensembl, hgnc], ["translated", "ENSEMBL_ID only", "HGNC only"], "untranslated")
+
+    return pd.Series(status, index=has.index, name="status")
+
+
 def lost_genes(TFs, path_to_orthologies, all_lost_genes=False, TF_lost_genes=True):
     """
     this function takes in the translated orthology tables and tells you which genes were not translated if all_lost_genes=True
@@ -147,58 +442,81 @@ def lost_genes(TFs, path_to_orthologies, all_lost_genes=False, TF_lost_genes=Tru
     ----------
     TFs: list.
             Object with all TFs ENSEMBL IDs
-    path_to_orthologies: string
-            object with path to folder with orthology tables
+    path_to_orthologies: string or list
+            object with path to folder with orthology tables, or the translated orthology tables already read (a list of dataframes, as made by phylome.translate_orthologies())
     """
-    finalist = []
-    finalUniprot = []
-
-    for file in os.listdir(path_to_orthologies):
-        fullpath = os.path.join(path_to_orthologies, file)
-        orthoTable = pd.read_csv(fullpath, sep="\t")
-        lostGenes = orthoTable[["GeneName_target", "orthologs"]][
-            orthoTable["GenIDs"].isna()
-        ]
-
-        Uniprotlost = list(lostGenes["orthologs"])
-        lostGenes = list(lostGenes["GeneName_target"])
+    if isinstance(path_to_orthologies, str):
+        tables = (pd.read_csv(os.path.join(path_to_orthologies, file), sep="\t") for file in os.listdir(path_to_orthologies))
+    else:
+        tables = path_to_orthologies
 
-        finalUniprot = finalUniprot + Uniprotlost
-        finalist = finalist + lostGenes
+    lost = []
+    for orthoTable in tables:
+        genIDs = "ENSEMBL_ID" if "ENSEMBL_ID" in orthoTable.columns else "GenIDs"  # tables translated by older versions
+        untranslated = orthoTable[genIDs].fillna("").to_numpy(dtype=object) == ""
+        lost.append(pd.DataFrame({
+            "Genes": orthoTable["GeneName_target"].to_numpy(dtype=object)[untranslated],
+            "Uniprots": orthoTable["orthologs"].to_numpy(dtype=object)[untranslated],
+        }))
 
-    finalostable = pd.DataFrame({"Genes": finalist, "Uniprots": finalUniprot})
+    finalostable = pd.concat(lost, ignore_index=True) if len(lost) > 0 else pd.DataFrame(columns=["Genes", "Uniprots"])
 
     if all_lost_genes:
-        finalostable.drop_duplicates(subset=["Genes"], inplace=True)
+        finalostable = finalostable.drop_duplicates(subset=["Genes"])
 
     elif TF_lost_genes:
-        finalist = list(set(finalist))  # unique values
-        condition = np.isin(finalist, TFs)
-        finalist = pd.DataFrame({"Genes": finalist})[condition]  # only TFs
-
-        finalostable = finalostable.merge(
-            finalist, how="right", left_on="Genes", right_on="Genes"
-        )
+        finalostable = finalostable[finalostable["Genes"].isin(TFs)]  # only TFs
         finalostable = finalostable.drop_duplicates(subset=["Genes"])
     return finalostable
 
 
-def HGNC_request(gene):
+def HGNC_request(gene, h=None, uri="http://rest.genenames.org", retries=0, backoff=0.5, wait=None):
+    """
+    Translates one HGNC symbol to its ENSEMBL genID using HGNC's REST API. Returns None if there is no translation
 
+    Attributes
+    ----------
+    gene: string
+        HGNC symbol
+    h: httplib2.Http
+        Connection to reuse between requests. Default, a new one
+    uri: string
+        Address of the HGNC REST API
+    retries: int
+        How many times to repeat the request if the connection fails or the server is busy (status 429 or 5xx)
+    backoff: number
+        Seconds to wait before the first retry, doubled in each following retry
+    wait: function
+        Called before each request, for example a rate limiter made by rate_limiter()
+    """
     headers = {
         "Accept": "application/json",
     }
 
-    uri = "http://rest.genenames.org"
-    path = "/fetch/symbol/" + gene
+    path = "/fetch/symbol/" + urllib.parse.quote(gene)
 
     target = urllib.parse.urlparse(uri + path)
     method = "GET"
     body = ""
 
-    h = http.Http()
+    if h is None:
+        h = http.Http()
 
-    response, content = h.request(target.geturl(), method, body, headers)
+    for attempt in range(retries + 1):
+        if wait is not None:
+            wait()
+        try:
+            response, content = h.request(target.geturl(), method, body, headers)
+        except (OSError, http.HttpLib2Error):
+            if attempt == retries:
+                raise
+        else:
+            if response["status"] == "429" or response["status"].startswith("5"):
+                if attempt == retries:
+                    break
+            else:
+                break
+        time.sleep(backoff * 2**attempt)
 
     if response["status"] == "200":
         try:
@@ -209,7 +527,65 @@ def HGNC_request(gene):
 
     else:
         print("Error detected: " + response["status"])
-    # time.sleep(0.01) # 20 miliseconds per request
+
+
+def rate_limiter(rate):
+    """
+    Makes a function that, called before each request, sleeps as needed to send at most rate requests per second. Can be shared between threads
+
+    Attributes
+    ----------
+    rate: number
+        Maximum requests per second
+    """
+    lock = threading.Lock()
+    next_time = [time.monotonic()]
+
+    def wait():
+        with lock:
+            now = time.monotonic()
+            sleep = next_time[0] - now
+            next_time[0] = max(now, next_time[0]) + 1 / rate
+        if sleep > 0:
+            time.sleep(sleep)
+
+    return wait
+
+
+def HGNC_requests(genes, max_workers=8, rate=10, retries=3, backoff=0.5, uri="http://rest.genenames.org"):
+    """
+    Translates many HGNC symbols to ENSEMBL genIDs with HGNC's REST API, running max_workers requests at once.
+    Each worker keeps its own connection open for all its requests. Symbols are deduplicated before sending.
+    Returns a dictionary symbol: ENSEMBL genID (None if there is no translation)
+
+    Attributes
+    ----------
+    genes: iterable
+        HGNC symbols
+    max_workers: int
+        Number of requests running at the same time
+    rate: number
+        Maximum requests per second between all workers. HGNC allows 10. None for no limit
+    retries: int
+        How many times to repeat a request that failed
+    backoff: number
+        Seconds to wait before the first retry, doubled in each following retry
+    uri: string
+        Address of the HGNC REST API
+    """
+    genes = list(dict.fromkeys(genes))  # eliminate duplicates
+    wait = rate_limiter(rate) if rate is not None else None
+    connections = threading.local()
+
+    def request(gene):
+        if not hasattr(connections, "h"):
+            connections.h = http.Http()  # Http objects can't be shared between threads
+        return HGNC_request(gene, h=connections.h, uri=uri, retries=retries, backoff=backoff, wait=wait)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        ENSGs = list(tqdm(pool.map(request, genes), total=len(genes)))  # with progress bar
+
+    return dict(zip(genes, ENSGs))
 
 
 def update_Biomart(lookup, finalostable):
@@ -238,11 +614,87 @@ def update_Biomart(lookup, finalostable):
     print("Lines that will be added to updated version of Biomart: \n")
     print(finalostable)
 
-    lookup = lookup.append(finalostable, ignore_index=True)
+    lookup = pd.concat([lookup, finalostable], ignore_index=True)
     return lookup
 
 
+def explode_positions(column, sep=","):
+    """
+    Explodes a column with several IDs per cell into one row per ID, keeping where each ID was. Returns a dataframe with columns
+    "row" (position of the row in the table, from 0), "position_from_0" (position of the ID in the cell) and "ID",
+    and a series with the number of IDs in each cell. IDs are int32 codes (see interning), turn them back into IDs with interning.ids()
+
+    Attributes
+    ----------
+    column: pandas series
+            Cells with IDs separated by sep
+    sep: string
+            Separator between IDs of the same cell
+    """
+    codes, offsets = interning.split_cells(column, sep)
+    number_of_IDs = np.diff(offsets)
+
+    exploded = pd.DataFrame(
+        {
+            "row": np.repeat(np.arange(len(number_of_IDs)), number_of_IDs),
+            "position_from_0": np.arange(len(codes)) - np.repeat(offsets[:-1], number_of_IDs),
+            "ID": codes,
+        }
+    )
+    return exploded, pd.Series(number_of_IDs)
+
+
+def ensembl_index(orthoTable, column="ENSEMBL_ID"):
+    """
+    Inverted index of a translated orthology table: one row per ENSEMBL genID with the row of the table it is in ("row", from 0),
+    its position among the orthologs of that row ("position_from_0"), its position among the genIDs of the same Uniprot ID ("slot", separated by "|")
+    and the total number of orthologs in the row ("number_of_IDs"). Matches are exact, "ENSG1" does not match "ENSG12".
+    genIDs ("GenID") are int32 codes (see interning), turn them back into IDs with interning.ids()
+
+    Attributes
+    ----------
+    orthoTable: pandas dataframe
+            Translated orthology table, product of phylome.translate_orthologies()
+    column: string
+            Column with the ENSEMBL genIDs
+    """
+    codes, ortholog_offsets, row_offsets = interning.split_nested(orthoTable[column], ",", "|")
+    number_of_IDs = np.diff(row_offsets)
+    number_of_genIDs = np.diff(ortholog_offsets)
+
+    ortholog = np.repeat(np.arange(len(number_of_genIDs)), number_of_genIDs)  # ortholog of each genID
+    row = np.repeat(np.arange(len(number_of_IDs)), number_of_IDs)[ortholog]
+
+    index = pd.DataFrame(
+        {
+            "row": row,
+            "position_from_0": ortholog - row_offsets[row],
+            "slot": np.arange(len(codes)) - ortholog_offsets[ortholog],
+            "GenID": codes,
+            "number_of_IDs": number_of_IDs[row],
+        }
+    )
+    return index
+
+
 def find_position(row, gene, column="ENSEMBL_ID", HGNC=False):
+    """
+    Position of gene (counting from 0) in the comma separated IDs of column, for each row.
+    Deprecated: the pipelines no longer use it, subset_query_orthologs_and_position() finds the positions of all query genes at once.
+    Kept for code that still calls it and will be removed in a future version.
+
+    Attributes
+    ----------
+    row: pandas dataframe
+            Rows of a translated orthology table that contain gene
+    gene: string.
+            ENS ID or HGNC symbol to look for
+    column: string.
+            Column with the comma separated IDs
+    HGNC: boolean.
+            If gene is a HGNC symbol, then True
+    """
+    warnings.warn("utils.find_position() is deprecated and will be removed, use phylome.subset_query_orthologs_and_position()", DeprecationWarning, stacklevel=2)
     if HGNC:
         # This regex is only needed for HGNCs. However leads to certain problems, as a HGNC in the table gives multiple matches. This is solved further in the HGNC pipeline, but we bypass it for the ENSGo one.
         position = row[column].str.split(",")
@@ -265,6 +717,9 @@ def find_position(row, gene, column="ENSEMBL_ID", HGNC=False):
 
 def query_position_table(rows, position, gene, HGNC=False):
     """
+    Deprecated: the pipelines no longer use it, subset_query_orthologs_and_position() builds the positions of all query genes at once.
+    Kept for code that still calls it and will be removed in a future version.
+
     This function takes a row from the translated orthotable that has a TF (object called rows),
     The position within the GenID string, in which our gene of interest is, and makes a dataframe containing
     for that row, which GenIDs are TFs, their HGNC tranlslation (found based on poistion in string) and the position.
@@ -280,43 +735,34 @@ def query_position_table(rows, position, gene, HGNC=False):
     HGNC: boolean.
             If you are not using tranlated orthotables and just HGNCs, then True.
     """
+    warnings.warn("utils.query_position_table() is deprecated and will be removed, use phylome.subset_query_orthologs_and_position()", DeprecationWarning, stacklevel=2)
 
-    table = pd.DataFrame(
-        {"GenID": [], "HGNC": [], "position_from_0": [], "number_of_IDs": []}
-    )
-
+    # All rows are handled at once as plain lists, and the table is built in one go at the end
     HGNC_symbols = rows["GeneName_target"].str.split(",")
+    positions = np.asarray(position, dtype=int).tolist()
+    symbols = HGNC_symbols.tolist()
+
+    HGNC_names = [names[pos] for names, pos in zip(symbols, positions)]
+    number_of_IDs = [len(names) for names in symbols]  # total number of symbols translated or not
+
+    # DISCLAIMER, this function assumees that you only have one GenID per TF. so within a srting of "|" only one geneID is correct.
     if not HGNC:
-        ENS_symbols = rows["ENSEMBL_ID"].str.split(",")
-
-    indexes = HGNC_symbols.index.values
-    for i in indexes:
-        position_tmp = position[i]
-        HGNC_name = HGNC_symbols[i][position_tmp]
-
-        # DISCLAIMER, this function assumees that you only have one GenID per TF. so within a srting of "|" only one geneID is correct.
-        if not HGNC:
-            # substitute this following chunk for ENS_name = gene to ignore all the other ENSIDs that share UnirptoID
-            ENS_name = ENS_symbols[i][position_tmp]
-            ENS_name = ENS_name.split("|")
-            ENS_name = np.isin(ENS_name, gene)
-            ENS_name = [gene if i == True else "-" for i in ENS_name]
-            ENS_name = "|".join(ENS_name)
-        else:
-            ENS_name = ""
-
-        number_of_IDs = len(
-            HGNC_symbols[i]
-        )  # total number of symbols translated or not
-        new = pd.DataFrame(
-            {
-                "GenID": [ENS_name],
-                "HGNC": [HGNC_name],
-                "position_from_0": [position_tmp],
-                "number_of_IDs": [number_of_IDs],
-            }
-        )
-        table = table.append(new)
-
-    table.index = HGNC_symbols.index
+        # substitute this following chunk for ENS_name = gene to ignore all the other ENSIDs that share UnirptoID
+        ENS_symbols = rows["ENSEMBL_ID"].str.split(",").tolist()
+        ENS_names = [
+            "|".join(ID if ID == gene else "-" for ID in IDs[pos].split("|"))
+            for IDs, pos in zip(ENS_symbols, positions)
+        ]
+    else:
+        ENS_names = [""] * len(symbols)
+
+    table = pd.DataFrame(
+        {
+            "GenID": ENS_names,
+            "HGNC": HGNC_names,
+            "position_from_0": positions,
+            "number_of_IDs": number_of_IDs,
+        },
+        index=HGNC_symbols.index,
+    )
     return table
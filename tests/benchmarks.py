@@ -0,0 +1,535 @@
+#####################################
+#### Benchmarks comparing the old (row by row) implementations
+#### with the current ones on synthetic data. They only time them,
+#### tests/test_*.py check that both give the same results.
+#### Run with: python tests/benchmarks.py [benchmark name]
+#####################################
+
+import os
+import sys
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from eggfan import utils
+from eggfan import phylome
+from eggfan import orthogroup
+from eggfan import eggnog_index
+from eggfan import goterms
+from eggfan import godag
+from eggfan import emapper_reader
+from eggfan import idmapping_store
+from eggfan import interning
+from eggfan import columnar
+from synthetic import (synthetic_lookup, synthetic_orthotable, write_phylome_file, synthetic_translated_table,
+                       write_members_file, synthetic_emapper, write_emapper_file, write_wide_emapper_file, write_obo_file, write_idmapping_files,
+                       MockUniprotHandler, mock_hgnc_server, mock_uniprot_server)
+from legacy import (legacy_translate_uniprots, legacy_subset_query_orthologs_and_position, legacy_HGNC_subset_query_orthologs_and_position,
+                    legacy_add_queryonly_columns, legacy_emapper_annotation, legacy_format_query_targets, legacy_check_lost_genes,
+                    legacy_human_genes_string, legacy_ensembl_index, legacy_find_query_orthologs)
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def traced(function, *args, **kwargs):
+    """
+    Result, seconds and peak of memory allocated by python (MB) of a call
+    """
+    tracemalloc.start()
+    result, seconds = timed(function, *args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_translate_uniprots(sizes=(10_000, 100_000, 1_000_000), legacy_max=10_000):
+    """
+    Old vs new translation of synthetic orthology tables. The old path is only run up to legacy_max rows, it takes hours above that.
+    """
+    lookup, uniprots = synthetic_lookup(20_000)
+    print("rows\tlegacy_s\tvectorized_s")
+    for n_rows in sizes:
+        orthotable = synthetic_orthotable(n_rows, uniprots)
+        _, new_time = timed(utils.translate_uniprots, orthotable.copy(), lookup)
+
+        if n_rows <= legacy_max:
+            _, old_time = timed(legacy_translate_uniprots, orthotable, lookup)
+            print("%d\t%.2f\t%.2f" % (n_rows, old_time, new_time))
+        else:
+            print("%d\t-\t%.2f" % (n_rows, new_time))
+
+
+def bench_HGNC_requests(n_symbols=1_000, max_workers=16):
+    """
+    One request at a time with a new connection each (as translate_from_HGNC() did) vs HGNC_requests(), against a local mock server.
+    A 20% of the symbols are repeated.
+    """
+    server, uri = mock_hgnc_server()
+    symbols = ["SYMB%d" % i for i in range(int(n_symbols * 0.8))]
+    symbols = symbols + symbols[: n_symbols - len(symbols)]
+
+    _, serial_time = timed(lambda: {gene: utils.HGNC_request(gene, uri=uri) for gene in symbols})
+    _, concurrent_time = timed(
+        utils.HGNC_requests, symbols, max_workers=max_workers, rate=None, uri=uri
+    )
+    server.shutdown()
+
+    print("symbols\tserial_s\tconcurrent_s")
+    print("%d\t%.2f\t%.2f" % (n_symbols, serial_time, concurrent_time))
+
+
+LEGACY_READ = """
+import pandas as pd
+for i in range(2):  # human_genes_string() and translate_orthologies() parsed the file each
+    table = pd.read_csv(PATH, index_col=False, skiprows=[i for i in range(1, 13)], sep="\\t")
+    table = table[table["target_species"] == "Homo sapiens"]
+"""
+
+
+SHARED_READ = """
+from eggfan import utils
+for i in range(2):
+    table = utils.read_orthology_table(PATH)
+"""
+
+
+def bench_read_orthology_table(n_rows=1_000_000):
+    """
+    Peak memory and time of reading a phylome file twice as the pipeline did vs utils.read_orthology_table(). Each one in its own process
+    """
+    lookup, uniprots = synthetic_lookup(20_000)
+    orthotable = synthetic_orthotable(n_rows, uniprots)
+    orthotable["target_species"] = np.resize(["Homo sapiens", "Mus musculus", "Danio rerio", "Drosophila melanogaster"], n_rows)
+    for column in ["target_taxid", "orthology_support", "tree_ids", "notes"]:  # columns not used by the pipelines
+        orthotable[column] = orthotable["orthologs"].str[:20]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "7227_orthologs.tsv")
+        write_phylome_file(orthotable, path)
+
+        print("reader\tseconds\tpeak_rss_MB")
+        for name, code in [("legacy", LEGACY_READ), ("shared", SHARED_READ)]:
+            code = "PATH = %r\n" % path + code + "\nimport resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)"
+            start = time.perf_counter()
+            rss = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split()[-1]
+            print("%s\t%.2f\t%.0f" % (name, time.perf_counter() - start, float(rss)))
+
+
+def bench_subset_query_orthologs(n_query=2_000, sizes=(10_000, 100_000, 500_000), legacy_max=100_000):
+    """
+    Substring scan per query gene vs inverted index in phylome.subset_query_orthologs_and_position()
+    """
+    print("rows\tlegacy_s\tindex_s")
+    for n_rows in sizes:
+        orthotable, genIDs = synthetic_translated_table(n_rows)
+        human_query = pd.DataFrame({"genes": np.random.default_rng(1).choice(genIDs, n_query, replace=False)})
+
+        _, new_time = timed(phylome.subset_query_orthologs_and_position, orthotable, human_query)
+        if n_rows <= legacy_max:
+            _, old_time = timed(legacy_subset_query_orthologs_and_position, orthotable, human_query)
+            print("%d\t%.2f\t%.2f" % (n_rows, old_time, new_time))
+        else:
+            print("%d\t-\t%.2f" % (n_rows, new_time))
+
+
+def bench_HGNC_subset_query_orthologs(n_query=2_000, sizes=(10_000, 100_000, 500_000), legacy_max=100_000):
+    """
+    Regex scan per query symbol vs tokenized symbols in phylome.HGNC_subset_query_orthologs_and_position()
+    """
+    print("rows\tlegacy_s\ttokens_s")
+    for n_rows in sizes:
+        orthotable, genIDs = synthetic_translated_table(n_rows)
+        symbols = orthotable["GeneName_target"].str.split(",").explode().unique()
+        human_query = pd.DataFrame({"genes": np.random.default_rng(1).choice(symbols, n_query, replace=False)})
+
+        _, new_time = timed(phylome.HGNC_subset_query_orthologs_and_position, orthotable, human_query)
+        if n_rows <= legacy_max:
+            _, old_time = timed(legacy_HGNC_subset_query_orthologs_and_position, orthotable, human_query)
+            print("%d\t%.2f\t%.2f" % (n_rows, old_time, new_time))
+        else:
+            print("%d\t-\t%.2f" % (n_rows, new_time))
+
+
+def bench_position_scaling(sizes=(1_000, 10_000, 100_000, 700_000)):
+    """
+    Time per match of phylome.subset_query_orthologs_and_position() from 1k to 700k matches. It should grow linearly (constant us/match),
+    the old row by row position table did not (see subset_query_orthologs)
+    """
+    print("matches\tsubset_s\tus/match")
+    for n_rows in sizes:
+        orthotable, genIDs = synthetic_translated_table(n_rows)
+        human_query = pd.DataFrame({"genes": genIDs})
+        (table, query_position), new_time = timed(phylome.subset_query_orthologs_and_position, orthotable, human_query)
+        print("%d\t%.2f\t%.2f" % (len(query_position), new_time, 1e6 * new_time / len(query_position)))
+
+
+def bench_add_queryonly_columns(n_query=2_000, sizes=(10_000, 100_000, 500_000), legacy_max=10_000):
+    """
+    Row by row filling vs one scatter and join in phylome.add_queryonly_columns(), for both pipelines
+    """
+    print("annotated_rows\tlegacy_s\tscatter_s\tHGNC_scatter_s")
+    for n_rows in sizes:
+        orthotable, genIDs = synthetic_translated_table(n_rows)
+        human_query = pd.DataFrame({"genes": np.random.default_rng(1).choice(genIDs, n_query, replace=False)})
+        table, query_position = phylome.subset_query_orthologs_and_position(orthotable, human_query)
+        symbols = pd.DataFrame({"genes": query_position["HGNC"].unique()})
+        HGNC_table, HGNC_position = phylome.HGNC_subset_query_orthologs_and_position(orthotable, symbols)
+
+        _, new_time = timed(phylome.add_queryonly_columns, table, query_position)
+        _, HGNC_time = timed(phylome.add_queryonly_columns, HGNC_table, HGNC_position, HGNC=True)
+        if n_rows <= legacy_max:
+            _, old_time = timed(legacy_add_queryonly_columns, table, query_position)
+            print("%d\t%.2f\t%.2f\t%.2f" % (len(table), old_time, new_time, HGNC_time))
+        else:
+            print("%d\t-\t%.2f\t%.2f" % (len(table), new_time, HGNC_time))
+
+
+LEGACY_EGGNOG = """
+import pandas as pd
+eggnog = pd.read_csv(PATH, sep="\\t", names=["X", "Orthogroup", "N_Prots", "N_Spec", "Protein stable ID", "SpeciesID"])
+eggnog = eggnog[eggnog.SpeciesID.str.contains("9606")]
+"""
+
+
+STREAMED_EGGNOG = """
+from eggfan import orthogroup
+eggnog = orthogroup.read_eggnog([PATH])
+"""
+
+
+def bench_read_eggnog(n_groups=300_000):
+    """
+    Peak memory and time of reading a members.tsv.gz whole and then filtering (as egg_translate() did) vs orthogroup.read_eggnog(). Each one in its own process
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "33208_members.tsv.gz")
+        write_members_file(path, n_groups)
+        print("file: %d orthogroups, %.0f MB compressed" % (n_groups, os.path.getsize(path) / 1e6))
+
+        print("reader\tseconds\tpeak_MB")
+        for name, code in [("whole", LEGACY_EGGNOG), ("streamed", STREAMED_EGGNOG)]:
+            code = "PATH = %r\n" % path + code + "\nimport resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)"
+            start = time.perf_counter()
+            rss = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split()[-1]
+            print("%s\t%.2f\t%.0f" % (name, time.perf_counter() - start, float(rss)))
+
+
+def bench_eggnog_index(n_groups=300_000):
+    """
+    Parsing a members.tsv.gz with orthogroup.read_eggnog() on every run vs loading the human slice of a prebuilt index
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "33208_members.tsv.gz")
+        write_members_file(path, n_groups)
+
+        _, build_time = timed(eggnog_index.build_index, [path], os.path.join(tmp, "index"))
+        _, parse_time = timed(orthogroup.read_eggnog, [path])
+        stale, check_time = timed(eggnog_index.stale_sources, os.path.join(tmp, "index"), [path])
+        _, load_time = timed(eggnog_index.read_index, os.path.join(tmp, "index"))
+        print("build_s\tparse_s\tcheck_s\tload_s\tstale")
+        print("%.2f\t%.2f\t%.2f\t%.2f\t%s" % (build_time, parse_time, check_time, load_time, stale))
+
+
+def bench_egg_translate_references(n_groups=100_000, taxIDs=("9606", "9610", "9620")):
+    """
+    Reading and translating a members file once per reference species vs once for all of them with a list of tax IDs
+    """
+    def references_lookup(eggnog, taxID):
+        proteins = eggnog["Protein stable ID"].str.split(",").explode()
+        proteins = proteins[proteins.str.startswith(taxID + ".")].str.slice(len(taxID) + 1).unique()
+        return pd.DataFrame({"HGNC symbol": proteins, "Gene stable ID": proteins, "Protein stable ID": proteins})
+
+    def one_by_one(path, lookups):
+        return {taxID: orthogroup.egg_translate(orthogroup.read_eggnog([path], taxID), lookups[taxID], taxID) for taxID in taxIDs}
+
+    def all_at_once(path, lookups):
+        return orthogroup.egg_translate(orthogroup.read_eggnog([path], list(taxIDs)), lookups, list(taxIDs))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "33208_members.tsv.gz")
+        write_members_file(path, n_groups)
+        everything = orthogroup.read_eggnog([path], None)
+        lookups = {taxID: references_lookup(everything, taxID) for taxID in taxIDs}
+
+        _, old_time = timed(one_by_one, path, lookups)
+        _, new_time = timed(all_at_once, path, lookups)
+        print("references\tone_by_one_s\tall_at_once_s")
+        print("%d\t%.2f\t%.2f" % (len(taxIDs), old_time, new_time))
+
+
+def bench_emapper_annotation(sizes=(5_000, 50_000)):
+    """
+    One scan per tax level vs a single parse of eggNOG_OGs joined on all levels in orthogroup.emapper_annotation()
+    """
+    print("proteins\tlegacy_s\tjoin_s\tmatch_only_s")
+    for n_proteins in sizes:
+        emapper, query_orthogroups = synthetic_emapper(n_proteins)
+        tax_levels = [col.replace("Orthogroup", "") for col in query_orthogroups.columns if col.startswith("Orthogroup")]
+
+        _, new_time = timed(orthogroup.emapper_annotation, emapper, query_orthogroups.copy(), False)
+        _, old_time = timed(legacy_emapper_annotation, emapper, query_orthogroups.copy(), False)
+        _, match_time = timed(orthogroup.emapper_orthogroups, emapper, tax_levels)
+        print("%d\t%.2f\t%.2f\t%.2f" % (n_proteins, old_time, new_time, match_time))
+
+
+def bench_format_query_targets(sizes=(10_000, 100_000, 1_000_000), legacy_max=100_000):
+    """
+    Per column groupbys and outer merges vs one two-level aggregation in orthogroup.format_query_targets()
+    """
+    print("rows\tlegacy_s\tgrouped_s\tus/row")
+    for n_rows in sizes:
+        rng = np.random.default_rng(0)
+        genes = rng.integers(0, 20_000, n_rows)
+        query_targets = pd.DataFrame({
+            "Protein stable ID": ["ENSP%d" % gene for gene in genes],
+            "HGNC symbol": ["GENE%d" % gene for gene in genes],
+            "Gene stable ID": ["ENSG%d" % gene for gene in genes],
+            "Orthogroup": ["OG%d@%s" % (og, level) for og, level in zip(rng.integers(0, 2_000, n_rows), rng.choice(["33208", "33213"], n_rows))],
+            "#query": ["Capte%d" % target for target in rng.integers(0, n_rows // 10, n_rows)],
+        })
+
+        _, new_time = timed(orthogroup.format_query_targets, query_targets)
+        if n_rows <= legacy_max:
+            _, old_time = timed(legacy_format_query_targets, query_targets)
+            print("%d\t%.2f\t%.2f\t%.2f" % (n_rows, old_time, new_time, 1e6 * new_time / n_rows))
+        else:
+            print("%d\t-\t%.2f\t%.2f" % (n_rows, new_time, 1e6 * new_time / n_rows))
+
+
+def bench_GOTerms_annotation(n_genes=30_000, n_modules=40):
+    """
+    One GOTerms_annotation() run (read + regex) per module vs all modules in one tokenized pass
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emapper.annotations")
+        write_emapper_file(path, n_genes)
+        modules = ["GO:%07d" % term for term in range(n_modules)]
+
+        def one_by_one():
+            tables = []
+            for module in modules:
+                emapper = pd.read_csv(path, skiprows=4, sep="\t")
+                found = emapper["GOs"].str.contains(module).fillna(False)
+                tables.append(emapper[["#query"]][found].assign(GOterm=module))
+            return pd.concat(tables, ignore_index=True)
+
+        _, old_time = timed(one_by_one)
+        _, new_time = timed(goterms.GOTerms_annotation, path, modules)
+        _, matrix_time = timed(goterms.GOTerms_matrix, path, modules)
+        print("modules\tone_by_one_s\tone_pass_s\tmatrix_s")
+        print("%d\t%.2f\t%.2f\t%.2f" % (n_modules, old_time, new_time, matrix_time))
+
+
+def bench_GO_closure(n_terms=45_000, n_genes=30_000, n_modules=40):
+    """
+    Parsing the OBO file and computing the descendant closure vs loading it from the cache, and annotation with subtrees
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        obo = os.path.join(tmp, "go-basic.obo")
+        emapper = os.path.join(tmp, "emapper.annotations")
+        write_obo_file(obo, n_terms)
+        write_emapper_file(emapper, n_genes, n_terms=n_terms)
+        modules = ["GO:%07d" % term for term in range(0, 20 * n_modules, 20)]
+
+        closure, build_time = timed(godag.load_closure, obo)
+        _, cached_time = timed(godag.load_closure, obo)
+        _, expand_time = timed(godag.expand_terms, modules, closure)
+        exact, exact_time = timed(goterms.GOTerms_annotation, emapper, modules)
+        expanded, expanded_time = timed(goterms.GOTerms_annotation, emapper, modules, obo=obo)
+
+        print("closure_entries\tbuild_s\tcached_s\texpand_s\texact_s\tdag_s\texact_rows\tdag_rows")
+        print("%d\t%.2f\t%.2f\t%.2f\t%.2f\t%.2f\t%d\t%d" % (len(closure["indices"]), build_time, cached_time, expand_time, exact_time, expanded_time, len(exact), len(expanded)))
+
+
+def bench_read_emapper(n_genes=100_000):
+    """
+    Reading the whole emapper file with read_csv(skiprows=4) vs only the columns each pipeline uses, plain and compressed, and memory of the GOs column as strings vs pre-split
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, "emapper.annotations")
+        compressed = plain + ".gz"
+        write_wide_emapper_file(plain, n_genes)
+        write_wide_emapper_file(compressed, n_genes)
+
+        full, full_time = timed(pd.read_csv, plain, skiprows=4, sep="\t")
+        GOs, GOs_time = timed(emapper_reader.read_emapper, plain, ["GOs"])
+        _, OGs_time = timed(emapper_reader.read_emapper, compressed, ["eggNOG_OGs"], split=["eggNOG_OGs"])
+        tokens, tokens_time = timed(emapper_reader.explode_tokens, GOs, "GOs")
+
+        full_mb = full.memory_usage(deep=True).sum() / 1e6
+        GOs_mb = GOs["GOs"].memory_usage(deep=True) / 1e6
+        tokens_mb = tokens.memory_usage(deep=True).sum() / 1e6
+        print("genes\tfull_read_s\tGOs_read_s\tOGs_gz_split_s\ttokens_s\tfull_MB\tGOs_column_MB\tGOs_tokens_MB")
+        print("%d\t%.2f\t%.2f\t%.2f\t%.2f\t%.0f\t%.0f\t%.0f" % (n_genes, full_time, GOs_time, OGs_time, tokens_time, full_mb, GOs_mb, tokens_mb))
+
+
+def bench_lost_genes(sizes=(20_000, 80_000, 200_000), n_species=20, rows_per_species=20_000):
+    """
+    Old vs set-based check_lost_genes() on human proteome sized ID sets, and the per species coverage report
+    """
+    print("uniprots\tlegacy_s\tsets_s")
+    for n_uniprots in sizes:
+        lookup, uniprots = synthetic_lookup(n_uniprots)
+        rng = np.random.default_rng(1)
+        lookup.loc[rng.random(len(lookup)) < 0.05, "ENSEMBL_ID"] = np.nan
+        lookup.loc[rng.random(len(lookup)) < 0.05, "HGNC"] = np.nan
+        genes = " ".join(uniprots)
+
+        _, old_time = timed(legacy_check_lost_genes, genes, lookup)
+        _, new_time = timed(phylome.check_lost_genes, set(uniprots), lookup)
+        print("%d\t%.2f\t%.2f" % (n_uniprots, old_time, new_time))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for species in range(n_species):
+            write_phylome_file(synthetic_orthotable(rows_per_species, uniprots, seed=species, taxID=1000 + species), os.path.join(tmp, "%d_orthologs.tsv" % (1000 + species)))
+        report, report_time = timed(phylome.translation_coverage, tmp + "/", lookup)
+        print("species\trows\tcoverage_s\tmean_coverage")
+        print("%d\t%d\t%.2f\t%.3f" % (n_species, n_species * rows_per_species, report_time, report["coverage"].mean()))
+        utils.clear_orthology_tables()
+
+
+def bench_human_genes(n_species=(5, 20, 60), rows_per_species=20_000, n_uniprots=20_000, batch_size=5_000):
+    """
+    Growing string vs ID set of human_genes(), and one Uniprot request with all IDs vs batches retried one by one, against a local mock server
+    """
+    lookup, uniprots = synthetic_lookup(n_uniprots)
+    print("species\tlegacy_s\tset_s\tlegacy_peak_MB\tset_peak_MB\tids")
+    with tempfile.TemporaryDirectory() as tmp:
+        written = 0
+        for species in n_species:
+            for i in range(written, species):
+                write_phylome_file(synthetic_orthotable(rows_per_species, uniprots, seed=i, taxID=1000 + i), os.path.join(tmp, "%d_orthologs.tsv" % (1000 + i)))
+            written = species
+            # both start from a cold memo, human_genes() reads its two columns without it and the legacy reader parses every table whole
+            utils.clear_orthology_tables()
+            new, new_time, new_peak = traced(utils.human_genes, tmp + "/")
+            utils.clear_orthology_tables()
+            _, old_time, old_peak = traced(legacy_human_genes_string, tmp + "/")
+            print("%d\t%.2f\t%.2f\t%.0f\t%.0f\t%d" % (species, old_time, new_time, old_peak, new_peak, len(new)))
+        utils.clear_orthology_tables()
+
+    server, url = mock_uniprot_server()
+
+    print("request\tseconds\tlargest_body_KB\tfailed_requests\trows")
+    for name, size in [("single", len(new)), ("batches", batch_size)]:
+        MockUniprotHandler.seen, MockUniprotHandler.largest_body, MockUniprotHandler.failures = set(), 0, 0
+        table, seconds = timed(utils.uniprot_requests, new, "ID", "ENSEMBL_ID", ["UniProtKB", "ENSEMBL_ID"], batch_size=size, url=url, backoff=0.01)
+        print("%s\t%.2f\t%.0f\t%d\t%d" % (name, seconds, MockUniprotHandler.largest_body / 1e3, MockUniprotHandler.failures, len(table)))
+    server.shutdown()
+
+
+def bench_idmapping_store(n_uniprots=80_000, n_other=500_000, rows=50_000):
+    """
+    Building the offline ID-mapping store once and making lookups from it, alone and behind the lookup cache
+    """
+    lookup, uniprots = synthetic_lookup(n_uniprots)
+    with tempfile.TemporaryDirectory() as tmp:
+        idmapping = os.path.join(tmp, "idmapping_selected.tab.gz")
+        hgnc = os.path.join(tmp, "hgnc_complete_set.txt")
+        store = os.path.join(tmp, "idmapping.sqlite")
+        write_idmapping_files(idmapping, hgnc, lookup, n_other)
+        write_phylome_file(synthetic_orthotable(rows, uniprots), os.path.join(tmp, "7227_orthologs.tsv"))
+
+        _, build_time = timed(idmapping_store.build_store, idmapping, hgnc, store)
+        genes = utils.human_genes(os.path.join(tmp, "7227_orthologs.tsv"))
+        _, resolve_time = timed(idmapping_store.resolve, store, genes)
+        resolver = idmapping_store.store_resolver(store)
+        _, cold_time = timed(phylome.make_lookup, os.path.join(tmp, "7227_orthologs.tsv"), cache_dir=os.path.join(tmp, "cache"), resolver=resolver)
+        _, warm_time = timed(phylome.make_lookup, os.path.join(tmp, "7227_orthologs.tsv"), cache_dir=os.path.join(tmp, "cache"), resolver=resolver)
+        utils.clear_orthology_tables()
+        print("uniprot_entries\tbuild_s\tstore_MB\tids\tresolve_s\tcache_cold_s\tcache_warm_s")
+        print("%d\t%.2f\t%.1f\t%d\t%.2f\t%.2f\t%.2f" % (n_uniprots + n_other, build_time, os.path.getsize(store) / 1e6, len(genes), resolve_time, cold_time, warm_time))
+
+
+def bench_interning(n_species=20, rows_per_species=100_000, n_query=2_000):
+    """
+    String vs int32 coded IDs on a full phylome directory: inverted index size of one table, and time and peak memory
+    of phylome.find_query_orthologs() over every species
+    """
+    orthotable, genIDs = synthetic_translated_table(rows_per_species)
+    old_index = legacy_ensembl_index(orthotable)
+    new_index = utils.ensembl_index(orthotable)
+    print("index_rows\tstring_MB\tcodes_MB")
+    print("%d\t%.1f\t%.1f" % (len(new_index), old_index.memory_usage(deep=True).sum() / 1e6, new_index.memory_usage(deep=True).sum() / 1e6))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, "translated") + "/"
+        os.makedirs(directory)
+        for species in range(n_species):
+            table, _ = synthetic_translated_table(rows_per_species, seed=species)
+            table.to_csv(directory + "%d_translated.tsv" % (1000 + species), sep="\t", index=False)
+        query_path = os.path.join(tmp, "query.csv")
+        pd.DataFrame({"genes": np.random.default_rng(1).choice(genIDs, n_query, replace=False)}).to_csv(query_path, index=False)
+
+        _, old_time, old_peak = traced(legacy_find_query_orthologs, query_path, directory)
+        _, new_time, new_peak = traced(phylome.find_query_orthologs, query_path, directory)
+        print("species\trows\tlegacy_s\tinterned_s\tlegacy_peak_MB\tinterned_peak_MB\tlast_table_IDs")
+        print("%d\t%d\t%.2f\t%.2f\t%.0f\t%.0f\t%d" % (n_species, n_species * rows_per_species, old_time, new_time, old_peak, new_peak, interning.size()))
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, file)) for file in os.listdir(directory)) / 1e6
+
+
+def bench_columnar(n_species=20, rows_per_species=100_000, n_query=2_000):
+    """
+    TSV vs Parquet translated tables: size on disk, time to read them back (phylome.read_translated_tables()) and time to annotate them
+    with a new query (phylome.find_query_orthologs(), the --input_translated re-run)
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        directories = {}
+        for format in columnar.FORMATS:
+            directories[format] = os.path.join(tmp, format) + "/"
+            os.makedirs(directories[format])
+        for species in range(n_species):
+            table, genIDs = synthetic_translated_table(rows_per_species, seed=species)
+            for format, directory in directories.items():
+                columnar.write_table(table, directory + "%d_translated%s" % (1000 + species, columnar.extension(format)))
+        query_path = os.path.join(tmp, "query.csv")
+        pd.DataFrame({"genes": np.random.default_rng(1).choice(genIDs, n_query, replace=False)}).to_csv(query_path, index=False)
+
+        print("format\tMB\tread_s\tannotate_s")
+        for format, directory in directories.items():
+            _, read_time = timed(phylome.read_translated_tables, directory)
+            _, annotate_time = timed(phylome.find_query_orthologs, query_path, directory)
+            print("%s\t%.0f\t%.2f\t%.2f" % (format, directory_size(directory), read_time, annotate_time))
+
+        # Reading alone, lists as they are (what the annotation of Parquet tables reads)
+        _, raw_time = timed(lambda: [columnar.read_table(path, lists=True) for path in phylome.translated_table_paths(directories["parquet"])])
+        print("parquet lists, not joined: %.2f s" % raw_time)
+
+
+BENCHMARKS = {
+    "translate_uniprots": bench_translate_uniprots,
+    "HGNC_requests": bench_HGNC_requests,
+    "read_orthology_table": bench_read_orthology_table,
+    "subset_query_orthologs": bench_subset_query_orthologs,
+    "HGNC_subset_query_orthologs": bench_HGNC_subset_query_orthologs,
+    "position_scaling": bench_position_scaling,
+    "add_queryonly_columns": bench_add_queryonly_columns,
+    "read_eggnog": bench_read_eggnog,
+    "eggnog_index": bench_eggnog_index,
+    "egg_translate_references": bench_egg_translate_references,
+    "emapper_annotation": bench_emapper_annotation,
+    "format_query_targets": bench_format_query_targets,
+    "GOTerms_annotation": bench_GOTerms_annotation,
+    "GO_closure": bench_GO_closure,
+    "read_emapper": bench_read_emapper,
+    "lost_genes": bench_lost_genes,
+    "human_genes": bench_human_genes,
+    "idmapping_store": bench_idmapping_store,
+    "interning": bench_interning,
+    "columnar": bench_columnar,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] if len(sys.argv) > 1 else list(BENCHMARKS)
+    for name in names:
+        print("## " + name)
+        BENCHMARKS[name]()
@@ -0,0 +1,2 @@
+# test_script.py and test_script_cluster_paths.py run the pipelines by hand on the real data, they are not collected
+collect_ignore = ["test_script.py", "test_script_cluster_paths.py"]
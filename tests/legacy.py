@@ -0,0 +1,336 @@
+#####################################
+#### The old (row by row, string based) implementations the current ones replaced.
+#### The tests check that both give the same results and the benchmarks time them
+#####################################
+
+import numpy as np
+import pandas as pd
+from eggfan import utils
+from eggfan import phylome
+
+
+def legacy_translate_uniprots(orthotable, lookup):
+    """
+    Row by row translation as it was done before utils.uniprot_index(), including the dash formatting from translate_orthologies().
+    Duplicated genIDs are removed keeping their order instead of with set(), so both outputs can be compared
+    """
+    orthotable = orthotable.copy()
+    orthotable["ENSEMBL_ID"] = ""
+    ENS_col = orthotable.columns.get_loc("ENSEMBL_ID")
+    ortho_col = orthotable.columns.get_loc("orthologs")
+
+    for row in list(range(len(orthotable.index))):
+        query = orthotable.iat[row, ortho_col]
+        query = query.replace("|", ",")
+        query = query.split(",")
+
+        for uniprotID in query:
+            uniprotID = uniprotID.replace("9606.", "")
+            genIDs = lookup["ENSEMBL_ID"][lookup["UniProtKB"] == uniprotID]
+            genIDs = "|".join(list(dict.fromkeys(genIDs)))
+            orthotable.iat[row, ENS_col] = orthotable.iat[row, ENS_col] + "," + genIDs
+
+    ENS = orthotable["ENSEMBL_ID"].replace("^,", "", regex=True)
+    ENS = ENS.replace(",,", ",-,", regex=True).replace(",,", ",-,", regex=True).replace("^,", "-,", regex=True).replace(",$", ",-", regex=True)
+    orthotable["ENSEMBL_ID"] = ENS
+    return orthotable
+
+
+def legacy_find_position(row, gene, column="ENSEMBL_ID", HGNC=False):
+    """
+    utils.find_position() as it was: position of gene in the comma separated IDs of each row
+    """
+    if HGNC:
+        position = row[column].str.split(",")
+        for i in position.index.values:
+            position[i] = str(list(np.isin(position[i], gene)))
+            position[i] = position[i].split("True")
+    else:
+        position = row[column].str.split(gene)
+
+    position = position.str[0]
+    return position.str.count(",")
+
+
+def legacy_query_position_table(rows, position, gene, HGNC=False):
+    """
+    utils.query_position_table() as it was: the table grows one row at a time. DataFrame.append (removed in pandas 2) concatenated
+    the table with the new row on every call, so each row is added here with the same pd.concat
+    """
+    table = pd.DataFrame({"GenID": [], "HGNC": [], "position_from_0": [], "number_of_IDs": []})
+    HGNC_symbols = rows["GeneName_target"].str.split(",")
+    if not HGNC:
+        ENS_symbols = rows["ENSEMBL_ID"].str.split(",")
+
+    for i in HGNC_symbols.index.values:
+        position_tmp = position[i]
+        HGNC_name = HGNC_symbols[i][position_tmp]
+        if not HGNC:
+            ENS_name = ENS_symbols[i][position_tmp].split("|")
+            ENS_name = "|".join([gene if found else "-" for found in np.isin(ENS_name, gene)])
+        else:
+            ENS_name = ""
+        new = pd.DataFrame({"GenID": [ENS_name], "HGNC": [HGNC_name], "position_from_0": [position_tmp], "number_of_IDs": [len(HGNC_symbols[i])]})
+        table = pd.concat([table, new]) if len(table) > 0 else new  # what table.append(new) did
+
+    table.index = HGNC_symbols.index
+    return table
+
+
+def legacy_subset_query_orthologs_and_position(orthoTable, human_query):
+    """
+    phylome.subset_query_orthologs_and_position() as it was (one substring scan of the table per query gene), with pd.concat instead of DataFrame.append
+    """
+    finalorthotable = [pd.DataFrame(columns=["##Seed_(co-)orthologs", "type", "ENSEMBL_ID", "orthologs", "GeneName_target", "ENSEMBL_query-only", "GeneName_target_query-only"])]
+    query_position = [pd.DataFrame({"GenID": [], "HGNC": [], "position_from_0": [], "number_of_IDs": []})]
+
+    for gene in human_query.iloc[:, 0].unique():
+        condition = orthoTable["ENSEMBL_ID"].str.contains(gene).fillna(False)
+        rows_perGene = orthoTable[["##Seed_(co-)orthologs", "type", "orthologs", "GeneName_target", "ENSEMBL_ID"]][condition]
+        if len(rows_perGene) > 0:
+            finalorthotable.append(rows_perGene)
+            position = rows_perGene["ENSEMBL_ID"].str.split(gene).str[0].str.count(",")
+            query_position.append(legacy_query_position_table(rows_perGene, position, gene))
+
+    finalorthotable = pd.concat(finalorthotable)
+    finalorthotable = finalorthotable[~finalorthotable.index.duplicated(keep="first")]
+    query_position = pd.concat(query_position).rename_axis("idx").sort_values(by=["idx", "position_from_0"])
+    return finalorthotable, query_position
+
+
+def legacy_HGNC_subset_query_orthologs_and_position(orthoTable, human_query):
+    """
+    phylome.HGNC_subset_query_orthologs_and_position() as it was (one regex scan of the table per query symbol), with pd.concat instead of DataFrame.append
+    and the duplicate removal from annotate_orthology_HGNC_method()
+    """
+    finalorthotable = [pd.DataFrame(columns=["##Seed_(co-)orthologs", "type", "GeneName_target", "GeneName_target_query-only"])]
+    query_position = [pd.DataFrame({"HGNC": [], "position_from_0": [], "number_of_IDs": []})]
+
+    for gene in human_query.iloc[:, 0].unique():
+        condition = orthoTable["GeneName_target"].str.contains("(?:^" + gene + "$|^" + gene + ",|," + gene + ",|," + gene + "$)", regex=True).fillna(False)
+        rows_perGene = orthoTable[["##Seed_(co-)orthologs", "type", "GeneName_target"]][condition]
+        if len(rows_perGene) > 0:
+            finalorthotable.append(rows_perGene)
+            position = legacy_find_position(rows_perGene, gene, column="GeneName_target", HGNC=True)
+            query_position.append(legacy_query_position_table(rows_perGene, position, gene, HGNC=True))
+
+    finalorthotable = pd.concat(finalorthotable)
+    finalorthotable = finalorthotable[~finalorthotable.index.duplicated(keep="first")]
+    query_position = pd.concat(query_position).rename_axis("idx").sort_values(by=["idx", "position_from_0"])
+
+    query_position["index"] = query_position.index
+    query_position = query_position.drop_duplicates().drop(columns=["index", "GenID"])
+    return finalorthotable, query_position
+
+
+def collapse_shared_positions(query_position):
+    """
+    The old code gave one row per query gene when several query genes were genIDs of the same Uniprot ID ("A|-" and "-|B"),
+    the new one gives a single row ("A|B"). Collapse the old rows to compare them
+    """
+    def combine(GenIDs):
+        GenIDs = [GenID.split("|") for GenID in GenIDs]
+        return "|".join(next((ID for ID in slot if ID != "-"), "-") for slot in zip(*GenIDs))
+
+    query_position = query_position.reset_index()
+    GenIDs = query_position.groupby(["idx", "position_from_0"])["GenID"].agg(combine)
+    query_position = query_position.drop_duplicates(subset=["idx", "position_from_0"]).drop(columns=["GenID"])
+    query_position = query_position.merge(GenIDs.reset_index(), on=["idx", "position_from_0"])
+    return query_position.set_index("idx")[["GenID", "HGNC", "position_from_0", "number_of_IDs"]]
+
+
+def legacy_add_queryonly_columns(finalorthotable, query_position, HGNC=False):
+    """
+    phylome.add_queryonly_columns() as it was (one filter and reindex of query_position per row), with .loc instead of the chained assignment
+    """
+    columns = [column for column in ["ENSEMBL_query-only", "GeneName_target_query-only"] if column in finalorthotable.columns]
+    finalorthotable = finalorthotable.astype(dict.fromkeys(columns, object))
+    for i in finalorthotable.index.values:
+        rows = query_position[query_position.index == i].set_index("position_from_0")
+        rows = rows.reindex(list(range(int(rows.number_of_IDs.iloc[0]))), fill_value="-")
+        if not HGNC:
+            finalorthotable.loc[i, "ENSEMBL_query-only"] = ",".join(list(rows["GenID"]))
+        finalorthotable.loc[i, "GeneName_target_query-only"] = ",".join(list(rows["HGNC"]))
+    return finalorthotable.drop_duplicates()
+
+
+def legacy_query_table(dataset, match_column, taxID, data_origin):
+    """
+    The old orthogroup.query_table() (one list comprehension per row), collecting rows in a list instead of DataFrame.append.
+    emapper_annotation() no longer needs it, it is kept for legacy_emapper_annotation()
+    """
+    draged_column = [colname for colname in dataset.columns.values if colname != match_column][0]
+    dataset = dataset.copy()
+    dataset[match_column] = dataset[match_column].str.split(",")
+    out = []
+    for i in dataset.index.values:
+        if data_origin == "emapper":
+            matched_element = [element for element in dataset.loc[i, match_column] if taxID in element]
+        elif data_origin == "eggnog":
+            matched_element = [element for element in dataset.loc[i, match_column] if element.startswith(taxID)]
+        if len(matched_element) > 0:
+            out.append({draged_column: dataset.loc[i, draged_column], match_column: ",".join(matched_element)})
+    return pd.DataFrame(out, columns=[draged_column, match_column])
+
+
+def legacy_format_quer_orth(query_orthogroups, ortho_cols):
+    """
+    orthogroup.format_quer_orth() as it was (one copy of the table per orthogroup column), with pd.concat instead of DataFrame.append
+    """
+    out = []
+    for col in ortho_cols:
+        subset = [element for element in query_orthogroups.columns.values if element not in ortho_cols] + [col]
+        new_query_orth = query_orthogroups.loc[:, subset].copy()
+        new_query_orth[col] = new_query_orth[col] + col.replace("Orthogroup", "")
+        new_query_orth.columns = ["Orthogroup" if element == col else element for element in subset]
+        out.append(new_query_orth)
+    return pd.concat(out).reset_index()
+
+
+def legacy_emapper_annotation(emapper, query_orthogroups, keep_all_targets=True):
+    """
+    orthogroup.emapper_annotation() as it was (one substring scan of emapper per tax level), with pd.concat instead of DataFrame.append
+    """
+    match_column = "eggNOG_OGs"
+    ortho_cols = [colname for colname in query_orthogroups.columns.values if colname.startswith("Orthogroup")]
+    emapper = emapper[["#query", "eggNOG_OGs"]].dropna()
+    targets_with_orthogroups = pd.concat([legacy_query_table(emapper, match_column, col.replace("Orthogroup", ""), "emapper") for col in ortho_cols])
+    targets_with_orthogroups[match_column] = targets_with_orthogroups[match_column].str.replace(r"\|.*$", "", regex=True)
+
+    query_orthogroups = legacy_format_quer_orth(query_orthogroups, ortho_cols)
+    query_targets = query_orthogroups.merge(targets_with_orthogroups, how="right", left_on="Orthogroup", right_on=match_column)
+    query_targets = query_targets.drop(columns=[match_column, "index"])
+    if not keep_all_targets:
+        query_targets = query_targets.dropna()
+    return legacy_format_query_targets(query_targets)
+
+
+def legacy_format_query_targets(query_targets):
+    """
+    orthogroup.format_query_targets() as it was (one groupby per column and level, combined with outer merges)
+    """
+    non_query_cols = [colname for colname in query_targets.columns.values if not colname == "#query"]
+    tab_separated = query_targets.groupby(["#query", "Orthogroup"])["Gene stable ID"].apply("|".join).reset_index()
+    for col in ["HGNC symbol", "Protein stable ID"]:
+        tab_separated[col] = query_targets.groupby(["#query", "Orthogroup"])[col].apply("|".join).reset_index().loc[:, col]
+
+    out = tab_separated.groupby(["#query"])[non_query_cols[0]].apply(",".join).reset_index()
+    for col in non_query_cols[1:]:
+        out = tab_separated.groupby(["#query"])[col].apply(",".join).reset_index().merge(out, how="outer", on="#query")
+    return out
+
+
+def legacy_check_lost_genes(genes, lookup):
+    """
+    phylome.check_lost_genes() before the set-based version: np.isin against a list and two outer merges
+    """
+    human_genes = genes.split(" ")
+    translated = list(lookup["UniProtKB"])
+    lost_genes = pd.DataFrame(human_genes)[~np.isin(human_genes, translated)]
+    lost_genes.columns = ["UniProtKB"]
+    no_genID = lookup[lookup["ENSEMBL_ID"].isna()]
+    no_HGNC = lookup[lookup["HGNC"].isna()]
+    lost_genes = lost_genes.merge(no_genID, how="outer", left_on="UniProtKB", right_on="UniProtKB")
+    lost_genes = lost_genes.merge(no_HGNC, how="outer", left_on="UniProtKB", right_on="UniProtKB")
+    lost_genes = lost_genes.astype(object).fillna("")
+    lost_genes["Translation"] = lost_genes.iloc[:, 1] + lost_genes.iloc[:, 3] + lost_genes.iloc[:, 2]
+    lost_genes.drop(columns=["ENSEMBL_ID_x", "HGNC_x", "ENSEMBL_ID_y", "HGNC_y"], inplace=True)
+    return lost_genes
+
+
+def legacy_human_genes_string(path):
+    """
+    utils.human_genes_string() before the ID set: one string grown file by file, without separator between files
+    """
+    genes = ""
+    for fullpath in utils.directory_or_file(path):
+        orthoTable = utils.read_orthology_table(fullpath)["orthologs"]
+        orthoTable = orthoTable.str.replace("9606.", " ", regex=False).str.replace("|", " ", regex=False).str.replace(",", " ", regex=False)
+        genes = genes + orthoTable.str.cat(sep=" ")
+    return " ".join(set(genes.split(" ")))
+
+
+def legacy_explode_positions(column, sep=","):
+    """
+    utils.explode_positions() before interning: the exploded IDs are kept as strings
+    """
+    IDs = column.fillna("").str.split(sep).reset_index(drop=True)
+    number_of_IDs = IDs.str.len()
+    IDs = IDs.explode()
+
+    counts = number_of_IDs.to_numpy()
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    exploded = pd.DataFrame({"row": IDs.index.to_numpy(), "position_from_0": np.arange(len(IDs)) - starts, "ID": IDs.to_numpy()})
+    return exploded, number_of_IDs
+
+
+def legacy_ensembl_index(orthoTable, column="ENSEMBL_ID"):
+    """
+    utils.ensembl_index() before interning: genIDs as strings, exploded twice
+    """
+    index, number_of_IDs = legacy_explode_positions(orthoTable[column], ",")
+
+    genIDs, number_of_genIDs = legacy_explode_positions(index["ID"], "|")
+    index = index.iloc[genIDs["row"].to_numpy()].reset_index(drop=True)
+    index["slot"] = genIDs["position_from_0"].to_numpy()
+    index["GenID"] = genIDs["ID"].to_numpy()
+    index["number_of_IDs"] = number_of_IDs.to_numpy()[index["row"].to_numpy()]
+    return index.drop(columns=["ID"])
+
+
+def legacy_query_matches(index, column, genes):
+    """
+    phylome.query_matches() before interning: IDs mapped to their query position through a string index
+    """
+    query_order = index[column].map(pd.Series(np.arange(len(genes)), index=genes))
+    matches = index[query_order.notna().to_numpy()].drop_duplicates(subset=["row", column])
+    rows = query_order[matches.index].groupby(matches["row"]).min().sort_values(kind="stable")
+    return matches, rows.index.to_numpy()
+
+
+def legacy_string_subset_query_orthologs_and_position(orthoTable, human_query):
+    """
+    phylome.subset_query_orthologs_and_position() before interning, every join on string IDs
+    """
+    columns = ["##Seed_(co-)orthologs", "type", "ENSEMBL_ID", "orthologs", "GeneName_target", "ENSEMBL_query-only", "GeneName_target_query-only"]
+    genes = human_query.iloc[:, 0].unique()
+
+    index = legacy_ensembl_index(orthoTable)
+    matches, rows = legacy_query_matches(index, "GenID", genes)
+    finalorthotable = orthoTable.iloc[rows].reindex(columns=columns)
+
+    matched_positions = pd.MultiIndex.from_frame(index[["row", "position_from_0"]]).isin(pd.MultiIndex.from_frame(matches[["row", "position_from_0"]]))
+    positions = index[matched_positions]
+    positions = positions.assign(GenID=positions["GenID"].where(positions.index.isin(matches.index), "-"))
+
+    first = positions[["row", "position_from_0"]].ne(positions[["row", "position_from_0"]].shift()).any(axis=1).to_numpy()
+    query_position = positions.loc[first, ["row", "position_from_0"]].reset_index(drop=True)
+    query_position["GenID"] = utils.join_exploded(positions["GenID"], np.diff(np.append(np.flatnonzero(first), len(positions))), "|")
+    HGNC_symbols, number_of_IDs = legacy_explode_positions(orthoTable["GeneName_target"])
+    HGNC_symbols = HGNC_symbols.rename(columns={"ID": "HGNC"})
+    query_position = query_position.merge(HGNC_symbols, how="left", on=["row", "position_from_0"])
+    query_position["number_of_IDs"] = number_of_IDs.to_numpy()[query_position["row"].to_numpy()]
+
+    query_position.index = orthoTable.index[query_position["row"].to_numpy()]
+    query_position = query_position[["GenID", "HGNC", "position_from_0", "number_of_IDs"]]
+    query_position = query_position.rename_axis("idx").sort_values(by=["idx", "position_from_0"])
+    return finalorthotable, query_position
+
+
+def legacy_find_query_orthologs(query_path, directory):
+    """
+    phylome.find_query_orthologs() with one process and the string based subset
+    """
+    human_query = pd.read_csv(query_path)
+    tables = []
+    for path in phylome.translated_table_paths(directory):
+        finalorthotable, query_position = legacy_string_subset_query_orthologs_and_position(pd.read_csv(path, sep="\t"), human_query)
+        tables.append(phylome.add_queryonly_columns(finalorthotable, query_position))
+    return tables
+
+
+def assert_same_table(old, new):
+    """
+    Same values, index and columns, regardless of dtypes (old tables were built from empty float columns)
+    """
+    pd.testing.assert_frame_equal(old, new, check_dtype=False, check_index_type=False, check_column_type=False, check_categorical=False)
@@ -0,0 +1,269 @@
+#####################################
+#### Synthetic phylome, eggNOG, emapper, GO and ID-mapping data, and mock web services,
+#### shared by the tests and the benchmarks
+#####################################
+
+import json
+import gzip
+import time
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+from eggfan import utils
+
+
+def synthetic_lookup(n_uniprots, seed=0):
+    """
+    Lookup with columns UniProtKB, ENSEMBL_ID and HGNC. Roughly 10% of the Uniprot IDs are not translated
+    and 10% have two ENSEMBL genIDs
+    """
+    rng = np.random.default_rng(seed)
+    uniprots = np.array(["UP%06d_HUMAN" % i for i in range(n_uniprots)])
+    translated = uniprots[rng.random(n_uniprots) > 0.1]
+    double = translated[rng.random(len(translated)) < 0.1]
+
+    lookup = pd.DataFrame(
+        {
+            "UniProtKB": np.concatenate([translated, double]),
+            "ENSEMBL_ID": ["ENSG%011d" % i for i in range(len(translated) + len(double))],
+        }
+    )
+    lookup["HGNC"] = "SYMB" + lookup["ENSEMBL_ID"].str[-6:]
+    return lookup, uniprots
+
+
+def synthetic_orthotable(n_rows, uniprots, seed=0, taxID=7227):
+    """
+    Orthology table of seed species taxID with 1 to 4 human orthologs per row, separated by "," or "|"
+    """
+    rng = np.random.default_rng(seed)
+    orthologs = []
+    for n in rng.integers(1, 5, n_rows):
+        ids = ["9606." + up for up in rng.choice(uniprots, n)]
+        sep = "|" if rng.random() < 0.2 else ","
+        orthologs.append(sep.join(ids))
+
+    orthotable = pd.DataFrame(
+        {
+            "##Seed_(co-)orthologs": ["%d.P%07d" % (taxID, i) for i in range(n_rows)],
+            "type": rng.choice(["one-to-one", "one-to-many", "many-to-many"], n_rows),
+            "orthologs": orthologs,
+            "target_species": "Homo sapiens",
+        }
+    )
+    orthotable["GeneName_target"] = orthotable["orthologs"].str.replace("|", ",", regex=False)
+    return orthotable
+
+
+def write_phylome_file(orthotable, path):
+    """
+    Saves an orthology table like the phylome does: header, 12 lines of metadata and the table
+    """
+    with open(path, "w") as f:
+        f.write("\t".join(orthotable.columns) + "\n")
+        for i in range(12):
+            f.write("# metadata line %d\n" % i)
+        orthotable.to_csv(f, sep="\t", index=False, header=False)
+
+
+def synthetic_translated_table(n_rows, n_uniprots=20_000, seed=0):
+    """
+    Translated orthology table as made by phylome.translate_orthologies(), and the ENSEMBL genIDs in it
+    """
+    lookup, uniprots = synthetic_lookup(n_uniprots, seed)
+    orthotable = synthetic_orthotable(n_rows, uniprots, seed)
+    orthotable["GeneName_target"] = orthotable["GeneName_target"].str.replace("9606.", "", regex=False).str.replace("_HUMAN", "", regex=False)
+    orthotable = utils.translate_uniprots(orthotable, lookup)
+    return orthotable, lookup["ENSEMBL_ID"].to_numpy()
+
+
+def synthetic_position_rows(n_rows, gene="ENSG_QUERY", seed=0):
+    """
+    Rows of a translated orthology table that all contain gene, at a random position, and where gene is in utils.find_position() format
+    """
+    rng = np.random.default_rng(seed)
+    positions = rng.integers(0, 4, n_rows)
+    ENSEMBL_ID = [",".join(gene + "|ENSG_OTHER" if i == pos else "ENSG%d" % i for i in range(4)) for pos in positions]
+    rows = pd.DataFrame({
+        "##Seed_(co-)orthologs": ["seed%d" % i for i in range(n_rows)],
+        "type": "one-to-many",
+        "orthologs": "UP1,UP2,UP3,UP4",
+        "GeneName_target": "A,B,C,D",
+        "ENSEMBL_ID": ENSEMBL_ID,
+    })
+    return rows, pd.Series(positions, index=rows.index)
+
+
+def write_members_file(path, n_groups, members_per_group=30, n_species=200, seed=0, level=33208):
+    """
+    Compressed eggNOG members file of taxonomic level with n_groups orthogroups. Species are drawn at random, so human (9606) is in about 14% of them
+    """
+    rng = np.random.default_rng(seed)
+    with gzip.open(path, "wt") as file:
+        for group in range(n_groups):
+            species = np.sort(rng.choice(n_species, members_per_group, replace=False)) + 9600
+            proteins = ",".join("%d.ENSP%09d" % (taxid, group * members_per_group + i) for i, taxid in enumerate(species))
+            file.write("%d\tOG%d\t%d\t%d\t%s\t%s\n" % (level, group, members_per_group, members_per_group, proteins, ",".join(map(str, species))))
+
+
+def synthetic_emapper(n_proteins, n_genes=2_000, levels=("1|root", "2759|Eukaryota", "33208|Metazoa", "33213|Bilateria"), n_orthogroups=5_000, seed=0):
+    """
+    emapper output ("#query" and "eggNOG_OGs" with one orthogroup per level) and a query_orthogroups table as made by merge_with_query() sharing those orthogroups
+    """
+    rng = np.random.default_rng(seed)
+    emapper = pd.DataFrame({
+        "#query": ["Capte%d" % i for i in range(n_proteins)],
+        "eggNOG_OGs": [",".join("OG%d@%s" % (og, level) for og, level in zip(ogs, levels)) for ogs in rng.integers(0, n_orthogroups, (n_proteins, len(levels)))],
+    })
+    query_orthogroups = pd.DataFrame({
+        "Protein stable ID": ["ENSP%d" % i for i in range(n_genes)],
+        "HGNC symbol": ["GENE%d" % i for i in range(n_genes)],
+        "Gene stable ID": ["ENSG%d" % i for i in range(n_genes)],
+    })
+    for level in levels[2:]:
+        query_orthogroups["Orthogroup@" + level.split("|")[0]] = ["OG%d" % og for og in rng.integers(0, n_orthogroups, n_genes)]
+    return emapper, query_orthogroups
+
+
+def write_emapper_file(path, n_genes, n_terms=5_000, terms_per_gene=30, seed=0):
+    """
+    emapper annotations file (4 header lines, "#query" and "GOs" columns and 3 statistics lines at the end) with GO:Terms drawn from n_terms
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as file:
+        file.write("## emapper\n## header\n## lines\n##\n#query\tGOs\n")
+        for gene in range(n_genes):
+            terms = rng.choice(n_terms, terms_per_gene, replace=False)
+            file.write("Capte%d\t%s\n" % (gene, ",".join("GO:%07d" % term for term in terms)))
+        file.write("## stats\n## stats\n## stats\n")
+
+
+EMAPPER_COLUMNS = ["#query", "seed_ortholog", "evalue", "score", "eggNOG_OGs", "max_annot_lvl", "COG_category", "Description", "Preferred_name", "GOs",
+                   "EC", "KEGG_ko", "KEGG_Pathway", "KEGG_Module", "KEGG_Reaction", "KEGG_rclass", "BRITE", "KEGG_TC", "CAZy", "BiGG_Reaction", "PFAMs"]
+
+
+def write_wide_emapper_file(path, n_genes, n_terms=5_000, terms_per_gene=30, seed=0):
+    """
+    emapper 2.1 annotations file with all its 21 columns (4 comment lines at the top and 3 statistics lines at the end), compressed if path ends with .gz
+    """
+    rng = np.random.default_rng(seed)
+    with (gzip.open(path, "wt") if path.endswith(".gz") else open(path, "w")) as file:
+        file.write("## emapper-2.1.12\n## command\n## time\n##\n" + "\t".join(EMAPPER_COLUMNS) + "\n")
+        for gene in range(n_genes):
+            terms = ",".join("GO:%07d" % term for term in rng.choice(n_terms, terms_per_gene, replace=False))
+            ogs = ",".join("OG%d@%s" % (og, level) for og, level in zip(rng.integers(0, 5_000, 3), ("1|root", "2759|Eukaryota", "33208|Metazoa")))
+            file.write("Capte%d\t%d.ENSP%d\t1e-50\t300.0\t%s\tMetazoa\tK\tTranscription factor of the family %d\tGENE%d\t%s\t-\tko:K%05d\tmap%05d\t-\t-\t-\tko00000\t-\t-\t-\tPF%05d\n"
+                       % (gene, 9606, gene, ogs, gene % 50, gene, terms, gene % 9000, gene % 300, gene % 5000))
+        file.write("## %d queries scanned\n## Total time (seconds): 1.0\n## Rate: 1.0 q/s\n" % n_genes)
+
+
+def write_obo_file(path, n_terms=45_000, seed=0):
+    """
+    OBO file with a random GO-like DAG: a tree where every term hangs from (term - 1) // 4 by is_a,
+    and 30% of the terms have a second parent (the neighbour of the first one) by part_of
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as file:
+        file.write("format-version: 1.2\n")
+        for term in range(n_terms):
+            file.write("\n[Term]\nid: GO:%07d\nname: term %d\n" % (term, term))
+            if term > 0:
+                file.write("is_a: GO:%07d ! parent\n" % ((term - 1) // 4))
+                if (term - 1) // 4 > 0 and rng.random() < 0.3:
+                    file.write("relationship: part_of GO:%07d ! parent\n" % ((term - 1) // 4 - 1))
+
+
+def write_idmapping_files(idmapping, hgnc, lookup, n_other=500_000, seed=0):
+    """
+    UniProt idmapping_selected.tab.gz and HGNC hgnc_complete_set.txt with the translations of lookup (as made by synthetic_lookup()),
+    plus n_other entries of other species. Accessions with one genID are also listed in HGNC's uniprot_ids
+    """
+    rng = np.random.default_rng(seed)
+    genIDs = lookup.groupby("UniProtKB", sort=False)["ENSEMBL_ID"].agg("; ".join)
+    accession = {uniprot: "A%06d" % i for i, uniprot in enumerate(genIDs.index)}
+    empty = "\t".join([""] * 5)
+    with gzip.open(idmapping, "wt") as file:
+        for uniprot, genID in genIDs.items():
+            file.write("%s\t%s\t\t\t\t\t\t\t\t\t\t\t9606\t%s\t%s\t\t\t\n" % (accession[uniprot], uniprot, empty, genID))
+        for i in range(n_other):
+            file.write("B%06d\tX%06d_MOUSE\t\t\t\t\t\t\t\t\t\t\t10090\t%s\tENSMUSG%011d\t\t\t\n" % (i, i, empty, i))
+
+    single = set(genIDs.index[~genIDs.str.contains(";")])
+    with open(hgnc, "w") as file:
+        file.write("hgnc_id\tsymbol\tname\tensembl_gene_id\tuniprot_ids\n")
+        for row in lookup.itertuples(index=False):
+            uniprot_ids = '"%s"' % accession[row.UniProtKB] if row.UniProtKB in single and rng.random() < 0.5 else accession[row.UniProtKB] if row.UniProtKB in single else ""
+            file.write("HGNC:%s\t%s\tname\t%s\t%s\n" % (row.ENSEMBL_ID[-6:], row.HGNC, row.ENSEMBL_ID, uniprot_ids))
+
+
+class MockHGNCHandler(BaseHTTPRequestHandler):
+    """
+    Answers /fetch/symbol/<symbol> like rest.genenames.org, after a fixed latency
+    """
+
+    latency = 0.01
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        symbol = self.path.rsplit("/", 1)[-1]
+        body = json.dumps({"response": {"docs": [{"ensembl_gene_id": "ENSG_" + symbol}]}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def mock_hgnc_server():
+    """
+    Starts a mock HGNC REST API in a background thread. Returns the server (call shutdown() to stop it) and its uri
+    """
+    MockHGNCHandler.protocol_version = "HTTP/1.1"  # keep-alive, so connections can be reused
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHGNCHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_port
+
+
+class MockUniprotHandler(BaseHTTPRequestHandler):
+    """
+    Answers POSTs like Uniprot's ID mapping service ("From\tTo" table). The first time each body is seen it answers 503, as an overloaded server would
+    """
+
+    seen = set()
+    largest_body = 0
+    failures = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        MockUniprotHandler.largest_body = max(MockUniprotHandler.largest_body, len(body))
+        if body not in MockUniprotHandler.seen:
+            MockUniprotHandler.seen.add(body)
+            MockUniprotHandler.failures += 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        genes = urllib.parse.parse_qs(body.decode())["query"][0].split(" ")
+        answer = ("From\tTo\n" + "".join("%s\tENSG_%s\n" % (gene, gene) for gene in genes)).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(answer)))
+        self.end_headers()
+        self.wfile.write(answer)
+
+    def log_message(self, *args):
+        pass
+
+
+def mock_uniprot_server():
+    """
+    Starts a mock Uniprot ID mapping service in a background thread. Returns the server (call shutdown() to stop it) and its url
+    """
+    MockUniprotHandler.seen, MockUniprotHandler.largest_body, MockUniprotHandler.failures = set(), 0, 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockUniprotHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d/" % server.server_port
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pandas as pd
+from eggfan import utils
+from eggfan import phylome
+from eggfan import columnar
+import synthetic
+import legacy
+
+
+def test_parquet_round_trip(tmp_path):
+    table, _ = synthetic.synthetic_translated_table(500, n_uniprots=500)
+    path = str(tmp_path / "7227_translated.parquet")
+    columnar.write_table(table, path)
+    legacy.assert_same_table(table.astype(str), columnar.read_table(path).astype(str))
+    lists = columnar.read_table(path, lists=True)
+    legacy.assert_same_table(table.astype(str), columnar.join_columns(lists).astype(str))
+
+
+def test_parquet_and_tsv_annotate_the_same(tmp_path):
+    directories = {format: str(tmp_path / format) + "/" for format in columnar.FORMATS}
+    for directory in directories.values():
+        os.makedirs(directory)
+    for species in range(3):
+        table, genIDs = synthetic.synthetic_translated_table(1_000, n_uniprots=1_000, seed=species)
+        for format, directory in directories.items():
+            columnar.write_table(table, directory + "%d_translated%s" % (1000 + species, columnar.extension(format)))
+    query_path = str(tmp_path / "query.csv")
+    pd.DataFrame({"genes": np.random.default_rng(1).choice(genIDs, 200, replace=False)}).to_csv(query_path, index=False)
+
+    annotated = {}
+    for format, directory in directories.items():
+        species = [os.path.splitext(os.path.basename(path))[0] for path in phylome.translated_table_paths(directory)]
+        annotated[format] = dict(zip(species, phylome.find_query_orthologs(query_path, directory)))
+    assert len(annotated["tsv"]) == len(annotated["parquet"]) == 3
+    for species, table in annotated["parquet"].items():
+        legacy.assert_same_table(annotated["tsv"][species].astype(str), table.astype(str))
+
+
+def test_tsv_and_parquet_lookups_translate_the_same(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(1_000)
+    lookup.loc[::7, "HGNC"] = np.nan
+    lookup.loc[::11, "ENSEMBL_ID"] = np.nan
+    lookup.loc[1, "HGNC"] = "NA"
+    orthologs = str(tmp_path / "7227_orthologs.tsv")
+    synthetic.write_phylome_file(synthetic.synthetic_orthotable(1_000, uniprots), orthologs)
+
+    translated = {}
+    try:
+        translated["memory"] = phylome.translate_orthologies(orthologs, lookup)[0]
+        for format in columnar.FORMATS:
+            path = str(tmp_path / ("lookup" + columnar.extension(format)))
+            phylome.write_lookup(lookup, path)
+            reloaded = phylome.read_lookup(path)
+            assert reloaded.columns.tolist() == lookup.columns.tolist()
+            translated[format] = phylome.translate_orthologies(orthologs, reloaded)[0]
+    finally:
+        utils.clear_orthology_tables()
+    legacy.assert_same_table(translated["memory"], translated["tsv"])
+    legacy.assert_same_table(translated["memory"], translated["parquet"])
+
+    # lookups saved with their index by older versions
+    lookup.to_csv(str(tmp_path / "old_lookup.tsv"), sep="\t")
+    assert phylome.read_lookup(str(tmp_path / "old_lookup.tsv")).columns.tolist() == lookup.columns.tolist()
@@ -0,0 +1,44 @@
+import os
+from eggfan import orthogroup
+from eggfan import eggnog_index
+import synthetic
+import legacy
+
+
+def test_index_holds_the_human_members(tmp_path):
+    path = str(tmp_path / "33208_members.tsv.gz")
+    index = str(tmp_path / "index")
+    synthetic.write_members_file(path, 2_000)
+    eggnog_index.build_index([path], index)
+    assert not eggnog_index.stale_sources(index, [path])
+
+    parsed = orthogroup.read_eggnog([path]).sort_values("Orthogroup").reset_index(drop=True)
+    parsed["Protein stable ID"] = [",".join(p for p in proteins.split(",") if p.startswith("9606.")) for proteins in parsed["Protein stable ID"]]
+    indexed = eggnog_index.read_index(index).sort_values("Orthogroup").reset_index(drop=True)
+    columns = ["Orthogroup", "Protein stable ID"]
+    legacy.assert_same_table(parsed[columns].astype(str), indexed[columns].astype(str))
+
+
+def test_index_keeps_the_order_of_its_files(tmp_path):
+    paths = [str(tmp_path / "33213_members.tsv.gz"), str(tmp_path / "33208_members.tsv.gz")]
+    index = str(tmp_path / "index")
+    synthetic.write_members_file(paths[0], 500, level=33213)
+    synthetic.write_members_file(paths[1], 500, seed=1, level=33208)
+    eggnog_index.build_index(paths, index)
+
+    parsed = orthogroup.read_eggnog(paths)
+    indexed = eggnog_index.read_index(index)
+    assert [level["X"].iat[0] for level in indexed] == [level["X"].iat[0] for level in parsed] == [33213, 33208]
+    for parsed_level, indexed_level in zip(parsed, indexed):
+        assert sorted(parsed_level["Orthogroup"]) == sorted(indexed_level["Orthogroup"])
+
+
+def test_deleted_source_makes_the_index_stale(tmp_path):
+    path = str(tmp_path / "33208_members.tsv.gz")
+    index = str(tmp_path / "index")
+    synthetic.write_members_file(path, 200)
+    eggnog_index.build_index([path], index)
+    assert not eggnog_index.stale_sources(index)
+
+    os.remove(path)
+    assert eggnog_index.stale_sources(index) == [path + " no longer exists, the index can't be checked against it"]
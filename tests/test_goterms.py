@@ -0,0 +1,58 @@
+import pandas as pd
+from eggfan import goterms
+from eggfan import godag
+from eggfan import emapper_reader
+import synthetic
+
+
+def test_GOTerms_annotation_matches_whole_terms(tmp_path):
+    path = str(tmp_path / "emapper.annotations")
+    synthetic.write_emapper_file(path, 500, n_terms=200, terms_per_gene=10)
+    modules = ["GO:%07d" % term for term in range(12)]
+
+    emapper = pd.read_csv(path, skiprows=4, sep="\t").dropna()
+    terms = emapper.set_index("#query")["GOs"].str.split(",").explode()
+    expected = {(gene, term) for gene, term in terms.items() if term in modules}  # substring matching also took GO:0000010 for GO:0000001
+
+    annotation = goterms.GOTerms_annotation(path, modules)
+    assert set(zip(annotation["#query"], annotation["GOterm"])) == expected
+    matrix = goterms.GOTerms_matrix(path, modules)
+    assert int(matrix.sparse.to_dense().to_numpy().sum()) == len(expected)
+
+
+def test_subtree_contains_every_child(tmp_path):
+    obo = str(tmp_path / "go-basic.obo")
+    synthetic.write_obo_file(obo, 2_000)
+    closure = godag.load_closure(obo)
+    cached = godag.load_closure(obo)
+    assert (closure["indices"] == cached["indices"]).all()
+
+    terms, parents, _ = godag.parse_obo(obo)
+    subtree = set(godag.expand_terms(["GO:0000001"], closure)[0])
+    assert "GO:0000001" in subtree
+    assert all(term in subtree for term in terms if "GO:0000001" in parents[term])
+
+
+def test_read_emapper_reads_the_used_columns(tmp_path):
+    plain = str(tmp_path / "emapper.annotations")
+    synthetic.write_wide_emapper_file(plain, 300)
+    synthetic.write_wide_emapper_file(plain + ".gz", 300)
+
+    full = pd.read_csv(plain, skiprows=4, sep="\t")
+    GOs = emapper_reader.read_emapper(plain, ["GOs"])
+    assert full.dropna(subset=["GOs"])["GOs"].tolist() == GOs["GOs"].tolist()
+    OGs = emapper_reader.read_emapper(plain + ".gz", ["eggNOG_OGs"], split=["eggNOG_OGs"])
+    assert len(OGs) == 300
+
+
+def test_GOTerms_annotation_with_GOs_as_extra_column(tmp_path):
+    path = str(tmp_path / "emapper.annotations")
+    synthetic.write_wide_emapper_file(path, 200, n_terms=50, terms_per_gene=5)
+    emapper = pd.read_csv(path, skiprows=4, sep="\t").dropna(subset=["GOs"])
+    found = emapper["GOs"].str.split(",").apply(lambda terms: "GO:0000007" in terms)
+
+    annotation = goterms.GOTerms_annotation(path, "GO:0000007", extra_columns=["GOs", "eggNOG_OGs"])
+    assert list(annotation.columns) == ["#query", "GOs", "eggNOG_OGs"]
+    assert annotation["#query"].tolist() == emapper.loc[found, "#query"].tolist()
+    assert annotation["GOs"].tolist() == emapper.loc[found, "GOs"].tolist()
+    assert list(emapper_reader.read_emapper(path, ["GOs", "#query", "GOs"]).columns) == ["#query", "GOs"]
@@ -0,0 +1,29 @@
+from eggfan import utils
+from eggfan import phylome
+from eggfan import idmapping_store
+import synthetic
+
+
+def test_store_lookup_same_as_translations(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(2_000)
+    idmapping = str(tmp_path / "idmapping_selected.tab.gz")
+    hgnc = str(tmp_path / "hgnc_complete_set.txt")
+    store = str(tmp_path / "idmapping.sqlite")
+    orthologs = str(tmp_path / "7227_orthologs.tsv")
+    synthetic.write_idmapping_files(idmapping, hgnc, lookup, n_other=1_000)
+    synthetic.write_phylome_file(synthetic.synthetic_orthotable(1_000, uniprots), orthologs)
+    idmapping_store.build_store(idmapping, hgnc, store)
+
+    try:
+        genes = utils.human_genes(orthologs)
+        offline = idmapping_store.resolve(store, genes)
+        expected = lookup[lookup["UniProtKB"].isin(genes)]
+        assert set(map(tuple, offline.to_numpy().tolist())) == set(map(tuple, expected.to_numpy().tolist()))
+        assert len(idmapping_store.resolve(store, {"A%06d" % 0})) > 0  # accessions are resolved too
+
+        resolver = idmapping_store.store_resolver(store)
+        cold = phylome.make_lookup(orthologs, cache_dir=str(tmp_path / "cache"), resolver=resolver)
+        warm = phylome.make_lookup(orthologs, cache_dir=str(tmp_path / "cache"), resolver=resolver)
+    finally:
+        utils.clear_orthology_tables()
+    assert len(cold) == len(warm) == len(offline)
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+import pandas as pd
+from eggfan import utils
+from eggfan import phylome
+from eggfan import interning
+import synthetic
+import legacy
+
+
+def test_ensembl_index_same_as_strings():
+    orthotable, _ = synthetic.synthetic_translated_table(2_000, n_uniprots=1_000)
+    old = legacy.legacy_ensembl_index(orthotable)
+    new = utils.ensembl_index(orthotable)
+    assert old["GenID"].tolist() == interning.ids(new["GenID"]).tolist()
+    assert old.drop(columns=["GenID"]).equals(new.drop(columns=["GenID"]))
+
+
+def test_find_query_orthologs_same_as_strings(tmp_path):
+    directory = str(tmp_path / "translated") + "/"
+    os.makedirs(directory)
+    for species in range(3):
+        table, genIDs = synthetic.synthetic_translated_table(1_000, n_uniprots=1_000, seed=species)
+        table.to_csv(directory + "%d_translated.tsv" % (1000 + species), sep="\t", index=False)
+    query_path = str(tmp_path / "query.csv")
+    pd.DataFrame({"genes": np.random.default_rng(1).choice(genIDs, 200, replace=False)}).to_csv(query_path, index=False)
+
+    old = legacy.legacy_find_query_orthologs(query_path, directory)
+    new = phylome.find_query_orthologs(query_path, directory)
+    assert len(old) == len(new)
+    for old_table, new_table in zip(old, new):
+        legacy.assert_same_table(old_table, new_table)
+
+
+def test_ids_after_new_IDs_and_reset():
+    interning.reset()
+    first = interning.intern(["A", "B", np.nan])
+    assert interning.ids(first, missing="-").tolist() == ["A", "B", "-"]
+    second = interning.intern(["C"])  # one new ID: the cached array must be rebuilt
+    assert interning.ids(np.append(first[:2], second)).tolist() == ["A", "B", "C"]
+    assert pd.isna(interning.ids([-1])[0])  # "-" was not left in the cached array
+
+    interning.reset()
+    assert interning.size() == 0
+    assert interning.codes_of(["A"]).tolist() == [-1]
+    assert interning.ids(interning.intern(["D"])).tolist() == ["D"]
+
+
+def test_dictionary_only_holds_one_table(tmp_path):
+    directory = str(tmp_path / "translated") + "/"
+    os.makedirs(directory)
+    for species in range(3):
+        table, genIDs = synthetic.synthetic_translated_table(500, n_uniprots=1_000, seed=species)
+        table.to_csv(directory + "%d_translated.tsv" % (1000 + species), sep="\t", index=False)
+    query_path = str(tmp_path / "query.csv")
+    pd.DataFrame({"genes": genIDs[:100]}).to_csv(query_path, index=False)
+
+    paths = phylome.translated_table_paths(directory)
+    phylome.find_query_orthologs(query_path, paths)
+    after_all = interning.size()
+    phylome.find_query_orthologs(query_path, paths[-1:])
+    assert interning.size() == after_all
@@ -0,0 +1,65 @@
+from eggfan import utils
+from eggfan import phylome
+from eggfan import lookup_cache
+import synthetic
+
+
+def counting_resolver(lookup, asked):
+    """
+    Resolver answering from lookup that records every set of Uniprot IDs it is asked for
+    """
+    def resolver(genes):
+        asked.append(set(genes))
+        return lookup[lookup["UniProtKB"].isin(genes)].reset_index(drop=True)
+    return resolver
+
+
+def test_cache_only_resolves_new_IDs(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(1_000)
+    small = str(tmp_path / "small" / "7227_orthologs.tsv")
+    large = str(tmp_path / "large" / "7227_orthologs.tsv")
+    (tmp_path / "small").mkdir()
+    (tmp_path / "large").mkdir()
+    synthetic.write_phylome_file(synthetic.synthetic_orthotable(300, uniprots[:500]), small)
+    synthetic.write_phylome_file(synthetic.synthetic_orthotable(600, uniprots), large)
+    cache_dir = str(tmp_path / "cache")
+
+    asked = []
+    resolver = counting_resolver(lookup, asked)
+    small_genes = utils.human_genes(small)
+    large_genes = utils.human_genes(large)
+
+    first = phylome.make_lookup(small, cache_dir=cache_dir, resolver=resolver)
+    second = phylome.make_lookup(large, cache_dir=cache_dir, resolver=resolver)
+    assert asked == [small_genes, large_genes - small_genes]
+
+    expected = lookup[lookup["UniProtKB"].isin(large_genes)]
+    assert set(map(tuple, second.to_numpy().tolist())) == set(map(tuple, expected.to_numpy().tolist()))
+    assert len(first) == lookup["UniProtKB"].isin(small_genes).sum()
+
+    # nothing new: the resolver is not called
+    phylome.make_lookup(large, cache_dir=cache_dir, resolver=resolver)
+    assert len(asked) == 2
+
+
+def test_evict_drops_expired_entries(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(200)
+    orthologs = str(tmp_path / "7227_orthologs.tsv")
+    synthetic.write_phylome_file(synthetic.synthetic_orthotable(100, uniprots), orthologs)
+    cache_dir = str(tmp_path / "cache")
+    genes = utils.human_genes(orthologs)
+
+    connection = lookup_cache.open_cache(cache_dir)
+    try:
+        lookup_cache.write_cache(connection, lookup[lookup["UniProtKB"].isin(genes)], genes, source="test", now=1_000)
+        assert lookup_cache.evict(connection, ttl=500, now=1_400) == 0
+        assert lookup_cache.cached_uniprots(connection) == genes
+        assert lookup_cache.evict(connection, ttl=500, now=1_600) > 0
+        assert lookup_cache.cached_uniprots(connection) == set()
+    finally:
+        connection.close()
+
+    # the expired IDs are resolved again
+    asked = []
+    phylome.make_lookup(orthologs, cache_dir=cache_dir, resolver=counting_resolver(lookup, asked))
+    assert asked == [genes]
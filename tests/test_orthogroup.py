@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+from eggfan import orthogroup
+import synthetic
+import legacy
+
+
+def test_read_eggnog_same_rows_as_whole_read(tmp_path):
+    path = str(tmp_path / "33208_members.tsv.gz")
+    synthetic.write_members_file(path, 2_000)
+    old = pd.read_csv(path, sep="\t", names=orthogroup.EGGNOG_COLUMNS)
+    old = old[old.SpeciesID.str.contains("9606")][orthogroup.EGGNOG_USECOLS].reset_index(drop=True)
+    new = orthogroup.read_eggnog([path], chunksize=500)
+    legacy.assert_same_table(old, new.astype({"Orthogroup": object}))
+
+
+def test_egg_translate_several_references_same_as_one_by_one(tmp_path):
+    path = str(tmp_path / "33208_members.tsv.gz")
+    synthetic.write_members_file(path, 1_000)
+    taxIDs = ["9606", "9610", "9620"]
+    proteins = orthogroup.read_eggnog([path], None)["Protein stable ID"].str.split(",").explode()
+    lookups = {}
+    for taxID in taxIDs:
+        IDs = proteins[proteins.str.startswith(taxID + ".")].str.slice(len(taxID) + 1).unique()
+        lookups[taxID] = pd.DataFrame({"HGNC symbol": IDs, "Gene stable ID": IDs, "Protein stable ID": IDs})
+
+    all_at_once = orthogroup.egg_translate(orthogroup.read_eggnog([path], taxIDs), lookups, taxIDs)
+    for taxID in taxIDs:
+        one = orthogroup.egg_translate(orthogroup.read_eggnog([path], taxID), lookups[taxID], taxID)
+        legacy.assert_same_table(one, all_at_once[taxID])
+
+
+def test_emapper_annotation_matches_legacy_with_one_orthogroup_per_level():
+    # the old code dropped targets without a query orthogroup even with keep_all_targets, compare only the matched ones
+    emapper, query_orthogroups = synthetic.synthetic_emapper(2_000, n_genes=500, n_orthogroups=300)
+    new = orthogroup.emapper_annotation(emapper, query_orthogroups.copy(), False)
+    old = legacy.legacy_emapper_annotation(emapper, query_orthogroups.copy(), False)
+    legacy.assert_same_table(old[new.columns], new)
+
+
+def test_format_query_targets_matches_legacy():
+    rng = np.random.default_rng(0)
+    genes = rng.integers(0, 500, 5_000)
+    query_targets = pd.DataFrame({
+        "Protein stable ID": ["ENSP%d" % gene for gene in genes],
+        "HGNC symbol": ["GENE%d" % gene for gene in genes],
+        "Gene stable ID": ["ENSG%d" % gene for gene in genes],
+        "Orthogroup": ["OG%d@%s" % (og, level) for og, level in zip(rng.integers(0, 200, 5_000), rng.choice(["33208", "33213"], 5_000))],
+        "#query": ["Capte%d" % target for target in rng.integers(0, 500, 5_000)],
+    })
+    new = orthogroup.format_query_targets(query_targets)
+    legacy.assert_same_table(legacy.legacy_format_query_targets(query_targets)[new.columns], new)
+
+    missing = query_targets.head(100).astype(object)
+    missing.loc[missing.index[::3], "HGNC symbol"] = np.nan
+    assert orthogroup.format_query_targets(missing)["HGNC symbol"].str.contains("-", regex=False).any()
+
+
+def test_emapper_annotation_matches_every_orthogroup_of_the_exact_level():
+    # Capte1 shares its second Metazoa orthogroup with GENE1, Capte2 its root orthogroup with GENE2 after an orthogroup of level 10.
+    # The old code kept only the first orthogroup containing the level ("@1" also took "@10") and found neither
+    emapper = pd.DataFrame({
+        "#query": ["Capte1", "Capte2", "Capte3"],
+        "eggNOG_OGs": ["OGX@1|root,OGA@33208|Metazoa,OGB@33208|Metazoa", "OGW@10|Bacteria,OGC@1|root", "OGZ@1|root"],
+    })
+    query_orthogroups = pd.DataFrame({
+        "Protein stable ID": ["ENSP1", "ENSP2"],
+        "HGNC symbol": ["GENE1", "GENE2"],
+        "Gene stable ID": ["ENSG1", "ENSG2"],
+        "Orthogroup@33208": ["OGB", "OGQ"],
+        "Orthogroup@1": ["OGY", "OGC"],
+    })
+
+    matched = orthogroup.emapper_annotation(emapper, query_orthogroups.copy(), False)
+    assert matched.to_dict("list") == {
+        "#query": ["Capte1", "Capte2"],
+        "Orthogroup": ["OGB@33208", "OGC@1"],
+        "Protein stable ID": ["ENSP1", "ENSP2"],
+        "HGNC symbol": ["GENE1", "GENE2"],
+        "Gene stable ID": ["ENSG1", "ENSG2"],
+    }
+    assert len(legacy.legacy_emapper_annotation(emapper, query_orthogroups.copy(), False)) == 0
+
+    everything = orthogroup.emapper_annotation(emapper, query_orthogroups.copy(), True)
+    assert everything["#query"].tolist() == ["Capte1", "Capte2", "Capte3"]
+    assert everything.loc[2].tolist() == ["Capte3", "-", "-", "-", "-"]
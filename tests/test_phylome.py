@@ -0,0 +1,154 @@
+import os
+import numpy as np
+import pandas as pd
+from eggfan import utils
+from eggfan import phylome
+from eggfan import columnar
+import synthetic
+import legacy
+
+
+def query_genes(genIDs, n_query=200):
+    return pd.DataFrame({"genes": np.random.default_rng(1).choice(genIDs, n_query, replace=False)})
+
+
+def test_subset_query_orthologs_matches_legacy():
+    orthotable, genIDs = synthetic.synthetic_translated_table(2_000, n_uniprots=1_000)
+    human_query = query_genes(genIDs)
+    table, query_position = phylome.subset_query_orthologs_and_position(orthotable, human_query)
+    old_table, old_position = legacy.legacy_subset_query_orthologs_and_position(orthotable, human_query)
+    legacy.assert_same_table(old_table, table)
+    legacy.assert_same_table(legacy.collapse_shared_positions(old_position), query_position)
+
+
+def test_HGNC_subset_query_orthologs_matches_legacy():
+    orthotable, _ = synthetic.synthetic_translated_table(2_000, n_uniprots=1_000)
+    symbols = orthotable["GeneName_target"].str.split(",").explode().unique()
+    human_query = query_genes(symbols)
+    table, query_position = phylome.HGNC_subset_query_orthologs_and_position(orthotable, human_query)
+    old_table, old_position = legacy.legacy_HGNC_subset_query_orthologs_and_position(orthotable, human_query)
+    legacy.assert_same_table(old_table, table)
+    legacy.assert_same_table(old_position, query_position)
+
+
+def test_add_queryonly_columns_matches_legacy():
+    orthotable, genIDs = synthetic.synthetic_translated_table(2_000, n_uniprots=1_000)
+    table, query_position = phylome.subset_query_orthologs_and_position(orthotable, query_genes(genIDs))
+    symbols = pd.DataFrame({"genes": query_position["HGNC"].unique()})
+    HGNC_table, HGNC_position = phylome.HGNC_subset_query_orthologs_and_position(orthotable, symbols)
+
+    legacy.assert_same_table(legacy.legacy_add_queryonly_columns(table, query_position), phylome.add_queryonly_columns(table, query_position))
+    legacy.assert_same_table(legacy.legacy_add_queryonly_columns(HGNC_table, HGNC_position, HGNC=True), phylome.add_queryonly_columns(HGNC_table, HGNC_position, HGNC=True))
+
+
+def test_check_lost_genes_same_ids_as_legacy():
+    lookup, uniprots = synthetic.synthetic_lookup(2_000)
+    rng = np.random.default_rng(1)
+    lookup.loc[rng.random(len(lookup)) < 0.05, "ENSEMBL_ID"] = np.nan
+    lookup.loc[rng.random(len(lookup)) < 0.05, "HGNC"] = np.nan
+
+    old = legacy.legacy_check_lost_genes(" ".join(uniprots), lookup)
+    new = phylome.check_lost_genes(set(uniprots), lookup)
+    assert set(old["UniProtKB"]) - {""} == set(new["UniProtKB"])
+
+
+def test_streaming_gives_the_same_tables(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(1_000)
+    phylomes = str(tmp_path / "phylomes") + "/"
+    os.makedirs(phylomes)
+    for species in range(2):
+        synthetic.write_phylome_file(synthetic.synthetic_orthotable(1_000, uniprots, seed=species, taxID=1000 + species), phylomes + "%d_orthologs.tsv" % (1000 + species))
+    query_path = str(tmp_path / "query.csv")
+    query_genes(lookup["ENSEMBL_ID"].to_numpy()).to_csv(query_path, index=False)
+
+    try:
+        assert utils.human_genes(phylomes, chunksize=300) == utils.human_genes(phylomes)
+        assert phylome.translation_coverage(phylomes, lookup, chunksize=300).equals(phylome.translation_coverage(phylomes, lookup))
+    finally:
+        utils.clear_orthology_tables()
+
+    for format in columnar.FORMATS:
+        out, streamed_out = str(tmp_path / format) + "/", str(tmp_path / ("streamed_" + format)) + "/"
+        os.makedirs(out)
+        os.makedirs(streamed_out)
+        phylome.translate_orthologies(phylomes, lookup, out=out, suffix="_translated", format=format)
+        utils.clear_orthology_tables()
+        files = phylome.translate_orthologies(phylomes, lookup, out=streamed_out, chunksize=300, suffix="_translated", format=format)
+        assert sorted(files) == sorted(streamed_out + file for file in os.listdir(streamed_out))
+        for file in files:
+            legacy.assert_same_table(columnar.read_table(out + os.path.basename(file)), columnar.read_table(file))
+
+        annotated = phylome.find_query_orthologs(query_path, files)
+        streamed = phylome.find_query_orthologs(query_path, files, chunksize=300)
+        assert len(annotated) == len(streamed) == 2
+        assert sum(len(table) for table in annotated) > 0
+        for table, streamed_table in zip(annotated, streamed):
+            legacy.assert_same_table(table, streamed_table)
+
+
+def test_jobs_give_the_same_tables(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(1_000)
+    phylomes = str(tmp_path / "phylomes") + "/"
+    os.makedirs(phylomes)
+    for species in range(3):
+        synthetic.write_phylome_file(synthetic.synthetic_orthotable(500, uniprots, seed=species, taxID=1000 + species), phylomes + "%d_orthologs.tsv" % (1000 + species))
+    query_path = str(tmp_path / "query.csv")
+    query_genes(lookup["ENSEMBL_ID"].to_numpy()).to_csv(query_path, index=False)
+
+    try:
+        serial = phylome.translate_orthologies(phylomes, lookup)
+        parallel = phylome.translate_orthologies(phylomes, lookup, jobs=2)
+    finally:
+        utils.clear_orthology_tables()
+    assert len(serial) == len(parallel) == 3
+    for table, parallel_table in zip(serial, parallel):
+        legacy.assert_same_table(table, parallel_table)
+
+    serial = phylome.find_query_orthologs(query_path, serial)
+    parallel = phylome.find_query_orthologs(query_path, parallel, jobs=2)
+    assert len(serial) == len(parallel) == 3
+    for table, parallel_table in zip(serial, parallel):
+        legacy.assert_same_table(table, parallel_table)
+
+
+def test_jobs_keep_going_after_a_corrupt_table(tmp_path, capsys):
+    lookup, uniprots = synthetic.synthetic_lookup(1_000)
+    phylomes, out = str(tmp_path / "phylomes") + "/", str(tmp_path / "translated") + "/"
+    os.makedirs(phylomes)
+    os.makedirs(out)
+    for species in range(2):
+        synthetic.write_phylome_file(synthetic.synthetic_orthotable(500, uniprots, seed=species, taxID=1000 + species), phylomes + "%d_orthologs.tsv" % (1000 + species))
+    with open(phylomes + "1002_orthologs.tsv", "w") as f:
+        f.write("not\ta\tphylome\n")
+    query_path = str(tmp_path / "query.csv")
+    query_genes(lookup["ENSEMBL_ID"].to_numpy()).to_csv(query_path, index=False)
+
+    try:
+        tables = phylome.translate_orthologies(phylomes, lookup, out=out, jobs=2)
+    finally:
+        utils.clear_orthology_tables()
+    assert len(tables) == 2
+    assert sorted(os.listdir(out)) == ["1000_human_orthologs.tsv", "1001_human_orthologs.tsv"]
+    assert "* Error in " + phylomes + "1002_orthologs.tsv" in capsys.readouterr().out
+
+    with open(out + "1002_human_orthologs.tsv", "w") as f:
+        f.write("not\ta\ttranslation\n")
+    annotated = phylome.find_query_orthologs(query_path, out, jobs=2)
+    assert len(annotated) == 2
+    assert "* Error in " + out + "1002_human_orthologs.tsv" in capsys.readouterr().out
+
+
+def test_streaming_and_in_memory_name_files_the_same(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(500)
+    phylomes, streamed_out, out = (str(tmp_path / name) + "/" for name in ["phylomes", "streamed", "in_memory"])
+    for directory in [phylomes, streamed_out, out]:
+        os.makedirs(directory)
+    synthetic.write_phylome_file(synthetic.synthetic_orthotable(200, uniprots, taxID=7227), phylomes + "fly_orthologs.tsv")
+    synthetic.write_phylome_file(synthetic.synthetic_orthotable(200, uniprots, seed=1, taxID=6239), phylomes + "6239_orthologs.tsv")
+
+    try:
+        files = phylome.translate_orthologies(phylomes, lookup, out=streamed_out, chunksize=50, suffix="_translated")
+        phylome.save_annotated(phylome.translate_orthologies(phylomes, lookup), out, suffix="_translated")
+    finally:
+        utils.clear_orthology_tables()
+    assert sorted(os.path.basename(file) for file in files) == sorted(os.listdir(out)) == ["6239_translated.tsv", "7227_translated.tsv"]
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+from eggfan import utils
+import synthetic
+import legacy
+
+
+def test_translate_uniprots_matches_row_by_row():
+    lookup, uniprots = synthetic.synthetic_lookup(500)
+    orthotable = synthetic.synthetic_orthotable(1_000, uniprots)
+    old = legacy.legacy_translate_uniprots(orthotable, lookup)
+    new = utils.translate_uniprots(orthotable.copy(), lookup)
+    assert old["ENSEMBL_ID"].equals(new["ENSEMBL_ID"])
+
+
+def test_HGNC_requests_same_as_serial():
+    server, uri = synthetic.mock_hgnc_server()
+    try:
+        symbols = ["SYMB%d" % i for i in range(40)] + ["SYMB1", "SYMB2"]
+        serial = {gene: utils.HGNC_request(gene, uri=uri) for gene in symbols}
+        concurrent = utils.HGNC_requests(symbols, max_workers=4, rate=None, uri=uri)
+    finally:
+        server.shutdown()
+    assert concurrent == serial
+    assert concurrent["SYMB1"] == serial["SYMB1"]
+
+
+def test_deprecated_position_helpers_match_legacy():
+    rows, position = synthetic.synthetic_position_rows(200)
+    with pytest.warns(DeprecationWarning):
+        found = utils.find_position(rows, "ENSG_QUERY")
+    assert found.tolist() == position.tolist() == legacy.legacy_find_position(rows, "ENSG_QUERY").tolist()
+    with pytest.warns(DeprecationWarning):
+        new = utils.query_position_table(rows, position, "ENSG_QUERY")
+    legacy.assert_same_table(legacy.legacy_query_position_table(rows, position, "ENSG_QUERY"), new)
+
+
+def test_human_genes_same_ids_as_string(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(500)
+    for species in range(3):
+        synthetic.write_phylome_file(synthetic.synthetic_orthotable(300, uniprots, seed=species, taxID=1000 + species), tmp_path / ("%d_orthologs.tsv" % (1000 + species)))
+    try:
+        new = utils.human_genes(str(tmp_path) + "/")
+        assert len(utils._orthology_tables) == 0  # only the columns it needs are read, nothing is memoized
+        old = set(legacy.legacy_human_genes_string(str(tmp_path) + "/").split(" ")) - {""}
+    finally:
+        utils.clear_orthology_tables()
+    assert new == old
+
+
+def test_uniprot_requests_retries_every_batch():
+    server, url = synthetic.mock_uniprot_server()
+    genes = {"UP%06d_HUMAN" % i for i in range(250)}
+    try:
+        table = utils.uniprot_requests(genes, "ID", "ENSEMBL_ID", ["UniProtKB", "ENSEMBL_ID"], batch_size=100, url=url, backoff=0.01)
+    finally:
+        server.shutdown()
+    assert synthetic.MockUniprotHandler.failures == 3  # every batch failed once and was retried
+    assert set(table["UniProtKB"]) == genes
+    assert (table["ENSEMBL_ID"] == "ENSG_" + table["UniProtKB"]).all()
+
+
+def test_read_orthology_table_keeps_only_the_last_tables(tmp_path):
+    lookup, uniprots = synthetic.synthetic_lookup(500)
+    paths = [str(tmp_path / ("%d_orthologs.tsv" % (1000 + species))) for species in range(3)]
+    for species, path in enumerate(paths):
+        synthetic.write_phylome_file(synthetic.synthetic_orthotable(100, uniprots, seed=species), path)
+    try:
+        tables = [utils.read_orthology_table(path) for path in paths]
+        assert len(utils._orthology_tables) == utils.MEMOIZED_ORTHOLOGY_TABLES
+        assert utils.read_orthology_table(paths[-1]) is tables[-1]
+        assert utils.read_orthology_table(paths[0]) is not tables[0]  # dropped, parsed again
+        assert utils.read_orthology_table(paths[0]).equals(tables[0])
+    finally:
+        utils.clear_orthology_tables()
+
+
+def test_lost_genes_keeps_the_untranslated_TFs():
+    orthotable = pd.DataFrame({
+        "GeneName_target": ["TF1", "GENE2", "TF3", "TF1", "TF4"],
+        "orthologs": ["9606.UP1", "9606.UP2", "9606.UP3", "9606.UP1", "9606.UP4"],
+        "ENSEMBL_ID": ["", np.nan, "", "", "ENSG4"],
+    })
+    assert utils.lost_genes(["TF1", "TF3", "TF4"], [orthotable])["Genes"].tolist() == ["TF1", "TF3"]
+    assert utils.lost_genes(None, [orthotable], all_lost_genes=True)["Genes"].tolist() == ["TF1", "GENE2", "TF3"]